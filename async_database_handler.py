@@ -0,0 +1,430 @@
+from urllib.parse import unquote
+from datetime import datetime
+from config import config
+from database_handler import PREPARED_QUERIES, TRANSACTION_POOL_MODE, MAX_URL_LEN, MAX_PAGES_TABLE_ROWS, \
+    MAX_BINARY_TABLE_SIZE, SITE_MAX_PAGES, site_domain, claim_arguments, similar_image_arguments
+
+try:
+    import psycopg
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    psycopg = None
+
+"""
+    asyncio variant of the DatabaseHandler operations of a crawl (claim frontier, add pages, link, store page, image and
+    data, similarity lookup), so the database work of many pages can be in flight at once from one process, e. g.
+
+        await asyncio.gather(*(database_handler.remove_page_from_frontier(page) for page in pages))
+
+    The statements which belong together are sent in psycopg pipeline mode (one round trip instead of one per
+    statement), the queries are the same as the prepared statements of DatabaseHandler and psycopg prepares them on
+    the server after their first run. Connections are in autocommit mode, the writes run in explicit transactions
+
+    The pool has to be opened (await open()) in the event loop which uses it, in every process
+
+    Requires psycopg 3 and psycopg_pool (pip install "psycopg[binary,pool]")
+"""
+
+
+def prepared_query(name):
+    return PREPARED_QUERIES[name][1]
+
+
+class AsyncDatabaseHandler:
+    def __init__(self, minimum_connections, max_connections):
+        self.minimum_connections = minimum_connections
+
+        self.max_connections = max_connections
+
+        self.pool = None
+
+        # Statements are prepared after their first run, unless a transaction-mode pooler is in front of the database
+        self.prepare_threshold = 0
+
+        self.conninfo = None
+
+        if psycopg is None:
+            print("[DATABASE] psycopg 3 is not installed (pip install \"psycopg[binary,pool]\")")
+
+            return
+
+        try:
+            # read connection parameters
+            params = config()
+
+            self.conninfo = psycopg.conninfo.make_conninfo(
+                user=params.get('user'),
+                password=params.get('password'),
+                host=params.get('host'),
+                port=params.get('port'),
+                dbname=params.get('database')
+            )
+
+            if params.get('pool_mode') == TRANSACTION_POOL_MODE:
+                self.prepare_threshold = None
+        except Exception as error:
+            print("[ERROR WHILE READING DATABASE CONFIGURATION]", error)
+
+    async def open(self):
+        self.pool = AsyncConnectionPool(
+            self.conninfo,
+            min_size=self.minimum_connections,
+            max_size=self.max_connections,
+            kwargs={"autocommit": True, "prepare_threshold": self.prepare_threshold},
+            open=False
+        )
+
+        await self.pool.open()
+
+        print('[DATABASE] Async connection pool opened')
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+
+    """
+        Claim a page of the frontier for the worker, see DatabaseHandler.claim_page_from_frontier
+    """
+
+    async def claim_page_from_frontier(self, worker_id, owns_url=None):
+        try:
+            async with self.pool.connection() as connection:
+                async with connection.transaction():
+                    cursor = connection.cursor()
+
+                    await cursor.execute(prepared_query("claim_frontier_candidates"), claim_arguments())
+
+                    candidates = await cursor.fetchall()
+
+                    if not candidates:
+                        return
+
+                    frontier = candidates[0]
+
+                    if owns_url is not None:
+                        for candidate in candidates:
+                            if owns_url(unquote(candidate[1])):
+                                frontier = candidate
+
+                                break
+
+                    # The transaction end releases the locks on the candidates which were not claimed
+                    await cursor.execute(prepared_query("claim_page"), (worker_id, frontier[0]))
+
+            return {
+                'id': frontier[0],
+                'url': unquote(frontier[1]),
+                'html_content': None,
+                'hash_content': None
+            }
+        except Exception as error:
+            print("[ERROR WHILE CLAIMING PAGE FROM FRONTIER]", error)
+
+    """
+        Add the links of a page to the frontier, see DatabaseHandler.add_pages_to_frontier. The urls are looked up and
+        inserted in pipelines and the links are inserted with one executemany, all in one transaction
+    """
+
+    async def add_pages_to_frontier(self, pages_to_add):
+        # avoid spider traps - if page's URL is longer than limit, do not add it to frontier
+        pages = [page for page in pages_to_add if len(page["to"]) <= MAX_URL_LEN]
+
+        try:
+            async with self.pool.connection() as connection:
+                cursor = connection.cursor()
+
+                await cursor.execute("SELECT EXISTS (SELECT 1 FROM crawldb.page OFFSET %s)", (MAX_PAGES_TABLE_ROWS,))
+
+                if (await cursor.fetchone())[0]:
+                    # The limit for the pages table has been reached
+
+                    return
+
+                async with connection.transaction():
+                    unknown_pages = [page for page in pages if page.get("to_id") is None]
+
+                    await self.find_page_ids(connection, unknown_pages)
+
+                    new_pages = [page for page in unknown_pages if page.get("to_id") is None]
+
+                    sites = await self.find_site_budgets(connection, [page["to"] for page in new_pages])
+
+                    site_ids = []
+
+                    for page in new_pages:
+                        site = sites[site_domain(page["to"])]
+
+                        # Pages over the page budget of their site are not added
+                        site_ids.append(site["id"] if site["queued_pages"] < site["max_pages"] else None)
+
+                        site["queued_pages"] += 1
+
+                    new_pages = [page for page, site_id in zip(new_pages, site_ids) if site_id is not None]
+
+                    site_ids = [site_id for site_id in site_ids if site_id is not None]
+
+                    async with connection.pipeline():
+                        cursors = []
+
+                        for page, site_id in zip(new_pages, site_ids):
+                            cursors.append(connection.cursor())
+
+                            await cursors[-1].execute(
+                                """
+                                    INSERT INTO crawldb.page("url", "page_type_code", "added_at_time", "site_id")
+                                    VALUES(%s, 'FRONTIER', %s, %s)
+                                    ON CONFLICT (url) DO NOTHING
+                                    RETURNING id
+                                """,
+                                (page["to"], datetime.now(), site_id)
+                            )
+
+                    queued_pages = {}
+
+                    for page, site_id, page_cursor in zip(new_pages, site_ids, cursors):
+                        inserted_page = await page_cursor.fetchone()
+
+                        if inserted_page is not None:
+                            page["to_id"] = inserted_page[0]
+
+                            queued_pages[site_id] = queued_pages.get(site_id, 0) + 1
+
+                    await cursor.execute(prepared_query("add_queued_pages"),
+                                         (list(queued_pages), list(queued_pages.values())))
+
+                    # Urls inserted by another worker after the lookup
+                    await self.find_page_ids(connection, [page for page in new_pages if page.get("to_id") is None])
+
+                    await cursor.executemany(
+                        """
+                            INSERT INTO crawldb.link("from_page", "to_page")
+                            VALUES(%s, %s)
+                            ON CONFLICT DO NOTHING
+                        """,
+                        [(page["from"], page["to_id"]) for page in pages if page.get("to_id") is not None]
+                    )
+        except Exception as error:
+            print("[ERROR WHILE ADDING PAGES TO FRONTIER]", error)
+
+    """
+        Budgets of the sites of the urls, see DatabaseHandler.find_site_budgets
+    """
+
+    async def find_site_budgets(self, connection, urls):
+        domains = sorted({site_domain(url) for url in urls})
+
+        if not domains:
+            return {}
+
+        await connection.execute(prepared_query("create_frontier_sites"), (domains,))
+
+        cursor = await connection.execute(prepared_query("find_site_budgets"), (SITE_MAX_PAGES, domains))
+
+        return {domain: {"id": site_id, "queued_pages": queued_pages, "max_pages": max_pages}
+                for domain, site_id, queued_pages, max_pages in await cursor.fetchall()}
+
+    """
+        Set the to_id of the pages whose url is already in the database
+    """
+
+    async def find_page_ids(self, connection, pages):
+        async with connection.pipeline():
+            cursors = []
+
+            for page in pages:
+                cursors.append(connection.cursor())
+
+                await cursors[-1].execute(prepared_query("find_page_by_url"), (page["to"],))
+
+        for page, cursor in zip(pages, cursors):
+            existing_page = await cursor.fetchone()
+
+            if existing_page is not None:
+                page["to_id"] = existing_page[0]
+
+    async def link_pages(self, from_page, to_page):
+        try:
+            async with self.pool.connection() as connection:
+                await connection.execute(
+                    """
+                        INSERT INTO crawldb.link("from_page", "to_page")
+                        VALUES(%s, %s)
+                        ON CONFLICT DO NOTHING
+                    """,
+                    (from_page, to_page)
+                )
+        except Exception as error:
+            print("[ERROR WHILE LINKING PAGES]", error)
+
+    """
+        Store the crawled page and the crawl time and usage of its site, both updates are sent in one pipeline
+    """
+
+    async def remove_page_from_frontier(self, current_page):
+        try:
+            async with self.pool.connection() as connection:
+                async with connection.transaction(), connection.pipeline():
+                    await connection.execute(
+                        prepared_query("finish_page"),
+                        (current_page["site_id"], current_page["page_type_code"], current_page["html_content"],
+                         current_page["hash_content"], current_page["http_status_code"], current_page["accessed_time"],
+                         current_page.get("etag"), current_page.get("last_modified"), current_page.get("change_rate"),
+                         current_page.get("visit_count"), current_page.get("next_visit_at"), current_page["id"])
+                    )
+
+                    await connection.execute(prepared_query("update_site_usage"),
+                                             (datetime.now(), current_page.get("content_bytes", 0),
+                                              current_page.get("render_seconds", 0), current_page["site_id"]))
+        except Exception as error:
+            print("[ERROR WHILE REMOVING PAGE FROM FRONTIER]", error)
+
+    """
+        Insert a binary file or an image, unless its table would grow over MAX_BINARY_TABLE_SIZE. Returns the cursor of
+        the insert
+    """
+
+    async def insert_binary_data(self, connection, table, query, query_vars, data_size):
+        cursor = await connection.execute("SELECT COALESCE(SUM(data_size), 0) FROM crawldb.{}".format(table))
+
+        size_of_table = (await cursor.fetchone())[0]
+
+        if size_of_table + data_size >= MAX_BINARY_TABLE_SIZE:
+            # The size limit set for the table has been reached
+
+            return
+
+        return await connection.execute(query, query_vars)
+
+    async def insert_page_data(self, page_data):
+        try:
+            async with self.pool.connection() as connection:
+                await self.insert_binary_data(
+                    connection,
+                    "page_data",
+                    """
+                        INSERT INTO crawldb.page_data(page_id, data_type_code, data, data_size)
+                        VALUES (%s, %s, %s, %s)
+                    """,
+                    (page_data["page_id"], page_data["data_type_code"], page_data["data"], page_data["data_size"]),
+                    page_data["data_size"]
+                )
+        except Exception as error:
+            print("[ERROR WHILE INSERTING PAGE DATA]", error)
+
+    """
+        Insert an image or only a reference to a stored near duplicate, see DatabaseHandler.insert_image_data
+    """
+
+    async def insert_image_data(self, image_data):
+        image_hash = image_data.get("image_hash")
+
+        try:
+            async with self.pool.connection() as connection:
+                async with connection.transaction():
+                    if image_hash is not None:
+                        cursor = await connection.execute(prepared_query("find_similar_image"),
+                                                          similar_image_arguments(image_hash))
+
+                        similar_image = await cursor.fetchone()
+
+                        if similar_image is not None:
+                            await connection.execute(
+                                """
+                                    INSERT INTO crawldb.image(page_id, filename, content_type, data, data_size, 
+                                    accessed_time, duplicate_of)
+                                    VALUES (%s, %s, %s, NULL, 0, %s, %s)
+                                """,
+                                (image_data["page_id"], image_data["filename"], image_data["content_type"],
+                                 image_data["accessed_time"], similar_image[0])
+                            )
+
+                            return similar_image[0]
+
+                    cursor = await self.insert_binary_data(
+                        connection,
+                        "image",
+                        """
+                            INSERT INTO crawldb.image(page_id, filename, content_type, data, data_size, accessed_time)
+                            VALUES (%s, %s, %s, %s, %s, %s)
+                            RETURNING id
+                        """,
+                        (image_data["page_id"], image_data["filename"], image_data["content_type"], image_data["data"],
+                         image_data["data_size"], image_data["accessed_time"]),
+                        image_data["data_size"]
+                    )
+
+                    if cursor is not None and image_hash is not None:
+                        await connection.execute(
+                            """
+                                INSERT INTO crawldb.image_hash(image_id, hash, mean_color, digest)
+                                VALUES (%s, %s, %s, %s)
+                            """,
+                            ((await cursor.fetchone())[0], image_hash["hash"], image_hash["mean_color"],
+                             image_hash["digest"])
+                        )
+        except Exception as error:
+            print("[ERROR WHILE INSERTING IMAGE DATA]", error)
+
+    """
+        Store the content digest of a page unless another page has it, see DatabaseHandler.insert_content_digest
+    """
+
+    async def insert_content_digest(self, digest, page_id):
+        try:
+            async with self.pool.connection() as connection:
+                cursor = await connection.execute(prepared_query("insert_content_digest"), (digest, page_id))
+
+                return (await cursor.fetchone())[0]
+        except Exception as error:
+            print("[ERROR WHILE INSERTING CONTENT DIGEST]", error)
+
+    async def insert_page_signatures(self, page_id, signatures):
+        try:
+            async with self.pool.connection() as connection:
+                await connection.execute(prepared_query("insert_page_signatures"),
+                                         (page_id, list(signatures), len(signatures)))
+        except Exception as error:
+            print("[ERROR WHILE INSERTING HASH]", error)
+
+    """
+        Jaccard similarity of the signatures with the most similar crawled page, see
+        DatabaseHandler.calculate_biggest_similarity
+    """
+
+    async def calculate_biggest_similarity(self, signatures):
+        first_matching = None
+
+        try:
+            async with self.pool.connection() as connection:
+                cursor = await connection.execute(prepared_query("find_most_similar_signatures"),
+                                                  (list(signatures), len(signatures)))
+
+                first_matching = await cursor.fetchone()
+        except Exception as error:
+            print("[ERROR WHILE FINDING SIMILAR PAGES]", error)
+
+        if first_matching and first_matching[4] > 0:
+            # calculate jaccard similarity (intersection over union)
+            return first_matching[4] / (first_matching[5] - first_matching[4])
+
+        return 0
+
+    async def get_site(self, domain):
+        try:
+            async with self.pool.connection() as connection:
+                cursor = await connection.execute(prepared_query("get_site"), (domain,))
+
+                site = await cursor.fetchone()
+
+            if site is None:
+                return
+
+            return {
+                "id": site[0],
+                "domain": site[1],
+                "robots_content": site[2],
+                "last_crawled_at": site[3],
+                "bootstrap_status": site[4]
+            }
+        except Exception as error:
+            print("[ERROR WHILE FETCHING SITE]", error)
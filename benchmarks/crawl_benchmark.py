@@ -0,0 +1,387 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from multiprocessing import Value
+
+import psycopg2
+import psycopg2.extensions
+
+from fake_site import FakeSiteConfig, start_fake_site
+
+"""
+    Offline benchmark of the whole crawler. A synthetic gov.si web (see fake_site.py) is served locally and crawled by
+    Crawler/CrawlerProcess into a local Postgres database created from crawldb.sql. The results (pages per second,
+    database statements and transactions per page, stage latencies and peak memory) are stored as json in
+    benchmarks/results, so runs of different commits can be compared with --compare
+
+    WARNING: the crawldb schema of the benchmark database is dropped and recreated, never point it to a real crawl
+
+    Usage: python benchmarks/crawl_benchmark.py --processes 4 --hosts 4 --pages-per-host 250
+"""
+
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESULTS_DIRECTORY = os.path.join(REPOSITORY_DIRECTORY, "benchmarks", "results")
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+# Histograms of the crawler metrics which are reported in the results
+REPORTED_HISTOGRAMS = ("crawler_frontier_claim_seconds", "crawler_fetch_seconds", "crawler_render_seconds",
+                       "crawler_parse_seconds", "crawler_hash_seconds", "crawler_similarity_query_seconds",
+                       "crawler_database_write_seconds")
+
+# Lower is better for all the compared results except these
+HIGHER_IS_BETTER = ("pages_per_second",)
+
+
+"""
+    Statements sent to the server by the database handlers of all the crawler processes, every statement is one round
+    trip (a batch of execute_values is one statement, executemany sends one statement per row). The counter is created
+    before the crawler processes are forked, so they all increase the same one
+"""
+executed_statements = Value("q", 0)
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        with executed_statements.get_lock():
+            executed_statements.value += 1
+
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+
+        with executed_statements.get_lock():
+            executed_statements.value += len(vars_list)
+
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        with executed_statements.get_lock():
+            executed_statements.value += 1
+
+        return super().copy_expert(sql, file, size)
+
+
+"""
+    Connection of the database handler whose cursors count the executed statements
+"""
+
+
+def counting_connection_class(connection_class):
+    class CountingConnection(connection_class):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+
+            self.cursor_factory = CountingCursor
+
+    return CountingConnection
+
+
+def create_database_schema(database_parameters):
+    connection = psycopg2.connect(**database_parameters)
+
+    cursor = connection.cursor()
+
+    cursor.execute("DROP SCHEMA IF EXISTS crawldb CASCADE")
+
+    with open(os.path.join(REPOSITORY_DIRECTORY, "crawldb.sql")) as schema_file:
+        cursor.execute(schema_file.read())
+
+    connection.commit()
+
+    connection.close()
+
+
+def fetch_database_stats(database_parameters):
+    connection = psycopg2.connect(**database_parameters)
+
+    connection.autocommit = True
+
+    cursor = connection.cursor()
+
+    # Statistics are reported to the server with a small delay
+    time.sleep(1)
+
+    cursor.execute("SELECT pg_stat_clear_snapshot()")
+
+    cursor.execute(
+        """
+            SELECT xact_commit + xact_rollback, tup_returned + tup_fetched, tup_inserted + tup_updated
+            FROM pg_stat_database WHERE datname = current_database()
+        """
+    )
+
+    transactions, rows_read, rows_written = cursor.fetchone()
+
+    cursor.execute(
+        """
+            SELECT COUNT(*), MIN(accessed_time), MAX(accessed_time)
+            FROM crawldb.page WHERE page_type_code <> 'FRONTIER'
+        """
+    )
+
+    pages, first_accessed_time, last_accessed_time = cursor.fetchone()
+
+    cursor.execute("SELECT page_type_code, COUNT(*) FROM crawldb.page GROUP BY page_type_code")
+
+    pages_by_type = dict(cursor.fetchall())
+
+    connection.close()
+
+    return {
+        "transactions": transactions,
+        "rows_read": rows_read,
+        "rows_written": rows_written,
+        "pages": pages,
+        "first_accessed_time": first_accessed_time,
+        "last_accessed_time": last_accessed_time,
+        "pages_by_type": pages_by_type
+    }
+
+
+class PeakMemorySampler:
+    """
+        Samples the memory of the benchmark process tree (crawler processes, chrome, hash workers)
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+
+        self.peak_rss = 0
+
+        self.stop_event = threading.Event()
+
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        from supervisor import get_process_trees_rss
+
+        while not self.stop_event.wait(self.interval):
+            rss = get_process_trees_rss([os.getpid()])[os.getpid()]
+
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+        self.thread.join()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPOSITORY_DIRECTORY,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(arguments):
+    database_parameters = {
+        "host": arguments.host,
+        "user": arguments.user,
+        "password": arguments.password,
+        "database": arguments.database
+    }
+
+    site_config = FakeSiteConfig(hosts=arguments.hosts, pages_per_host=arguments.pages_per_host,
+                                 fan_out=arguments.fan_out, duplicate_every=arguments.duplicate_every,
+                                 pdf_every=arguments.pdf_every, crawl_delay=arguments.crawl_delay,
+                                 sitemap_pages=arguments.sitemap_pages, javascript_links=arguments.javascript_links)
+
+    create_database_schema(database_parameters)
+
+    server = start_fake_site(site_config)
+
+    proxy_url = "http://127.0.0.1:{}".format(server.server_port)
+
+    # requests uses the fake site as a proxy, the connections to chromedriver stay local
+    os.environ["HTTP_PROXY"] = proxy_url
+    os.environ["NO_PROXY"] = "localhost,127.0.0.1"
+
+    # The crawler reads the seed pages, writes checkpoints and metrics into the working directory
+    working_directory = tempfile.mkdtemp(prefix="crawl_benchmark_")
+
+    os.chdir(working_directory)
+
+    with open("seed_pages.txt", "w") as seed_pages:
+        seed_pages.write("\n".join(site_config.seed_urls()) + "\n")
+
+    # The crawler creates its database handler on import, so the benchmark database has to be set before that
+    import database_handler
+    database_handler.config = lambda: database_parameters
+    database_handler.PreparingConnection = counting_connection_class(database_handler.PreparingConnection)
+
+    import crawler
+    import supervisor
+
+    crawler.CHROME_ARGUMENTS.append("--proxy-server={}".format(proxy_url))
+
+    # Finish quickly once the frontier is empty
+    crawler.DELAY = 1
+    crawler.MAX_NUMBER_OF_RETRIES = 3
+    supervisor.SUPERVISOR_INTERVAL = 5
+
+    database_stats_before = fetch_database_stats(database_parameters)
+
+    statements_before = executed_statements.value
+
+    memory_sampler = PeakMemorySampler()
+    memory_sampler.start()
+
+    started_at = time.time()
+
+    crawler_instance = crawler.Crawler(arguments.processes)
+    crawler_instance.run()
+
+    memory_sampler.stop()
+
+    database_stats_after = fetch_database_stats(database_parameters)
+
+    pages = database_stats_after["pages"]
+
+    # The processes wait for new pages before they stop, so the duration ends with the last crawled page
+    if database_stats_after["last_accessed_time"] is not None:
+        duration = database_stats_after["last_accessed_time"].timestamp() - started_at
+    else:
+        duration = time.time() - started_at
+
+    with open(os.path.join(working_directory, "metrics.json")) as metrics_file:
+        crawler_metrics = json.load(metrics_file)
+
+    stage_latencies = {}
+
+    for name, series in crawler_metrics["histograms"].items():
+        if name not in REPORTED_HISTOGRAMS:
+            continue
+
+        for entry in series:
+            label = ",".join("{}={}".format(key, value) for key, value in sorted(entry["labels"].items()))
+
+            stage_latencies["{}{}".format(name, "[{}]".format(label) if label else "")] = {
+                "count": entry["count"],
+                "mean": entry["mean"],
+                "p50": entry["p50"],
+                "p99": entry["p99"]
+            }
+
+    transactions = database_stats_after["transactions"] - database_stats_before["transactions"]
+
+    statements = executed_statements.value - statements_before
+
+    return {
+        "revision": git_revision(),
+        "created_at": datetime.now().isoformat(),
+        "processes": arguments.processes,
+        "site": site_config.to_dict(),
+        "results": {
+            "pages": pages,
+            "duration": duration,
+            "pages_per_second": pages / duration if duration > 0 else 0,
+            "database_statements_per_page": statements / pages if pages else 0,
+            "database_transactions_per_page": transactions / pages if pages else 0,
+            "rows_read_per_page": (database_stats_after["rows_read"] - database_stats_before["rows_read"]) / pages
+            if pages else 0,
+            "rows_written_per_page": (database_stats_after["rows_written"] - database_stats_before["rows_written"]) /
+            pages if pages else 0,
+            "peak_rss_mb": memory_sampler.peak_rss / 2 ** 20
+        },
+        "pages_by_type": database_stats_after["pages_by_type"],
+        "stage_latencies": stage_latencies
+    }
+
+
+def save_results(results):
+    os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+
+    path = os.path.join(RESULTS_DIRECTORY, "crawl-{}-{}.json".format(
+        results["revision"], datetime.now().strftime("%Y%m%d-%H%M%S")))
+
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2, default=str)
+
+    return path
+
+
+"""
+    Print the relative change of every result and stage latency between two benchmark runs
+"""
+
+
+def compare_results(baseline, results):
+    print("{:<70} {:>12} {:>12} {:>9}".format("", baseline["revision"], results["revision"], "change"))
+
+    rows = [(key, baseline["results"].get(key), value) for key, value in results["results"].items()]
+
+    for stage, latencies in results["stage_latencies"].items():
+        baseline_latencies = baseline["stage_latencies"].get(stage, {})
+
+        for quantile in ("p50", "p99"):
+            rows.append(("{} {}".format(stage, quantile), baseline_latencies.get(quantile), latencies[quantile]))
+
+    for name, baseline_value, value in rows:
+        if baseline_value is None:
+            print("{:<70} {:>12} {:>12.4f}".format(name, "-", value))
+
+            continue
+
+        change = (value - baseline_value) / baseline_value * 100 if baseline_value else 0
+
+        regression = change < 0 if name in HIGHER_IS_BETTER else change > 0
+
+        print("{:<70} {:>12.4f} {:>12.4f} {:>8.1f}%{}".format(name, baseline_value, value, change,
+                                                              " !" if regression and abs(change) >= 10 else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the crawler against a local synthetic gov.si web")
+
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--hosts", type=int, default=4)
+    parser.add_argument("--pages-per-host", type=int, default=250)
+    parser.add_argument("--fan-out", type=int, default=10)
+    parser.add_argument("--duplicate-every", type=int, default=10)
+    parser.add_argument("--pdf-every", type=int, default=15)
+    parser.add_argument("--crawl-delay", type=int, default=0)
+    parser.add_argument("--sitemap-pages", type=int, default=50)
+    parser.add_argument("--javascript-links", type=int, default=2)
+
+    parser.add_argument("--host", default="localhost", help="host of the benchmark database")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--database", default="ieps_benchmark",
+                        help="the crawldb schema of this database is dropped and recreated")
+
+    parser.add_argument("--compare", default=None, help="json results of an earlier run to compare with")
+
+    arguments = parser.parse_args()
+
+    if arguments.compare:
+        # The benchmark changes the working directory
+        arguments.compare = os.path.abspath(arguments.compare)
+
+    results = run_benchmark(arguments)
+
+    path = save_results(results)
+
+    print(json.dumps(results["results"], indent=2))
+
+    print("[BENCHMARK] Results saved to {}".format(path))
+
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            compare_results(json.load(baseline_file), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+import psycopg2
+import psycopg2.extensions
+
+from generate_data import create_database_schema, generate, page_url, PAGES_PER_SITE
+
+"""
+    Micro benchmarks of the DatabaseHandler query paths at different database sizes. For every scale a synthetic crawl
+    is bulk loaded (see generate_data.py), every benchmarked method is timed and the plans of the queries it runs are
+    captured with EXPLAIN (ANALYZE, BUFFERS). The results are stored as json in benchmarks/results
+
+    WARNING: the crawldb schema of the benchmark database is dropped and recreated
+
+    Usage: python benchmarks/database_benchmark.py --scales 10000 100000 1000000
+"""
+
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESULTS_DIRECTORY = os.path.join(REPOSITORY_DIRECTORY, "benchmarks", "results")
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+"""
+    Queries executed by the database handler while a method is benchmarked, they are explained after the timing.
+    Prepared statements are recorded as the query they execute, so they can be explained on another connection
+"""
+recorded_queries = []
+
+# Set to the PREPARED_QUERIES of the database handler when it is imported
+prepared_queries = {}
+
+
+class RecordingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        if query.startswith("EXECUTE "):
+            recorded_queries.append((prepared_queries[query.split()[1]][1], vars))
+        elif not query.startswith("PREPARE "):
+            recorded_queries.append((query, vars))
+
+        return super().execute(query, vars)
+
+
+def percentile(values, q):
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class DatabaseBenchmark:
+    def __init__(self, database_handler, database_parameters, scale, repetitions, generator):
+        self.database_handler = database_handler
+
+        self.database_parameters = database_parameters
+
+        self.scale = scale
+
+        self.repetitions = repetitions
+
+        self.generator = generator
+
+        self.new_page_index = scale
+
+        self.html_page_ids = []
+
+        self.worker_id = None
+
+    """
+        The benchmarked methods, each one gets a function which prepares its arguments for one call
+    """
+
+    def methods(self):
+        return {
+            "claim_page_from_frontier": (self.database_handler.claim_page_from_frontier, lambda: (self.worker_id,)),
+            "add_pages_to_frontier": (self.database_handler.add_pages_to_frontier, self.add_pages_arguments),
+            "insert_content_digest": (self.database_handler.insert_content_digest, self.content_digest_arguments),
+            "calculate_biggest_similarity": (self.database_handler.calculate_biggest_similarity,
+                                             self.similarity_arguments)
+        }
+
+    """
+        Half of the added urls already exist, like the menus that link to the same pages from every page
+    """
+
+    def add_pages_arguments(self):
+        from_page = self.random_html_page_id()
+
+        pages = []
+
+        for _ in range(10):
+            pages.append({
+                "from": from_page,
+                "to": page_url(self.new_page_index // PAGES_PER_SITE, self.new_page_index)
+            })
+
+            self.new_page_index += 1
+
+        for _ in range(10):
+            page_index = self.generator.randrange(self.scale)
+
+            pages.append({
+                "from": from_page,
+                "to": page_url(page_index // PAGES_PER_SITE, page_index)
+            })
+
+        return (pages,)
+
+    def content_digest_arguments(self):
+        # Exact duplicates are rare, most digests are new
+        return (hashlib.sha256(str(self.generator.random()).encode("utf-8")).digest(), self.random_html_page_id())
+
+    def similarity_arguments(self):
+        return ({self.generator.randrange(2 ** 32) for _ in range(100)},)
+
+    def random_html_page_id(self):
+        return self.generator.choice(self.html_page_ids)
+
+    def load_html_page_ids(self):
+        connection = psycopg2.connect(**self.database_parameters)
+
+        cursor = connection.cursor()
+
+        cursor.execute("SELECT id FROM crawldb.page WHERE page_type_code='HTML'")
+
+        self.html_page_ids = [row[0] for row in cursor.fetchall()]
+
+        connection.close()
+
+    def run(self, skip_explain=False):
+        self.load_html_page_ids()
+
+        self.worker_id = self.database_handler.register_worker("database_benchmark", os.getpid())
+
+        results = {}
+
+        for name, (method, arguments) in self.methods().items():
+            timings = []
+
+            for _ in range(self.repetitions):
+                call_arguments = arguments()
+
+                del recorded_queries[:]
+
+                started_at = time.perf_counter()
+
+                method(*call_arguments)
+
+                timings.append(time.perf_counter() - started_at)
+
+            queries = list(recorded_queries)
+
+            results[name] = {
+                "calls": len(timings),
+                "mean": sum(timings) / len(timings),
+                "p50": percentile(timings, 0.5),
+                "p99": percentile(timings, 0.99),
+                "queries_per_call": len(queries),
+                "plans": [] if skip_explain else self.explain(queries)
+            }
+
+            print("[DATABASE BENCHMARK] {:>9} pages {:<30} mean {:.4f}s p50 {:.4f}s p99 {:.4f}s".format(
+                self.scale, name, results[name]["mean"], results[name]["p50"], results[name]["p99"]))
+
+        return results
+
+    """
+        EXPLAIN ANALYZE executes the statement, so every plan is captured in a transaction which is rolled back
+    """
+
+    def explain(self, queries):
+        connection = psycopg2.connect(**self.database_parameters)
+
+        plans = []
+
+        explained = set()
+
+        for query, query_vars in queries:
+            if query in explained:
+                continue
+
+            explained.add(query)
+
+            cursor = connection.cursor()
+
+            try:
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, query_vars)
+
+                plans.append({
+                    "query": " ".join(query.split()),
+                    "plan": cursor.fetchone()[0]
+                })
+            except psycopg2.Error as error:
+                plans.append({
+                    "query": " ".join(query.split()),
+                    "error": str(error)
+                })
+            finally:
+                connection.rollback()
+
+        connection.close()
+
+        return plans
+
+
+"""
+    A seed page added to a fresh schema has to be claimable. Its site is created as PENDING without a bootstrap, unlike
+    the READY sites of the generated crawls, so the benchmark scales would not notice if such sites were skipped
+"""
+
+
+def check_seed_claim(database_handler, database_parameters):
+    connection = psycopg2.connect(**database_parameters)
+
+    create_database_schema(connection)
+
+    connection.close()
+
+    handler = database_handler.DatabaseHandler(1, 1)
+
+    seed_page = page_url(0, 0)
+
+    handler.add_seed_page_to_frontier(seed_page)
+
+    claimed = handler.claim_page_from_frontier(handler.register_worker("database_benchmark", os.getpid()))
+
+    handler.connection_pool.closeall()
+
+    if claimed is None or claimed["url"] != seed_page:
+        print("[DATABASE BENCHMARK] The seed page of a fresh schema was not claimed:", claimed)
+
+        sys.exit(1)
+
+    print("[DATABASE BENCHMARK] The seed page of a fresh schema was claimed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the DatabaseHandler query paths at different scales")
+
+    parser.add_argument("--scales", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repetitions", type=int, default=50)
+    parser.add_argument("--skip-explain", action="store_true")
+    parser.add_argument("--no-prepared-statements", action="store_true",
+                        help="send the query text every time, like behind a transaction-mode pooler")
+
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--database", default="ieps_benchmark",
+                        help="the crawldb schema of this database is dropped and recreated")
+
+    arguments = parser.parse_args()
+
+    database_parameters = {
+        "host": arguments.host,
+        "user": arguments.user,
+        "password": arguments.password,
+        "database": arguments.database
+    }
+
+    # The database handler has to use the benchmark database
+    import database_handler
+    database_handler.config = lambda: database_parameters
+
+    prepared_queries.update(database_handler.PREPARED_QUERIES)
+
+    check_seed_claim(database_handler, database_parameters)
+
+    results = {
+        "created_at": datetime.now().isoformat(),
+        "repetitions": arguments.repetitions,
+        "prepared_statements": not arguments.no_prepared_statements,
+        "scales": {}
+    }
+
+    for scale in arguments.scales:
+        connection = psycopg2.connect(**database_parameters)
+
+        generate(connection, scale)
+
+        connection.close()
+
+        # add_pages_to_frontier links the pages on a second connection
+        handler = database_handler.DatabaseHandler(2, 2, prepare_statements=not arguments.no_prepared_statements)
+
+        # Record the queries that run on the connections of the handler
+        connections = [handler.connection_pool.getconn() for _ in range(2)]
+
+        for connection in connections:
+            connection.cursor_factory = RecordingCursor
+
+            handler.connection_pool.putconn(connection)
+
+        benchmark = DatabaseBenchmark(handler, database_parameters, scale, arguments.repetitions, random.Random(scale))
+
+        results["scales"][scale] = benchmark.run(arguments.skip_explain)
+
+        handler.connection_pool.closeall()
+
+    os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+
+    path = os.path.join(RESULTS_DIRECTORY, "database-{}.json".format(datetime.now().strftime("%Y%m%d-%H%M%S")))
+
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+
+    print("[DATABASE BENCHMARK] Results saved to {}".format(path))
+
+    # Scaling curve, how much slower every method gets from one scale to the next
+    scales = arguments.scales
+
+    for name in results["scales"][scales[0]]:
+        means = ["{:.4f}s".format(results["scales"][scale][name]["mean"]) for scale in scales]
+
+        print("{:<30} {}".format(name, " -> ".join(means)))
+
+
+if __name__ == "__main__":
+    main()
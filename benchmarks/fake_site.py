@@ -0,0 +1,247 @@
+import random
+import struct
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+"""
+    A synthetic gov.si web for the benchmarks. The server answers for all the hosts of the site graph, it is used as an
+    http proxy by the crawler (requests and chrome), so the crawled urls are the same as on the real web
+    (http://site0.bench.gov.si/...) and ALLOWED_DOMAIN does not have to be changed
+"""
+
+# Domain of all the synthetic hosts
+BENCHMARK_DOMAIN = "bench.gov.si"
+
+WORDS = ("uprava", "vlada", "obrazec", "storitev", "ministrstvo", "zakon", "podatki", "prijava", "dovoljenje", "urad",
+         "javni", "razpis", "sklep", "pravilnik", "seja", "odlok", "novica", "davek", "pokojnina", "zdravje", "okolje",
+         "promet", "kmetijstvo", "šolstvo", "kultura", "obvestilo", "vloga", "potrdilo", "register", "evidenca")
+
+
+class FakeSiteConfig:
+    def __init__(self, hosts=4, pages_per_host=250, fan_out=10, duplicate_every=10, pdf_every=15, images_per_page=3,
+                 crawl_delay=0, sitemap_pages=50, javascript_links=2, words_per_page=400, seed=0):
+        self.hosts = hosts
+
+        self.pages_per_host = pages_per_host
+
+        # Number of links from every page to other pages (of the same and of other hosts)
+        self.fan_out = fan_out
+
+        # Every n-th page is a near duplicate of the previous page (0 disables duplicates)
+        self.duplicate_every = duplicate_every
+
+        # Every n-th page links to a pdf document (0 disables documents)
+        self.pdf_every = pdf_every
+
+        # Images are shared between pages like logos and banners on real sites
+        self.images_per_page = images_per_page
+
+        # Crawl-delay in robots.txt (0 leaves it out)
+        self.crawl_delay = crawl_delay
+
+        # Number of pages listed in the sitemap of every host
+        self.sitemap_pages = sitemap_pages
+
+        # Links which only exist after the javascript of the page was run
+        self.javascript_links = javascript_links
+
+        self.words_per_page = words_per_page
+
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    def host(self, index):
+        return "site{}.{}".format(index, BENCHMARK_DOMAIN)
+
+    def seed_urls(self):
+        return ["http://{}/".format(self.host(index)) for index in range(self.hosts)]
+
+
+class FakeSite:
+    def __init__(self, config):
+        self.config = config
+
+        self.png = create_png()
+
+    def page_url(self, host_index, page_index):
+        return "http://{}/p/{}".format(self.config.host(host_index), page_index)
+
+    """
+        Links of a page are deterministic, so every run of the benchmark crawls the same graph
+    """
+
+    def page_links(self, host_index, page_index):
+        generator = random.Random("{}:{}:{}".format(self.config.seed, host_index, page_index))
+
+        links = []
+
+        for _ in range(self.config.fan_out):
+            # Most links stay on the same host, like the menus of real sites
+            target_host = host_index if generator.random() < 0.8 else generator.randrange(self.config.hosts)
+
+            links.append(self.page_url(target_host, generator.randrange(self.config.pages_per_host)))
+
+        return links
+
+    def page_text(self, host_index, page_index):
+        text_index = page_index
+
+        duplicate_every = self.config.duplicate_every
+
+        if duplicate_every and page_index % duplicate_every == 0 and page_index > 0:
+            # Near duplicate, same text as the previous page with a different date line
+            text_index = page_index - 1
+
+        generator = random.Random("{}:{}:text:{}".format(self.config.seed, host_index, text_index))
+
+        words = [generator.choice(WORDS) for _ in range(self.config.words_per_page)]
+
+        return " ".join(words) + " objavljeno {}".format(page_index)
+
+    def render_page(self, host_index, page_index):
+        host = self.config.host(host_index)
+
+        anchors = "\n".join('<li><a href="{0}">{0}</a></li>'.format(link)
+                            for link in self.page_links(host_index, page_index))
+
+        images = "\n".join('<img src="/img/{}.png">'.format((page_index + image) % 10)
+                           for image in range(self.config.images_per_page))
+
+        documents = ""
+
+        if self.config.pdf_every and page_index % self.config.pdf_every == 0:
+            documents = '<a href="/doc/{}.pdf">dokument</a>'.format(page_index)
+
+        javascript_links = "\n".join(
+            'var a{0} = document.createElement("a"); a{0}.href = "{1}"; document.body.appendChild(a{0});'.format(
+                index, self.page_url(host_index, (page_index + index + 1) % self.config.pages_per_host))
+            for index in range(self.config.javascript_links))
+
+        return """<!DOCTYPE html>
+<html>
+<head><title>{host} {page_index}</title></head>
+<body>
+<nav><ul><li><a href="/">Domov</a></li><li><a href="/p/0">Prva stran</a></li></ul></nav>
+<main><p>{text}</p>{documents}</main>
+<ul>{anchors}</ul>
+{images}
+<footer>Republika Slovenija - {host}</footer>
+<script>{javascript_links}</script>
+</body>
+</html>""".format(host=host, page_index=page_index, text=self.page_text(host_index, page_index), documents=documents,
+                  anchors=anchors, images=images, javascript_links=javascript_links)
+
+    def robots(self, host_index):
+        lines = ["User-agent: *", "Disallow: /private/"]
+
+        if self.config.crawl_delay:
+            lines.append("Crawl-delay: {}".format(self.config.crawl_delay))
+
+        lines.append("Sitemap: http://{}/sitemap.xml".format(self.config.host(host_index)))
+
+        return "\n".join(lines) + "\n"
+
+    def sitemap(self, host_index):
+        urls = "\n".join("<url><loc>{}</loc></url>".format(self.page_url(host_index, page_index))
+                         for page_index in range(min(self.config.sitemap_pages, self.config.pages_per_host)))
+
+        return '<?xml version="1.0" encoding="UTF-8"?>\n' \
+               '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n{}\n</urlset>\n'.format(urls)
+
+    """
+        Return the status code, content type and body for a url
+    """
+
+    def respond(self, url):
+        parsed_url = urlparse(url)
+
+        host = parsed_url.hostname or ""
+
+        path = parsed_url.path
+
+        if not host.endswith("." + BENCHMARK_DOMAIN) or not host.startswith("site"):
+            return 404, "text/plain", b"unknown host"
+
+        try:
+            host_index = int(host.split(".")[0][len("site"):])
+        except ValueError:
+            return 404, "text/plain", b"unknown host"
+
+        if host_index >= self.config.hosts:
+            return 404, "text/plain", b"unknown host"
+
+        if path in ("", "/"):
+            return 200, "text/html; charset=utf-8", self.render_page(host_index, 0).encode("utf-8")
+
+        if path == "/robots.txt":
+            return 200, "text/plain", self.robots(host_index).encode("utf-8")
+
+        if path == "/sitemap.xml":
+            return 200, "application/xml", self.sitemap(host_index).encode("utf-8")
+
+        parts = path.strip("/").split("/")
+
+        if len(parts) == 2 and parts[0] == "p" and parts[1].isdigit() and int(parts[1]) < self.config.pages_per_host:
+            return 200, "text/html; charset=utf-8", self.render_page(host_index, int(parts[1])).encode("utf-8")
+
+        if len(parts) == 2 and parts[0] == "img":
+            return 200, "image/png", self.png
+
+        if len(parts) == 2 and parts[0] == "doc":
+            return 200, "application/pdf", create_pdf(parts[1])
+
+        return 404, "text/html", b"<html><body>Stran ne obstaja</body></html>"
+
+
+def create_png():
+    def chunk(chunk_type, data):
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)
+
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"\x00\x00\x80\xff")) + \
+        chunk(b"IEND", b"")
+
+
+def create_pdf(name):
+    return "%PDF-1.4\n% {}\n1 0 obj << /Type /Catalog >> endobj\ntrailer << /Root 1 0 R >>\n%%EOF\n".format(
+        name).encode("utf-8")
+
+
+def start_fake_site(config, port=0):
+    """
+        Start the fake site in a background thread and return the server, server.server_port is the proxy port
+    """
+    fake_site = FakeSite(config)
+
+    class FakeSiteRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            # As a proxy the request line holds the absolute url, otherwise the host is in the Host header
+            url = self.path
+
+            if not url.startswith("http"):
+                url = "http://{}{}".format(self.headers.get("Host", ""), self.path)
+
+            status_code, content_type, body = fake_site.respond(url)
+
+            self.send_response(status_code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeSiteRequestHandler)
+    server.daemon_threads = True
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
@@ -0,0 +1,222 @@
+import argparse
+import hashlib
+import io
+import os
+import random
+from datetime import datetime, timedelta
+
+import psycopg2
+
+"""
+    Bulk loads a synthetic crawl (sites, pages, links and content signatures) into a local Postgres database with COPY,
+    so that the database benchmarks can run against 10k, 100k or 1M pages without crawling anything
+
+    WARNING: the crawldb schema of the database is dropped and recreated
+
+    Usage: python benchmarks/generate_data.py --database ieps_benchmark --pages 100000
+"""
+
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Number of rows sent to the database in one COPY
+COPY_CHUNK_SIZE = 50000
+
+# Fraction of the pages which are still in the frontier, the others are crawled html pages
+FRONTIER_RATIO = 0.3
+
+# Number of pages per site
+PAGES_PER_SITE = 1000
+
+
+def create_database_schema(connection):
+    cursor = connection.cursor()
+
+    cursor.execute("DROP SCHEMA IF EXISTS crawldb CASCADE")
+
+    with open(os.path.join(REPOSITORY_DIRECTORY, "crawldb.sql")) as schema_file:
+        cursor.execute(schema_file.read())
+
+    connection.commit()
+
+
+def page_url(site_index, page_index):
+    return "http://site{}.bench.gov.si/p/{}".format(site_index, page_index)
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+        Send the rows in chunks, so that memory use does not grow with the number of rows
+    """
+    buffer = io.StringIO()
+
+    count = 0
+
+    for row in rows:
+        buffer.write("\t".join("\\N" if value is None else str(value) for value in row))
+        buffer.write("\n")
+
+        count += 1
+
+        if count % COPY_CHUNK_SIZE == 0:
+            buffer.seek(0)
+            cursor.copy_from(buffer, table, columns=columns)
+
+            buffer = io.StringIO()
+
+    buffer.seek(0)
+    cursor.copy_from(buffer, table, columns=columns)
+
+    return count
+
+
+def generate_sites(number_of_sites):
+    for site_index in range(number_of_sites):
+        yield site_index + 1, "http://site{}.bench.gov.si/".format(site_index)
+
+
+def generate_pages(number_of_pages, html_size, generator):
+    started_at = datetime(2019, 3, 1)
+
+    filler = "x" * html_size
+
+    for page_index in range(number_of_pages):
+        page_id = page_index + 1
+
+        site_index = page_index // PAGES_PER_SITE
+
+        added_at_time = started_at + timedelta(seconds=page_index)
+
+        if generator.random() < FRONTIER_RATIO:
+            yield (page_id, None, "FRONTIER", page_url(site_index, page_index), None, None, None, None,
+                   added_at_time)
+        else:
+            html_content = "<html><body>{} {}</body></html>".format(page_index, filler)
+
+            hash_content = hashlib.sha256(html_content.encode("utf-8")).hexdigest()
+
+            yield (page_id, site_index + 1, "HTML", page_url(site_index, page_index), html_content, hash_content, 200,
+                   added_at_time, added_at_time)
+
+
+def generate_links(number_of_pages, links_per_page, generator):
+    for from_page in range(1, number_of_pages + 1):
+        targets = set()
+
+        for _ in range(links_per_page):
+            # Most links stay on the same site
+            if generator.random() < 0.8:
+                site_start = (from_page - 1) // PAGES_PER_SITE * PAGES_PER_SITE
+
+                to_page = site_start + generator.randrange(min(PAGES_PER_SITE, number_of_pages - site_start)) + 1
+            else:
+                to_page = generator.randrange(number_of_pages) + 1
+
+            targets.add(to_page)
+
+        for to_page in targets:
+            yield from_page, to_page
+
+
+def generate_signatures(page_ids, signature_size, generator):
+    # Pages of a site share a part of their shingles (menus, footers), like real pages do
+    for signature_id, page_id in enumerate(page_ids, 1):
+        site_generator = random.Random((page_id - 1) // PAGES_PER_SITE)
+
+        shared = [site_generator.randrange(2 ** 32) for _ in range(signature_size // 2)]
+
+        own = [generator.randrange(2 ** 32) for _ in range(signature_size - len(shared))]
+
+        signatures = shared + own
+
+        yield signature_id, page_id, "{" + ",".join(str(value) for value in signatures) + "}", len(signatures)
+
+
+def generate(connection, number_of_pages, links_per_page=5, signature_size=100, html_size=1000, seed=0):
+    generator = random.Random(seed)
+
+    create_database_schema(connection)
+
+    cursor = connection.cursor()
+
+    number_of_sites = (number_of_pages + PAGES_PER_SITE - 1) // PAGES_PER_SITE
+
+    copy_rows(cursor, "crawldb.site", ("id", "domain"), generate_sites(number_of_sites))
+
+    copy_rows(cursor, "crawldb.page", ("id", "site_id", "page_type_code", "url", "html_content", "hash_content",
+                                       "http_status_code", "accessed_time", "added_at_time"),
+              generate_pages(number_of_pages, html_size, generator))
+
+    copy_rows(cursor, "crawldb.link", ("from_page", "to_page"),
+              generate_links(number_of_pages, links_per_page, generator))
+
+    cursor.execute("SELECT id FROM crawldb.page WHERE page_type_code='HTML' ORDER BY id")
+
+    html_page_ids = [row[0] for row in cursor.fetchall()]
+
+    copy_rows(cursor, "crawldb.content_hash", ("id", "page_id", "hash", "hash_length"),
+              generate_signatures(html_page_ids, signature_size, generator))
+
+    cursor.execute(
+        """
+            INSERT INTO crawldb.content_digest(digest, page_id)
+            SELECT decode(hash_content, 'hex'), id FROM crawldb.page WHERE hash_content IS NOT NULL
+        """
+    )
+
+    # Budget usage of the sites, as the crawler would have counted it
+    cursor.execute(
+        """
+            UPDATE crawldb.site 
+            SET queued_pages=usage.queued_pages, crawled_pages=usage.crawled_pages, crawled_bytes=usage.crawled_bytes 
+            FROM (
+                SELECT site_id, count(*) AS queued_pages, count(*) FILTER (WHERE page_type_code<>'FRONTIER') AS 
+                crawled_pages, COALESCE(SUM(octet_length(html_content)), 0) AS crawled_bytes 
+                FROM crawldb.page GROUP BY site_id
+            ) usage 
+            WHERE site.id=usage.site_id
+        """
+    )
+
+    # The serial sequences have to continue after the loaded ids
+    for table in ("site", "page", "content_hash"):
+        cursor.execute("SELECT setval(pg_get_serial_sequence('crawldb.{0}', 'id'), "
+                       "(SELECT COALESCE(MAX(id), 0) + 1 FROM crawldb.{0}), false)".format(table))
+
+    connection.commit()
+
+    connection.autocommit = True
+
+    cursor.execute("VACUUM ANALYZE")
+
+    connection.autocommit = False
+
+    print("[GENERATE DATA] Loaded {} pages, {} sites and {} signatures".format(number_of_pages, number_of_sites,
+                                                                             len(html_page_ids)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load a synthetic crawl into the benchmark database")
+
+    parser.add_argument("--pages", type=int, default=10000)
+    parser.add_argument("--links-per-page", type=int, default=5)
+    parser.add_argument("--signature-size", type=int, default=100)
+    parser.add_argument("--html-size", type=int, default=1000)
+
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--database", default="ieps_benchmark",
+                        help="the crawldb schema of this database is dropped and recreated")
+
+    arguments = parser.parse_args()
+
+    connection = psycopg2.connect(host=arguments.host, user=arguments.user, password=arguments.password,
+                                  database=arguments.database)
+
+    generate(connection, arguments.pages, arguments.links_per_page, arguments.signature_size, arguments.html_size)
+
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
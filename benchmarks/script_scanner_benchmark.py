@@ -0,0 +1,239 @@
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+"""
+    Benchmark of the link extraction from inline javascript. The old per-call regex over the whole script is compared
+    with script_link_scanner.py (without and with the character cap and the known bundles), the uncapped scanner must
+    find the same links as the regex
+
+    The scripts are read from saved pages (--corpus, a directory of .html and .js files), from the html content of the
+    pages of a crawl (--database) or generated (a synthetic site with a big bundle repeated on every page)
+
+    Usage: python benchmarks/script_scanner_benchmark.py --database ieps --pages 1000
+"""
+
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESULTS_DIRECTORY = os.path.join(REPOSITORY_DIRECTORY, "benchmarks", "results")
+
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+
+from script_link_scanner import ScriptLinkScanner, find_links, load_known_bundle_hashes, MAX_SCRIPT_CHARACTERS
+
+# The regex of the crawler before the scanner
+OLD_URL_PATTERN = r'(http://|https://)([\w_-]+(?:(?:\.[\w_-]+)+))([\w.,@?^=%&:/~+#-]*[\w@?^=%&/~+#-])?'
+
+SCRIPT_PATTERN = re.compile(r"<script\b[^>]*>(.*?)</script>", re.IGNORECASE | re.DOTALL)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPOSITORY_DIRECTORY,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def scripts_of_page(content, filename=".html"):
+    if filename.endswith(".js"):
+        return [content]
+
+    return [script for script in SCRIPT_PATTERN.findall(content) if script.strip()]
+
+
+"""
+    Every corpus is a list of pages, a page is the list of its inline scripts
+"""
+
+
+def load_corpus_directory(directory):
+    pages = []
+
+    for root, directories, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            if filename.endswith((".html", ".htm", ".js")):
+                with open(os.path.join(root, filename), encoding="utf-8", errors="replace") as page_file:
+                    pages.append(scripts_of_page(page_file.read(), filename))
+
+    return pages
+
+
+def load_corpus_database(arguments):
+    import psycopg2
+
+    connection = psycopg2.connect(host=arguments.host, user=arguments.user, password=arguments.password,
+                                  dbname=arguments.database)
+
+    cursor = connection.cursor()
+
+    cursor.execute(
+        """
+            SELECT html_content FROM crawldb.page
+            WHERE page_type_code = 'HTML' AND html_content IS NOT NULL
+            ORDER BY id LIMIT %s
+        """,
+        (arguments.pages,)
+    )
+
+    pages = [scripts_of_page(row[0]) for row in cursor]
+
+    connection.close()
+
+    return pages
+
+
+def random_identifier(random_generator):
+    length = random_generator.randint(1, 8)
+
+    return "".join(random_generator.choice("abcdefghijklmnopqrstuvwxyz_$") for _ in range(length))
+
+
+def random_script(random_generator, length, link_every):
+    parts = []
+
+    size = 0
+
+    while size < length:
+        if random_generator.random() < 1 / link_every:
+            part = '"https://www{}.gov.si/{}/{}?id={}"'.format(random_generator.randint(1, 50),
+                                                               random_identifier(random_generator),
+                                                               random_identifier(random_generator),
+                                                               random_generator.randint(1, 1000))
+        elif random_generator.random() < 0.01:
+            # Not an url, but starts with the prefix
+            part = "httpRequest.open(" + random_identifier(random_generator) + ")"
+        else:
+            part = "{}.{}({},{});".format(random_identifier(random_generator), random_identifier(random_generator),
+                                          random_generator.randint(0, 99), random_identifier(random_generator))
+
+        parts.append(part)
+
+        size += len(part)
+
+    return "".join(parts)
+
+
+def generate_corpus(arguments):
+    random_generator = random.Random(arguments.seed)
+
+    # A bundle which is inlined into every page of the site
+    bundle = random_script(random_generator, arguments.bundle_size, arguments.link_every * 100)
+
+    pages = []
+
+    for page in range(arguments.pages):
+        scripts = [random_script(random_generator, random_generator.randint(100, 2000), arguments.link_every)
+                   for _ in range(5)]
+
+        scripts.append(bundle)
+
+        pages.append(scripts)
+
+    return pages
+
+
+def old_find_links(javascript_text):
+    return [''.join(link) for link in re.findall(OLD_URL_PATTERN, javascript_text)]
+
+
+def time_pages(pages, find):
+    number_of_links = 0
+
+    started_at = time.perf_counter()
+
+    for scripts in pages:
+        for script in scripts:
+            number_of_links += len(find(script))
+
+    return time.perf_counter() - started_at, number_of_links
+
+
+def run_benchmark(arguments, pages):
+    number_of_characters = sum(len(script) for scripts in pages for script in scripts)
+
+    mismatches = sum(1 for scripts in pages for script in scripts
+                     if old_find_links(script) != find_links(script, len(script)))
+
+    methods = {
+        "regex": old_find_links,
+        "scanner": lambda script: find_links(script, len(script)),
+        "scanner_capped": ScriptLinkScanner(load_known_bundle_hashes(), arguments.max_characters).scan
+    }
+
+    results = {}
+
+    for name, find in methods.items():
+        duration, number_of_links = time_pages(pages, find)
+
+        results[name] = {
+            "seconds": duration,
+            "megabytes_per_second": number_of_characters / 2 ** 20 / duration if duration > 0 else 0,
+            "links": number_of_links
+        }
+
+    return {
+        "revision": git_revision(),
+        "created_at": datetime.now().isoformat(),
+        "pages": len(pages),
+        "scripts": sum(len(scripts) for scripts in pages),
+        "characters": number_of_characters,
+        "mismatches": mismatches,
+        "results": results
+    }
+
+
+def save_results(results):
+    os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+
+    path = os.path.join(RESULTS_DIRECTORY, "script-scanner-{}-{}.json".format(
+        results["revision"], datetime.now().strftime("%Y%m%d-%H%M%S")))
+
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the link extraction from inline javascript")
+
+    parser.add_argument("--corpus", default=None, help="directory of saved .html and .js files")
+    parser.add_argument("--pages", type=int, default=200, help="number of crawled or generated pages")
+    parser.add_argument("--bundle-size", type=int, default=300000, help="characters of the generated site bundle")
+    parser.add_argument("--link-every", type=int, default=20, help="generated script parts per url")
+    parser.add_argument("--max-characters", type=int, default=MAX_SCRIPT_CHARACTERS,
+                        help="characters of a script scanned by the capped scanner")
+    parser.add_argument("--seed", type=int, default=0)
+
+    parser.add_argument("--database", default=None, help="read the pages of this crawl database")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default="")
+
+    arguments = parser.parse_args()
+
+    if arguments.corpus:
+        pages = load_corpus_directory(arguments.corpus)
+    elif arguments.database:
+        pages = load_corpus_database(arguments)
+    else:
+        pages = generate_corpus(arguments)
+
+    results = run_benchmark(arguments, pages)
+
+    path = save_results(results)
+
+    print(json.dumps(results, indent=2))
+
+    print("[BENCHMARK] Results saved to {}".format(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import pickle
+import re
+import shutil
+import socket
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Directory where the crawler processes keep their checkpoints
+CHECKPOINT_DIRECTORY = "checkpoints"
+
+UNSAFE_NAME_CHARACTERS = re.compile(r"[^\w.-]")
+
+# How often the in-memory state of a crawler process is written to its checkpoint (seconds)
+CHECKPOINT_INTERVAL = 60
+
+
+class Checkpoint:
+    """
+        Saves the in-memory state of a crawler process to a local file, so that a restarted process does not have to
+        warm all of its caches from the database
+
+        key identifies the crawl the state belongs to (see checkpoint_name_and_key), a checkpoint saved with another key
+        is not loaded. Without a key nothing is loaded
+
+        The checkpoint is locked while the process lives, a second crawler with the same processes on the host takes
+        the next free checkpoint of the name (without fcntl, e. g. on Windows, checkpoints are not locked)
+    """
+
+    def __init__(self, name, key=None):
+        self.key = key
+
+        self.lock_file = None
+
+        self.path = self.acquire_path(UNSAFE_NAME_CHARACTERS.sub("_", name))
+
+        self.last_saved_at = time.time()
+
+    def acquire_path(self, name):
+        if fcntl is None:
+            return os.path.join(CHECKPOINT_DIRECTORY, "{}.pickle".format(name))
+
+        slot = 0
+
+        while True:
+            path = os.path.join(CHECKPOINT_DIRECTORY, "{}.pickle".format(name if slot == 0 else
+                                                                         "{}.{}".format(name, slot)))
+
+            try:
+                os.makedirs(CHECKPOINT_DIRECTORY, exist_ok=True)
+
+                lock_file = open("{}.lock".format(path), "a")
+            except OSError as error:
+                print("[CHECKPOINT] Error while locking checkpoint {}".format(path), error)
+
+                return path
+
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Used by another running process
+                lock_file.close()
+
+                slot += 1
+
+                continue
+
+            # The lock is held until the process exits
+            self.lock_file = lock_file
+
+            return path
+
+    def load(self):
+        if self.key is None:
+            return None
+
+        try:
+            with open(self.path, "rb") as checkpoint_file:
+                checkpoint = pickle.load(checkpoint_file)
+        except FileNotFoundError:
+            return None
+        except Exception as error:
+            print("[CHECKPOINT] Error while loading checkpoint {}".format(self.path), error)
+
+            return None
+
+        if not isinstance(checkpoint, dict) or checkpoint.get("key") != self.key:
+            print("[CHECKPOINT] Ignoring checkpoint {} of another crawl".format(self.path))
+
+            return None
+
+        return checkpoint.get("state")
+
+    """
+        The state is written to a temporary file which then replaces the checkpoint, so that a crash while saving never
+        leaves a broken checkpoint behind
+    """
+
+    def save(self, state):
+        temporary_path = "{}.tmp".format(self.path)
+
+        try:
+            os.makedirs(CHECKPOINT_DIRECTORY, exist_ok=True)
+
+            with open(temporary_path, "wb") as checkpoint_file:
+                pickle.dump({"key": self.key, "state": state}, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+            os.replace(temporary_path, self.path)
+        except Exception as error:
+            print("[CHECKPOINT] Error while saving checkpoint {}".format(self.path), error)
+
+        self.last_saved_at = time.time()
+
+    """
+        get_state is only called when the checkpoint is due, so collecting the state costs nothing between checkpoints
+    """
+
+    def save_if_due(self, get_state):
+        if time.time() - self.last_saved_at >= CHECKPOINT_INTERVAL:
+            self.save(get_state())
+
+    """
+        Checkpoints are only valid for the database they were created with
+    """
+
+    @staticmethod
+    def clear_all():
+        shutil.rmtree(CHECKPOINT_DIRECTORY, ignore_errors=True)
+
+
+"""
+    Name and key of the checkpoint of a crawler process: processes on one host (also of different crawlers), crawls
+    of different databases and the generations of a crawl before and after a reset never share a checkpoint
+"""
+
+
+def checkpoint_name_and_key(prefix, crawl_identity, index):
+    hostname = socket.gethostname()
+
+    key = "{}|{}|{}".format(hostname, crawl_identity, index)
+
+    crawl_hash = hashlib.sha1(str(crawl_identity).encode("utf-8")).hexdigest()[:12]
+
+    name = "{}_{}_{}_{}".format(prefix, hostname, crawl_hash, index)
+
+    return name, (key if crawl_identity is not None else None)
@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+from datetime import datetime
+from database_handler import DatabaseHandler
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.csv
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+"""
+    Exports the page metadata, the link graph and the sites into columnar files (Parquet or Arrow) for offline analysis
+    (PageRank, site statistics, ...), so that the whole graph can be analysed without querying the crawl database
+
+    The tables are streamed with COPY ... TO STDOUT and converted to record batches in chunks, so the memory use does not
+    depend on the size of the crawl. Page types are dictionary encoded and the links are two int32 columns (an edge
+    list of page ids)
+
+    Requires pyarrow (pip install pyarrow)
+
+    Usage: python columnar_export.py --output-directory analytics --format parquet
+"""
+
+OUTPUT_DIRECTORY = "analytics"
+
+# Number of bytes of COPY output which are converted into one record batch (row group)
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# Values of the dictionary encoded columns (the codes of crawldb.sql). Every record batch uses the same dictionary, an
+# Arrow file can not replace the dictionary of a column between batches
+DICTIONARY_CODES = {
+    "page_type_code": ("HTML", "BINARY", "IMAGE", "DUPLICATE", "FRONTIER", "DISALLOWED", "ERROR"),
+    "bootstrap_status": ("PENDING", "READY")
+}
+
+"""
+    Timestamps are exported as microseconds since the epoch, which are parsed as int64 and cast to timestamps, that
+    avoids depending on the timestamp text format of the server
+"""
+
+
+def epoch_microseconds(column):
+    return "(EXTRACT(EPOCH FROM {0}) * 1000000)::bigint AS {0}".format(column)
+
+
+def code_dictionary():
+    return pyarrow.dictionary(pyarrow.int8(), pyarrow.string())
+
+
+"""
+    The exported tables, every table has the COPY query and the schema of the output file
+"""
+
+
+def export_tables():
+    return {
+        "pages": (
+            """
+                SELECT id, site_id, page_type_code, url, http_status_code, {}, {}, priority, page_rank
+                FROM crawldb.page
+            """.format(epoch_microseconds("accessed_time"), epoch_microseconds("added_at_time")),
+            pyarrow.schema([
+                ("id", pyarrow.int32()),
+                ("site_id", pyarrow.int32()),
+                ("page_type_code", code_dictionary()),
+                ("url", pyarrow.string()),
+                ("http_status_code", pyarrow.int16()),
+                ("accessed_time", pyarrow.timestamp("us")),
+                ("added_at_time", pyarrow.timestamp("us")),
+                ("priority", pyarrow.float32()),
+                ("page_rank", pyarrow.float32())
+            ])
+        ),
+        "links": (
+            """
+                SELECT from_page, to_page
+                FROM crawldb.link
+            """,
+            pyarrow.schema([
+                ("from_page", pyarrow.int32()),
+                ("to_page", pyarrow.int32())
+            ])
+        ),
+        "sites": (
+            """
+                SELECT id, domain, {}, bootstrap_status
+                FROM crawldb.site
+            """.format(epoch_microseconds("last_crawled_at")),
+            pyarrow.schema([
+                ("id", pyarrow.int32()),
+                ("domain", pyarrow.string()),
+                ("last_crawled_at", pyarrow.timestamp("us")),
+                ("bootstrap_status", code_dictionary())
+            ])
+        )
+    }
+
+
+"""
+    Dictionary encode a column of codes with the fixed dictionary of the column, codes which are not in the dictionary
+    are an error (a new code in crawldb.sql has to be added to DICTIONARY_CODES)
+"""
+
+
+def encode_codes(column, field):
+    dictionary = pyarrow.array(DICTIONARY_CODES[field.name], field.type.value_type)
+
+    column = column.combine_chunks() if isinstance(column, pyarrow.ChunkedArray) else column
+
+    indices = pyarrow.compute.index_in(column, value_set=dictionary)
+
+    if indices.null_count != column.null_count:
+        unknown_codes = pyarrow.compute.filter(column, pyarrow.compute.and_(pyarrow.compute.is_null(indices),
+                                                                             pyarrow.compute.is_valid(column)))
+
+        raise ValueError("Unknown {} codes {}".format(field.name, unknown_codes.unique().to_pylist()))
+
+    return pyarrow.DictionaryArray.from_arrays(indices.cast(field.type.index_type), dictionary)
+
+
+def read_type(field_type):
+    if pyarrow.types.is_timestamp(field_type):
+        return pyarrow.int64()
+
+    if pyarrow.types.is_dictionary(field_type):
+        return field_type.value_type
+
+    return field_type
+
+
+class ColumnarWriter:
+    """
+        File-like object which receives the csv output of COPY, every CHUNK_SIZE bytes the complete lines are parsed
+        into a record batch and appended to the Parquet (or Arrow) file
+
+        The csv lines are split on newlines, which is safe because none of the exported columns contain newlines
+    """
+
+    def __init__(self, path, schema, file_format, chunk_size=CHUNK_SIZE):
+        self.path = path
+
+        self.schema = schema
+
+        self.chunk_size = chunk_size
+
+        self.buffer = bytearray()
+
+        self.number_of_rows = 0
+
+        # The csv reader only supports some types, the columns are read as these types and cast to the schema afterwards
+        self.read_types = {field.name: read_type(field.type) for field in schema}
+
+        # The file is written under a temporary name and only replaces the previous export when it is complete
+        if file_format == "parquet":
+            self.writer = pyarrow.parquet.ParquetWriter(path + ".tmp", schema, compression="zstd")
+        else:
+            self.writer = pyarrow.ipc.new_file(path + ".tmp", schema)
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        self.buffer += data
+
+        if len(self.buffer) >= self.chunk_size:
+            end = self.buffer.rfind(b"\n") + 1
+
+            if end > 0:
+                self.write_rows(bytes(self.buffer[:end]))
+
+                del self.buffer[:end]
+
+        return len(data)
+
+    def write_rows(self, rows):
+        table = pyarrow.csv.read_csv(
+            pyarrow.py_buffer(rows),
+            read_options=pyarrow.csv.ReadOptions(column_names=self.schema.names),
+            convert_options=pyarrow.csv.ConvertOptions(
+                column_types=self.read_types,
+                null_values=[""],
+                strings_can_be_null=True,
+                quoted_strings_can_be_null=False
+            )
+        )
+
+        for index, field in enumerate(self.schema):
+            if pyarrow.types.is_dictionary(field.type):
+                table = table.set_column(index, field, encode_codes(table.column(index), field))
+
+        table = table.cast(self.schema)
+
+        self.writer.write_table(table)
+
+        self.number_of_rows += table.num_rows
+
+    """
+        Write the remaining rows and close the temporary file, returns False when it could not be written. Without
+        complete the rows are not written (the export failed)
+    """
+
+    def close(self, complete=True):
+        try:
+            if complete and self.buffer:
+                self.write_rows(bytes(self.buffer))
+
+            self.buffer = bytearray()
+
+            self.writer.close()
+
+            return complete
+        except Exception as error:
+            print("[COLUMNAR EXPORT] Error while writing {}".format(self.path), error)
+
+            return False
+
+    """
+        The complete file replaces the previous export, the temporary file of a failed export is removed
+    """
+
+    def finish(self, exported):
+        if exported:
+            os.replace(self.path + ".tmp", self.path)
+        elif os.path.exists(self.path + ".tmp"):
+            os.remove(self.path + ".tmp")
+
+
+def export(database_handler, output_directory, file_format, chunk_size=CHUNK_SIZE):
+    os.makedirs(output_directory, exist_ok=True)
+
+    extension = "parquet" if file_format == "parquet" else "arrow"
+
+    writers = {}
+
+    copies = []
+
+    for name, (query, schema) in export_tables().items():
+        writers[name] = ColumnarWriter(os.path.join(output_directory, "{}.{}".format(name, extension)), schema,
+                                       file_format, chunk_size)
+
+        copies.append((query, writers[name]))
+
+    exported = database_handler.copy_queries_to(copies)
+
+    # Every file has to be complete, the files of one export come from the same snapshot
+    exported = all([writer.close(exported) for writer in writers.values()])
+
+    for writer in writers.values():
+        writer.finish(exported)
+
+    if not exported:
+        print("[COLUMNAR EXPORT] Export failed, the previous files are kept")
+
+        return False
+
+    # The manifest describes the export, so the analysis knows when the snapshot was taken
+    manifest = {
+        "created_at": datetime.now().isoformat(),
+        "format": file_format,
+        "tables": {
+            name: {
+                "file": "{}.{}".format(name, extension),
+                "rows": writer.number_of_rows,
+                "schema": ["{}: {}".format(field.name, field.type) for field in writer.schema]
+            } for name, writer in writers.items()
+        }
+    }
+
+    with open(os.path.join(output_directory, "manifest.json"), "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+    for name, writer in writers.items():
+        print("[COLUMNAR EXPORT] Exported {} {} rows".format(writer.number_of_rows, name))
+
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export pages, links and sites to columnar files")
+
+    parser.add_argument("--output-directory", default=OUTPUT_DIRECTORY)
+    parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="bytes of COPY output converted into one record batch")
+
+    arguments = parser.parse_args()
+
+    if pyarrow is None:
+        print("[COLUMNAR EXPORT] pyarrow is not installed (pip install pyarrow)")
+
+        return
+
+    database_handler = DatabaseHandler(1, 1)
+
+    export(database_handler, arguments.output_directory, arguments.format, arguments.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import binascii
+import re
+
+from bs4 import BeautifulSoup, Comment
+
+"""
+    Extracts the main content of a page before it is shingled, so that the navigation, footers and cookie banners which
+    every page of a site repeats do not make all of its pages look alike
+
+    The page is split into text blocks (the text of the nearest block element). Blocks which are mostly links (menus),
+    blocks in elements which are boilerplate by their tag or class (nav, footer, cookie banners) and blocks of the site
+    template are dropped, short blocks are only kept next to long ones (headings, short paragraphs of the content)
+
+    The template of a site is learned from its first TEMPLATE_PAGES pages: blocks which appear on at least
+    TEMPLATE_BLOCK_RATIO of them (and on at least TEMPLATE_MIN_PAGES pages) are template blocks
+"""
+
+# Elements without any visible content
+REMOVED_TAGS = ("script", "style", "noscript", "template", "svg", "iframe", "head", "select", "button")
+
+# Elements which never hold the main content
+BOILERPLATE_TAGS = ("nav", "footer", "aside")
+
+# Elements with one of these words in their id or class (whole words of a token, e. g. "main-menu" or "cookie_bar",
+# but not "menuitem-title" or the state classes like "has-sidebar") are boilerplate
+BOILERPLATE_PATTERN = re.compile(r"^(?!(?:has|is|with|no|show|hide|open)[-_])(?:[\w-]*[-_])?"
+                                 r"(?:cookies?|consent|gdpr|breadcrumbs?|navbar|menu|sidebar|footer|skip-?links?)"
+                                 r"(?:[-_](?:bar|banner|box|wrapper|container|nav|links?|top|main|left|right))?$",
+                                 re.IGNORECASE)
+
+# The page containers are never removed by their class (e. g. <body class="has-sidebar">)
+CONTAINER_TAGS = frozenset(("html", "body", "main", "article"))
+
+# The text of a block is the text of its nearest ancestor with one of these tags
+BLOCK_TAGS = frozenset(("p", "div", "li", "td", "th", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article",
+                        "main", "header", "blockquote", "pre", "dd", "dt", "tr", "table", "ul", "ol", "form", "body",
+                        "figcaption", "address"))
+
+# Blocks with fewer words are short, they are kept only next to a kept long block
+MIN_BLOCK_WORDS = 10
+
+# Blocks with more of their text in links are navigation
+MAX_LINK_DENSITY = 0.5
+
+# Number of pages of a site from which its template is learned
+TEMPLATE_PAGES = 20
+
+# A block is in the template when it is on this fraction of the learned pages ...
+TEMPLATE_BLOCK_RATIO = 0.5
+
+# ... and on at least this many of them
+TEMPLATE_MIN_PAGES = 3
+
+# Below this many words the main content is not trusted and the whole text of the page is used
+MIN_CONTENT_WORDS = 10
+
+
+"""
+    Fingerprint of a block, the crc32 of its lowercase text with normalized whitespace
+"""
+
+
+def block_fingerprint(text):
+    return binascii.crc32(" ".join(text.lower().split()).encode("utf-8", "surrogatepass")) & 0xffffffff
+
+
+def is_boilerplate_element(element):
+    if element.name in BOILERPLATE_TAGS:
+        return True
+
+    if element.name in CONTAINER_TAGS:
+        return False
+
+    tokens = [element.get("id") or ""] + (element.get("class") or [])
+
+    return any(BOILERPLATE_PATTERN.match(token) for token in tokens if token)
+
+
+"""
+    Text blocks of the page in document order, as [text, number of words, number of characters in links] lists
+"""
+
+
+def text_blocks(soup):
+    blocks = {}
+
+    for string in soup.find_all(string=True):
+        if isinstance(string, Comment):
+            continue
+
+        text = string.strip()
+
+        if not text:
+            continue
+
+        block_element = None
+
+        in_link = False
+
+        for parent in string.parents:
+            if parent.name == "a":
+                in_link = True
+
+            if parent.name in BLOCK_TAGS:
+                block_element = parent
+
+                break
+
+        block = blocks.get(id(block_element))
+
+        if block is None:
+            block = blocks[id(block_element)] = [[], 0, 0]
+
+        block[0].append(text)
+
+        if in_link:
+            block[2] += len(text)
+
+    return [[" ".join(texts), len(" ".join(texts).split()), link_characters]
+            for texts, _, link_characters in blocks.values()]
+
+
+"""
+    Main content text of the page and the fingerprints of all of its blocks (used to learn the site template), blocks
+    whose fingerprints are in template are dropped
+"""
+
+
+def extract_main_content(html_content, template=frozenset()):
+    soup = BeautifulSoup(html_content, "html.parser")
+
+    for element in soup.find_all(REMOVED_TAGS):
+        element.decompose()
+
+    page_text = soup.get_text(" ")
+
+    for element in soup.find_all(is_boilerplate_element):
+        if not element.decomposed:
+            element.decompose()
+
+    blocks = text_blocks(soup)
+
+    fingerprints = [block_fingerprint(text) for text, _, _ in blocks]
+
+    # True (content), False (boilerplate) or None (short, decided by its neighbours)
+    classes = []
+
+    for (text, number_of_words, link_characters), fingerprint in zip(blocks, fingerprints):
+        if fingerprint in template or link_characters > MAX_LINK_DENSITY * len(text):
+            classes.append(False)
+        elif number_of_words < MIN_BLOCK_WORDS:
+            classes.append(None)
+        else:
+            classes.append(True)
+
+    kept_texts = []
+
+    for index, block_class in enumerate(classes):
+        if block_class is None:
+            block_class = nearest_class(classes, index, -1) or nearest_class(classes, index, 1)
+
+        if block_class:
+            kept_texts.append(blocks[index][0])
+
+    content = " ".join(kept_texts)
+
+    if len(content.split()) < MIN_CONTENT_WORDS:
+        # Pages with little text (e. g. lists of documents) are compared by all of their text
+        content = page_text
+
+    return content, set(fingerprints)
+
+
+def nearest_class(classes, index, step):
+    index += step
+
+    while 0 <= index < len(classes):
+        if classes[index] is not None:
+            return classes[index]
+
+        index += step
+
+    return False
+
+
+class SiteTemplate:
+    """
+        Blocks repeated on the pages of a site, learned from the block fingerprints of its first TEMPLATE_PAGES pages
+    """
+
+    def __init__(self):
+        self.number_of_pages = 0
+
+        self.block_counts = {}
+
+        self.fingerprints = frozenset()
+
+    def is_learned(self):
+        return self.number_of_pages >= TEMPLATE_PAGES
+
+    def learn(self, block_fingerprints):
+        if self.is_learned():
+            return
+
+        self.number_of_pages += 1
+
+        for fingerprint in block_fingerprints:
+            self.block_counts[fingerprint] = self.block_counts.get(fingerprint, 0) + 1
+
+        min_pages = max(TEMPLATE_MIN_PAGES, TEMPLATE_BLOCK_RATIO * self.number_of_pages)
+
+        self.fingerprints = frozenset(fingerprint for fingerprint, count in self.block_counts.items()
+                                      if count >= min_pages)
+
+        if self.is_learned():
+            # Only the template is needed from now on
+            self.block_counts = {}
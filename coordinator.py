@@ -0,0 +1,137 @@
+import bisect
+import hashlib
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+# Number of points each worker gets on the hash ring, more points spread the domains more evenly
+VIRTUAL_NODES = 64
+
+# How often a worker tells the database that it is still alive (seconds)
+HEARTBEAT_INTERVAL = 10
+
+# A worker without a heartbeat for this long is considered dead and its pages are returned to the frontier (seconds)
+WORKER_TIMEOUT = 60
+
+# How often the ring of live workers is rebuilt and the leases of dead workers are released (seconds)
+RING_REFRESH_INTERVAL = 30
+
+
+class ConsistentHashRing:
+    """
+        Maps keys (domains) to nodes (worker ids), adding or removing a node only moves the keys of that node
+    """
+
+    def __init__(self, nodes=(), virtual_nodes=VIRTUAL_NODES):
+        self.virtual_nodes = virtual_nodes
+
+        self.ring = []
+
+        self.ring_nodes = []
+
+        self.set_nodes(nodes)
+
+    def set_nodes(self, nodes):
+        points = []
+
+        for node in nodes:
+            for replica in range(self.virtual_nodes):
+                points.append((self.hash_key("{}:{}".format(node, replica)), node))
+
+        points.sort()
+
+        self.ring = [point[0] for point in points]
+
+        self.ring_nodes = [point[1] for point in points]
+
+    def get_node(self, key):
+        if not self.ring:
+            return None
+
+        index = bisect.bisect(self.ring, self.hash_key(key)) % len(self.ring)
+
+        return self.ring_nodes[index]
+
+    @staticmethod
+    def hash_key(key):
+        return int(hashlib.md5(str(key).encode('utf-8')).hexdigest()[:16], 16)
+
+
+class WorkerCoordinator:
+    """
+        Registers the crawler process as a worker in the database, keeps its heartbeat alive and decides which domains
+        belong to it. The coordination is done through the database only, so workers can run on any number of nodes
+    """
+
+    def __init__(self, database_handler):
+        self.database_handler = database_handler
+
+        self.worker_id = None
+
+        self.ring = ConsistentHashRing()
+
+        self.stop_event = threading.Event()
+
+        self.heartbeat_thread = None
+
+    def register(self):
+        self.worker_id = self.database_handler.register_worker(socket.gethostname(), os.getpid())
+
+        self.refresh_ring()
+
+        self.heartbeat_thread = threading.Thread(target=self.send_heartbeats, daemon=True)
+        self.heartbeat_thread.start()
+
+        return self.worker_id
+
+    """
+        Runs in a background thread, besides the heartbeat it periodically releases the leases of dead workers and
+        rebuilds the ring, so that domains of dead workers move to the live ones
+    """
+
+    def send_heartbeats(self):
+        last_refresh = time.time()
+
+        while not self.stop_event.wait(HEARTBEAT_INTERVAL):
+            self.database_handler.update_worker_heartbeat(self.worker_id)
+
+            if time.time() - last_refresh >= RING_REFRESH_INTERVAL:
+                released_pages = self.database_handler.release_dead_worker_leases(WORKER_TIMEOUT)
+
+                if released_pages:
+                    print("[COORDINATOR] Released {} pages of dead workers".format(released_pages))
+
+                self.refresh_ring()
+
+                last_refresh = time.time()
+
+    def refresh_ring(self):
+        live_workers = self.database_handler.fetch_live_workers(WORKER_TIMEOUT)
+
+        if self.worker_id is not None and self.worker_id not in live_workers:
+            live_workers.append(self.worker_id)
+
+        self.ring.set_nodes(live_workers)
+
+    """
+        Host affinity, a domain always belongs to the same live worker, so its politeness and robots cache stay local
+    """
+
+    def owns_url(self, url):
+        return self.ring.get_node(urlparse(url).netloc) == self.worker_id
+
+    def claim_page(self):
+        return self.database_handler.claim_page_from_frontier(self.worker_id, self.owns_url)
+
+    def claim_revisit_page(self):
+        return self.database_handler.claim_page_for_revisit(self.worker_id)
+
+    def stop(self):
+        self.stop_event.set()
+
+        if self.heartbeat_thread is not None:
+            self.heartbeat_thread.join()
+
+        self.database_handler.stop_worker(self.worker_id)
@@ -19,8 +19,19 @@ CREATE TABLE crawldb.site
   robots_content  text,
   sitemap_content text,
   last_crawled_at timestamp,
+  bootstrap_status     varchar(20) NOT NULL DEFAULT 'READY',
+  bootstrap_started_at timestamp,
+  max_pages            integer,
+  max_bytes            bigint,
+  max_render_seconds   real,
+  crawl_weight         real NOT NULL DEFAULT 1,
+  queued_pages         integer NOT NULL DEFAULT 0,
+  crawled_pages        integer NOT NULL DEFAULT 0,
+  crawled_bytes        bigint NOT NULL DEFAULT 0,
+  render_seconds       real NOT NULL DEFAULT 0,
   CONSTRAINT pk_site_id PRIMARY KEY (id),
-  CONSTRAINT unq_site_idx UNIQUE ("domain")
+  CONSTRAINT unq_site_idx UNIQUE ("domain"),
+  CONSTRAINT chk_site_crawl_weight CHECK (crawl_weight > 0)
 );
 
 CREATE TABLE crawldb.page
@@ -35,6 +46,16 @@ CREATE TABLE crawldb.page
   accessed_time     timestamp,
   added_at_time     timestamp,
   active_in_crawler boolean,
+  worker_id         integer,
+  etag              varchar(500),
+  last_modified     varchar(100),
+  change_rate       real,
+  visit_count       integer,
+  next_visit_at     timestamp,
+  priority          real NOT NULL DEFAULT 0.5,
+  page_rank         real,
+  search_vector     tsvector,
+  indexed_at        timestamp,
   CONSTRAINT pk_page_id PRIMARY KEY (id),
   CONSTRAINT unq_url_idx UNIQUE (url)
 );
@@ -43,6 +64,43 @@ CREATE INDEX "idx_page_site_id" ON crawldb.page (site_id);
 
 CREATE INDEX "idx_page_page_type_code" ON crawldb.page (page_type_code);
 
+CREATE INDEX "idx_page_worker_id" ON crawldb.page (worker_id);
+
+CREATE INDEX "idx_page_frontier" ON crawldb.page (priority DESC, added_at_time)
+  WHERE page_type_code = 'FRONTIER' AND active_in_crawler IS NULL;
+
+CREATE INDEX "idx_page_site_frontier" ON crawldb.page (site_id, priority DESC, added_at_time)
+  WHERE page_type_code = 'FRONTIER' AND active_in_crawler IS NULL;
+
+CREATE INDEX "idx_page_search_vector" ON crawldb.page USING GIN (search_vector);
+
+CREATE INDEX "idx_page_unindexed" ON crawldb.page (id)
+  WHERE page_type_code = 'HTML' AND indexed_at IS NULL;
+
+CREATE INDEX "idx_page_next_visit_at" ON crawldb.page (next_visit_at)
+  WHERE next_visit_at IS NOT NULL;
+
+CREATE INDEX "idx_page_accessed_time" ON crawldb.page (accessed_time);
+
+CREATE TABLE crawldb.crawl
+(
+  id         integer NOT NULL DEFAULT 1,
+  generation integer NOT NULL DEFAULT 1,
+  CONSTRAINT pk_crawl_id PRIMARY KEY (id),
+  CONSTRAINT chk_crawl_single_row CHECK (id = 1)
+);
+
+CREATE TABLE crawldb.worker
+(
+  id           serial NOT NULL,
+  hostname     varchar(255),
+  pid          integer,
+  started_at   timestamp,
+  heartbeat_at timestamp,
+  stopped_at   timestamp,
+  CONSTRAINT pk_worker_id PRIMARY KEY (id)
+);
+
 CREATE TABLE crawldb.page_data
 (
   id             serial NOT NULL,
@@ -66,6 +124,17 @@ CREATE TABLE crawldb.content_hash
     CONSTRAINT pk_content_hash_id PRIMARY KEY (id)
 );
 
+CREATE INDEX "idx_content_hash_page_id" ON crawldb.content_hash (page_id);
+
+CREATE TABLE crawldb.content_digest
+(
+    digest  bytea NOT NULL,
+    page_id integer NOT NULL,
+    CONSTRAINT pk_content_digest PRIMARY KEY (digest)
+);
+
+CREATE INDEX "idx_content_digest_page_id" ON crawldb.content_digest (page_id);
+
 CREATE TABLE crawldb.image
 (
   id            serial NOT NULL,
@@ -75,11 +144,33 @@ CREATE TABLE crawldb.image
   "data"        bytea,
   data_size      integer,
   accessed_time timestamp,
+  duplicate_of  integer,
   CONSTRAINT pk_image_id PRIMARY KEY (id)
 );
 
 CREATE INDEX "idx_image_page_id" ON crawldb.image (page_id);
 
+CREATE INDEX "idx_image_duplicate_of" ON crawldb.image (duplicate_of);
+
+CREATE TABLE crawldb.image_hash
+(
+    image_id   integer NOT NULL,
+    hash       bigint,
+    mean_color integer,
+    digest     bytea NOT NULL,
+    CONSTRAINT pk_image_hash PRIMARY KEY (image_id)
+);
+
+CREATE INDEX "idx_image_hash_digest" ON crawldb.image_hash (digest);
+
+CREATE INDEX "idx_image_hash_band_0" ON crawldb.image_hash (((hash >> 48) & 65535));
+
+CREATE INDEX "idx_image_hash_band_1" ON crawldb.image_hash (((hash >> 32) & 65535));
+
+CREATE INDEX "idx_image_hash_band_2" ON crawldb.image_hash (((hash >> 16) & 65535));
+
+CREATE INDEX "idx_image_hash_band_3" ON crawldb.image_hash ((hash & 65535));
+
 CREATE TABLE crawldb.link
 (
   from_page integer NOT NULL,
@@ -91,9 +182,18 @@ CREATE INDEX "idx_link_from_page" ON crawldb.link (from_page);
 
 CREATE INDEX "idx_link_to_page" ON crawldb.link (to_page);
 
+ALTER TABLE crawldb.content_digest
+  ADD CONSTRAINT fk_content_digest_page FOREIGN KEY (page_id) REFERENCES crawldb.page (id) ON DELETE RESTRICT;
+
 ALTER TABLE crawldb.image
   ADD CONSTRAINT fk_image_page_data FOREIGN KEY (page_id) REFERENCES crawldb.page (id) ON DELETE RESTRICT;
 
+ALTER TABLE crawldb.image
+  ADD CONSTRAINT fk_image_duplicate_of FOREIGN KEY (duplicate_of) REFERENCES crawldb.image (id) ON DELETE RESTRICT;
+
+ALTER TABLE crawldb.image_hash
+  ADD CONSTRAINT fk_image_hash_image FOREIGN KEY (image_id) REFERENCES crawldb.image (id) ON DELETE RESTRICT;
+
 ALTER TABLE crawldb.link
   ADD CONSTRAINT fk_link_page FOREIGN KEY (from_page) REFERENCES crawldb.page (id) ON DELETE RESTRICT;
 
@@ -106,6 +206,9 @@ ALTER TABLE crawldb.page
 ALTER TABLE crawldb.page
   ADD CONSTRAINT fk_page_page_type FOREIGN KEY (page_type_code) REFERENCES crawldb.page_type (code) ON DELETE RESTRICT;
 
+ALTER TABLE crawldb.page
+  ADD CONSTRAINT fk_page_worker FOREIGN KEY (worker_id) REFERENCES crawldb.worker (id) ON DELETE SET NULL;
+
 ALTER TABLE crawldb.page_data
   ADD CONSTRAINT fk_page_data_page FOREIGN KEY (page_id) REFERENCES crawldb.page (id) ON DELETE RESTRICT;
 
@@ -126,4 +229,7 @@ VALUES ('HTML'),
        ('DUPLICATE'),
        ('FRONTIER'),
        ('DISALLOWED'),
-       ('ERROR');
\ No newline at end of file
+       ('ERROR');
+
+INSERT INTO crawldb.crawl
+VALUES (1, 1);
@@ -1,4 +1,4 @@
-from multiprocessing import Process, Lock
+from multiprocessing import Process, Event, Queue
 import requests
 from selenium import webdriver
 from bs4 import BeautifulSoup
@@ -6,17 +6,31 @@ from urllib.parse import urlparse, quote
 from datetime import datetime, timedelta
 from robotparser import RobotFileParser
 from database_handler import DatabaseHandler
-import re
+import os
+import signal
 import time
 import hashlib
 import binascii
-from hash_driver import HashDriver
-
-# Create a global database handler for all processes to share
-database_handler = DatabaseHandler(0, 100)
-
-# Create a global hash driver for creating page signatures
-hash_driver = HashDriver()
+from hash_driver import HashDriver, DigestCache
+from hash_service import HashService, HASH_SERVICE_WORKERS
+from coordinator import WorkerCoordinator, WORKER_TIMEOUT
+from checkpoint import Checkpoint, checkpoint_name_and_key
+from supervisor import Supervisor
+from metrics import metrics, MetricsAggregator
+from revisit_scheduler import schedule_next_visit
+from site_discovery import SiteDiscovery, SITE_READY, SITE_DISCOVERY_THREADS
+from link_extractor import ExtractedLinks, canonicalize_url
+from script_link_scanner import ScriptLinkScanner, load_known_bundle_hashes
+from dns_resolver import DnsResolver, create_shared_state
+from content_extractor import SiteTemplate
+from trap_detector import TrapDetector
+
+# Connections of the database pool of one process: the crawl (adding pages to the frontier also links them on a second
+# connection), the worker heartbeat and the site discovery threads
+DATABASE_CONNECTIONS_PER_PROCESS = 3 + SITE_DISCOVERY_THREADS
+
+# Create a global database handler, every process opens its own connection pool on first use
+database_handler = DatabaseHandler(0, DATABASE_CONNECTIONS_PER_PROCESS)
 
 # https://developer.mozilla.org/en-US/docs/Web/HTTP/Basics_of_HTTP/MIME_types/Complete_list_of_MIME_types
 CONTENT_TYPES = {
@@ -49,17 +63,80 @@ MAX_NUMBER_OF_RETRIES = 5
 # Delay for retrying to fetch a page from the frontier
 DELAY = 10
 
+# Longest wait of a recrawling process for the next scheduled revisit when the frontier is empty (seconds)
+MAX_REVISIT_WAIT = 60
+
 # Upper similarity limit of two document [0,1]
 MAX_SIMILARITY = 0.95
 
+# Command line arguments of the chrome browser (e. g. the benchmarks add a proxy)
+CHROME_ARGUMENTS = ["headless"]
+
+# Maximum number of urls (and their page ids) a crawler process remembers, the seen urls are cleared when it is reached
+MAX_SEEN_URLS = 100000
+
 class Crawler:
-    def __init__(self, number_of_processes):
+    """
+        When join_existing_crawl is set the crawler does not add the seed pages and does not reset the frontier, it only
+        adds its workers to a crawl that is already running (possibly on other nodes)
+
+        The supervisor keeps the number of crawler processes between min_processes and max_processes (both default to
+        number_of_processes, which disables scaling) and restarts the crashed ones
+
+        When recrawl is set the crawler processes revisit the already crawled html pages when they are due (see
+        revisit_scheduler.py) and the frontier is empty, they keep running while revisits are scheduled
+
+        hash_service_workers is the number of hash worker processes of every crawler process
+    """
+
+    def __init__(self, number_of_processes, join_existing_crawl=False, min_processes=None, max_processes=None,
+                 metrics_port=None, recrawl=False, hash_service_workers=None):
         self.number_of_processes = number_of_processes
 
-        self.lock = Lock()
+        self.recrawl = recrawl
+
+        self.metrics_port = metrics_port
+
+        self.min_processes = min_processes or number_of_processes
+
+        self.max_processes = max(max_processes or number_of_processes, number_of_processes)
+
+        """
+            Every crawler process owns its own hash service. Unless it is set explicitly, its size is fixed from the
+            cores and the most processes the supervisor may run, so growing never starts more hash workers than cores
+        """
+        self.hash_service_workers = hash_service_workers or max(1, HASH_SERVICE_WORKERS // self.max_processes)
+
+        """
+            processes maps the index of a crawler process to its Process, retired_processes holds the indexes of the
+            processes the supervisor asked to stop and failed_processes the indexes it gave up restarting
+        """
+        self.processes = {}
+
+        self.retired_processes = set()
+
+        self.failed_processes = set()
+
+        self.stop_event = None
+
+        self.metrics_queue = None
+
+        """
+            dns_state is the resolver cache and the server schedules shared by the crawler processes, it lives in the
+            process of dns_manager
+        """
+        self.dns_manager = None
+
+        self.dns_state = None
 
         start = time.time()
 
+        if join_existing_crawl:
+            # Other workers may still be crawling, so only the pages of dead workers are returned to the frontier
+            database_handler.release_dead_worker_leases(WORKER_TIMEOUT)
+
+            return
+
         with open("seed_pages.txt", "r") as seed_pages:
             for seed_page in seed_pages:
                 if "#" not in seed_page:
@@ -68,20 +145,215 @@ class Crawler:
         # When starting the crawler reset frontier active flags
         database_handler.reset_frontier()
 
+    """
+        Starts the crawler processes and supervises them until they finish. The first SIGINT/SIGTERM asks the processes
+        to finish their current page and stop, the second one terminates them
+    """
+
     def run(self):
+        self.stop_event = Event()
+
+        self.metrics_queue = Queue()
+
+        metrics_aggregator = MetricsAggregator(self.metrics_queue)
+        metrics_aggregator.start(self.metrics_port)
+
+        self.dns_manager, self.dns_state = create_shared_state()
+
         for i in range(self.number_of_processes):
-            p = Process(target=self.create_process, args=[i, self.lock])
-            p.start()
+            self.start_process(i)
+
+        signal.signal(signal.SIGINT, self.handle_shutdown_signal)
+        signal.signal(signal.SIGTERM, self.handle_shutdown_signal)
+
+        supervisor = Supervisor(self, database_handler, metrics_aggregator, self.min_processes, self.max_processes)
+        supervisor.run()
+
+        self.join_processes()
+
+        self.dns_manager.shutdown()
+
+        metrics_aggregator.stop()
+
+        print("[CRAWLER] All crawler processes stopped")
+
+    def handle_shutdown_signal(self, signal_number, frame):
+        if self.stop_event.is_set():
+            print("[CRAWLER] Terminating crawler processes")
+
+            for p in self.processes.values():
+                p.terminate()
+
+            return
+
+        print("[CRAWLER] Shutting down, waiting for the crawler processes to finish their current pages")
+
+        self.stop_event.set()
+
+    """
+        Start a crawler process, if no index is given the next free one is used
+    """
+
+    def start_process(self, index=None):
+        if index is None:
+            index = 0
+
+            # Crashed processes wait for their restart, failed ones are not started again
+            unavailable = set(self.crashed_processes()) | self.failed_processes
+
+            while index in self.processes and (self.processes[index].is_alive() or index in unavailable):
+                index += 1
+
+        self.retired_processes.discard(index)
+
+        p = Process(target=self.create_process,
+                    args=[index, self.hash_service_workers, self.stop_event, self.metrics_queue, self.recrawl,
+                          self.dns_state])
+        p.start()
+
+        self.processes[index] = p
+
+    """
+        Ask the crawler process with the highest index to finish its current page and stop
+    """
+
+    def retire_process(self):
+        running_indexes = [index for index, p in self.processes.items()
+                           if p.is_alive() and index not in self.retired_processes]
+
+        if not running_indexes:
+            return
 
-    def create_process(self, index, lock):
-        crawler_process = CrawlerProcess(index, lock)
+        index = max(running_indexes)
+
+        self.retired_processes.add(index)
+
+        os.kill(self.processes[index].pid, signal.SIGTERM)
+
+    """
+        Processes which exited with an error (an exception outside of crawl or a killed process), the processes that
+        stopped because the frontier was empty or because they were retired exit normally
+    """
+
+    def crashed_processes(self):
+        return [index for index, p in self.processes.items()
+                if not p.is_alive() and p.exitcode != 0 and index not in self.retired_processes
+                and index not in self.failed_processes]
+
+    """
+        The supervisor gave up restarting the process, its index is not used again
+    """
+
+    def fail_process(self, index):
+        self.failed_processes.add(index)
+
+    def running_process_ids(self):
+        return [p.pid for p in self.processes.values() if p.is_alive()]
+
+    def has_running_processes(self):
+        return any(p.is_alive() for p in self.processes.values())
+
+    def join_processes(self):
+        for p in self.processes.values():
+            p.join()
+
+    def create_process(self, index, hash_service_workers, stop_event, metrics_queue, recrawl, dns_state):
+        crawler_process = CrawlerProcess(index, hash_service_workers, stop_event, metrics_queue, recrawl, dns_state)
 
 
 class CrawlerProcess:
-    def __init__(self, index, lock):
+    def __init__(self, index, hash_service_workers, stop_event, metrics_queue, recrawl, dns_state=None):
         self.current_process_id = index
 
-        self.lock = lock
+        self.recrawl = recrawl
+
+        # The metrics of this process are sent to the aggregator of the Crawler
+        metrics.connect(metrics_queue)
+
+        """
+            stop_event is shared by all the crawler processes and set by the Crawler on shutdown, stop_requested is set
+            when only this process receives SIGTERM
+        """
+        self.stop_event = stop_event
+
+        self.stop_requested = False
+
+        # Ctrl-C is delivered to the whole process group, the Crawler handles it and sets the stop_event
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, self.handle_stop_signal)
+
+        """
+            coordinator registers this process as a worker in the database and claims the pages from the frontier
+        """
+        self.coordinator = WorkerCoordinator(database_handler)
+        self.coordinator.register()
+
+        """
+            hash_driver creates page signatures, the shingling is done in the hash service worker processes
+        """
+        self.hash_driver = HashDriver(HashService(hash_service_workers))
+
+        """
+            digest_cache remembers the content digests this process has recently seen, exact duplicates of them are
+            found without asking the database
+        """
+        self.digest_cache = DigestCache()
+
+        """
+            dns_resolver caches the addresses of the hosts and keeps the politeness delay per server, the requests of
+            the session reuse their connections and connect to the cached addresses
+        """
+        self.dns_resolver = DnsResolver(dns_state)
+        self.dns_resolver.install()
+
+        self.session = requests.Session()
+
+        """
+            site_discovery fetches the robots and sitemaps of new sites in background threads, with the session and
+            the politeness delay of the servers of this process
+        """
+        self.site_discovery = SiteDiscovery(database_handler, self.fetch_robots, self.get_parsed_sitemap_url,
+                                            session=self.session, wait_for_server=self.dns_resolver.wait_for_server)
+
+        """
+            script_link_scanner finds the urls in inline javascript, known library bundles are skipped
+        """
+        self.script_link_scanner = ScriptLinkScanner(load_known_bundle_hashes())
+
+        """
+            checkpoint holds the in-memory state of the process between restarts, it is keyed by the host, the crawl
+            (database) and the index of the process
+        """
+        self.checkpoint = Checkpoint(*checkpoint_name_and_key("crawler_process", database_handler.get_crawl_identity(),
+                                                              index))
+
+        """
+            seen_urls maps the urls this process has already added to the frontier to their page ids, so that only the
+            link has to be inserted when the url is found again
+        """
+        self.seen_urls = {}
+
+        """
+            host_schedules holds the time when this process last crawled each domain (used for the crawl delay)
+        """
+        self.host_schedules = {}
+
+        """
+            sites caches the site objects (with robots content) by domain, so they are not fetched for every page
+        """
+        self.sites = {}
+
+        """
+            site_templates holds the blocks repeated on the pages of a site by domain, they are not shingled
+        """
+        self.site_templates = {}
+
+        """
+            trap_detector keeps the statistics of the url templates of the sites and drops the links of spider traps
+        """
+        self.trap_detector = TrapDetector()
+
+        self.load_checkpoint()
 
         number_of_retries = 0
 
@@ -89,11 +361,13 @@ class CrawlerProcess:
 
         # Create the chrome driver with which we will fetch and parse sites
         chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("headless")
+
+        for chrome_argument in CHROME_ARGUMENTS:
+            chrome_options.add_argument(chrome_argument)
         self.driver = webdriver.Chrome(chrome_options=chrome_options)
 
         """
-            site is a dictionary with all the fields from the database (domain, robots_content, sitemap_content)
+            site is a dictionary with all the fields from the database (domain, robots_content, bootstrap_status)
         """
         self.site = None
 
@@ -110,15 +384,19 @@ class CrawlerProcess:
         """
             current_page is a dictionary with an id (database id for updating) and url field
         """
-        self.current_page = database_handler.get_page_from_frontier(self.lock)
+        self.current_page = None
+
+        if not self.should_stop():
+            self.current_page = self.claim_page()
 
         """
             If a page was fetched from the frontier the crawler can continue, otherwise try again in DELAY seconds
             
             If the frontier is still empty after MAX_NUMBER_OF_RETRIES was reached, we can assume that the frontier is
-            really empty and no crawler process is going to insert new pages
+            really empty and no crawler process is going to insert new pages. A recrawling process does not stop while
+            revisits are scheduled
         """
-        while self.current_page or number_of_retries < MAX_NUMBER_OF_RETRIES:
+        while not self.should_stop() and (self.current_page or number_of_retries < MAX_NUMBER_OF_RETRIES):
             if self.current_page:
                 number_of_retries = 0
 
@@ -127,17 +405,37 @@ class CrawlerProcess:
                 except Exception as error:
                     print("[CRAWLER PROCESS] An unhandled error occurred while parsing page: {}".format(
                         self.current_page["url"]), error)
+
+                    metrics.increment("crawler_unhandled_errors_total")
             else:
                 # No page was fetched from the frontier, try again in DELAY seconds
-                number_of_retries += 1
+                delay = DELAY
+
+                seconds_until_revisit = database_handler.get_seconds_until_next_revisit() if self.recrawl else None
+
+                if seconds_until_revisit is not None:
+                    # A recrawling process waits for the next revisit (new pages are still checked regularly)
+                    delay = min(max(seconds_until_revisit, DELAY), MAX_REVISIT_WAIT)
+                elif not database_handler.has_pending_site_bootstraps():
+                    # Pages of sites which are being bootstrapped are not counted as an empty frontier
+                    number_of_retries += 1
+
+                print("[CRAWLER PROCESS] Frontier is empty, retrying in {:.0f} seconds".format(delay),
+                      self.current_process_id)
+
+                # Wake up early if the crawler is shutting down
+                self.stop_event.wait(delay)
 
-                print("[CRAWLER PROCESS] Frontier is empty, retrying in 10 seconds", self.current_process_id)
+            self.checkpoint.save_if_due(self.get_checkpoint_state)
 
-                time.sleep(DELAY)
+            metrics.flush_if_due()
 
             # Reset all variables after a page was successfully transferred from the frontier
 
-            self.current_page = database_handler.get_page_from_frontier(self.lock)
+            self.current_page = None
+
+            if not self.should_stop():
+                self.current_page = self.claim_page()
 
             self.site = None
 
@@ -147,24 +445,88 @@ class CrawlerProcess:
 
         self.quit()
 
-        print("[STOPPED CRAWLER PROCESS] Frontier is empty after several tries", self.current_process_id)
+        if self.should_stop():
+            print("[STOPPED CRAWLER PROCESS] Shut down", self.current_process_id)
+        else:
+            print("[STOPPED CRAWLER PROCESS] Frontier is empty after several tries", self.current_process_id)
+
+    """
+        New pages from the frontier always come first, due revisits are only claimed when the frontier is empty
+    """
+
+    def claim_page(self):
+        with metrics.timer("crawler_frontier_claim_seconds"):
+            page = self.coordinator.claim_page()
+
+            if page is None and self.recrawl:
+                page = self.coordinator.claim_revisit_page()
+
+            return page
+
+    def handle_stop_signal(self, signal_number, frame):
+        self.stop_requested = True
+
+    def should_stop(self):
+        return self.stop_requested or self.stop_event.is_set()
+
+    def get_checkpoint_state(self):
+        return {
+            "seen_urls": self.seen_urls,
+            "host_schedules": self.host_schedules,
+            "sites": self.sites,
+            "site_templates": self.site_templates,
+            "trap_detector": self.trap_detector
+        }
+
+    def load_checkpoint(self):
+        state = self.checkpoint.load()
+
+        if state is None:
+            return
+
+        self.seen_urls = state.get("seen_urls", {})
+
+        self.host_schedules = state.get("host_schedules", {})
+
+        self.sites = state.get("sites", {})
+
+        self.site_templates = state.get("site_templates", {})
+
+        self.trap_detector = state.get("trap_detector", self.trap_detector)
+
+        print("[CRAWLER PROCESS] Resumed from checkpoint with {} seen urls and {} sites".format(
+            len(self.seen_urls), len(self.sites)), self.current_process_id)
 
     def crawl(self):
         #print(" {} - [CRAWLING PAGE]".format(self.current_process_id), self.current_page["url"])
 
         domain = self.get_domain_url(self.current_page["url"])
 
-        self.site = database_handler.get_site(domain)
+        self.site = self.sites.get(domain)
 
         if self.site is None:
-            self.create_site(domain)
+            self.site = database_handler.get_site(domain)
+
+        if self.site is None or self.site.get("bootstrap_status", SITE_READY) != SITE_READY:
+            # The robots and sitemaps of the site are not known yet, the page is crawled once the site is ready
+            self.current_page["site_id"] = self.site_discovery.discover(domain)
+
+            database_handler.defer_page_until_site_ready(self.current_page)
+
+            metrics.increment("crawler_deferred_pages_total")
+
+            return
+
+        if self.site["robots_content"] is not None:
+            # Create robots_parser from robots.txt saved in the database
+            self.parse_robots(self.site["robots_content"])
         else:
-            if self.site["robots_content"] is not None:
-                # Create robots_parser from robots.txt saved in the database
-                self.parse_robots(self.site["robots_content"])
+            self.robots_parser = None
 
         self.current_page["site_id"] = self.site["id"]
 
+        self.sites[domain] = self.site
+
         self.current_page["accessed_time"] = datetime.now()
 
         if self.allowed_to_crawl_current_page(self.current_page["url"]) is False:
@@ -174,15 +536,52 @@ class CrawlerProcess:
 
             self.current_page["http_status_code"] = 500
 
-            database_handler.remove_page_from_frontier(self.current_page)
+            with metrics.timer("crawler_database_write_seconds", table="page"):
+                database_handler.remove_page_from_frontier(self.current_page)
+
+            metrics.increment("crawler_pages_total", page_type_code=self.current_page["page_type_code"])
 
             return
         else:
             # If a crawl delay is available in robots wait until the page can be crawled then continue
             self.wait_for_crawl_delay_to_elapse()
 
+            # Other sites may be served by the same server
+            self.dns_resolver.wait_for_server(urlparse(self.current_page["url"]).hostname)
+
+            self.host_schedules[domain] = datetime.now()
+
         # The crawler is allowed to crawl the current site, therefore we can perform a request
-        page_response = self.fetch_response(self.current_page["url"])
+        with metrics.timer("crawler_fetch_seconds"):
+            page_response = self.fetch_response(self.current_page["url"], self.get_conditional_request_headers())
+
+        metrics.increment("crawler_fetches_total", host=domain)
+
+        # Counted into the budget of the site
+        self.current_page["content_bytes"] = len(page_response.content) if page_response is not None else 0
+
+        if page_response is None or page_response.status_code >= 400:
+            metrics.increment("crawler_fetch_errors_total", host=domain)
+
+        revisit = self.current_page.get("revisit", False)
+
+        if revisit and (page_response is None or page_response.status_code >= 400):
+            # Keep the stored content when a revisit fails, the page is tried again at its next visit
+            self.finish_revisit("error")
+
+            return
+
+        if page_response is not None:
+            # Validators for the conditional requests of the next visit
+            self.current_page["etag"] = page_response.headers.get("etag")
+
+            self.current_page["last_modified"] = page_response.headers.get("last-modified")
+
+        if revisit and page_response.status_code == 304:
+            # Not modified, there is no body so nothing has to be rendered or hashed
+            self.finish_revisit("not_modified")
+
+            return
 
         if page_response:
             # No errors while fetching the response
@@ -198,37 +597,86 @@ class CrawlerProcess:
             if CONTENT_TYPES["HTML"] in content_type:
                 # We got an HTML page
 
-                html_content = self.fetch_rendered_page_source(self.current_page["url"])
+                render_started_at = time.time()
+
+                with metrics.timer("crawler_render_seconds"):
+                    html_content = self.fetch_rendered_page_source(self.current_page["url"])
+
+                self.current_page["render_seconds"] = time.time() - render_started_at
+
+                content_digest = None
+
+                if html_content is not None:
+                    # sha256 digest of complete html_content
+                    with metrics.timer("crawler_hash_seconds", kind="content"):
+                        content_digest = self.hash_driver.create_content_digest(html_content)
+
+                    if content_digest is not None:
+                        self.current_page["hash_content"] = content_digest.hex()
+
+                if html_content is not None and revisit:
+                    if self.current_page["hash_content"] == self.current_page["previous_hash_content"]:
+                        # The server does not support conditional requests, but the content did not change
+                        self.finish_revisit("unchanged")
+
+                        return
+
+                    # The old signature and digest must not be found as a duplicate of the new content
+                    database_handler.delete_page_signatures(self.current_page["id"])
+
+                    if self.current_page["previous_hash_content"]:
+                        self.digest_cache.discard(bytes.fromhex(self.current_page["previous_hash_content"]))
+
+                    metrics.increment("crawler_revisits_total", result="changed")
 
                 if html_content is not None:
-                    if self.is_duplicate_page(html_content):
+                    site_template = self.site_templates.setdefault(domain, SiteTemplate())
+
+                    # Hash the page in the hash service while the rendered page is parsed with the chrome driver
+                    signature_future = self.hash_driver.submit_page_signature(html_content, site_template.fingerprints)
+
+                    with metrics.timer("crawler_parse_seconds"):
+                        parsed_page = self.parse_page(html_content)
+
+                    is_duplicate = self.is_duplicate_page(content_digest, signature_future, site_template)
+
+                    # Url templates whose pages are mostly duplicates are spider traps
+                    self.trap_detector.record_page(self.current_page["url"], is_duplicate)
+
+                    if is_duplicate:
                         print("     [CRAWLING] Found page duplicate, that has already been parsed: ",
                               self.current_page["url"])
 
                         self.current_page["page_type_code"] = PAGE_TYPES["duplicate"]
 
-                        self.current_page["hash_content"] = hash_driver.create_content_hash(html_content)
-
                     else:
                         # page is not treated as duplicate page - insert hash signature to db
-                        database_handler.insert_page_signatures(self.current_page["id"],
-                                                                self.current_page["hash_signature"])
+                        with metrics.timer("crawler_database_write_seconds", table="content_hash"):
+                            database_handler.insert_page_signatures(self.current_page["id"],
+                                                                    self.current_page["hash_signature"])
 
                         self.current_page["page_type_code"] = PAGE_TYPES["html"]
 
                         self.current_page["html_content"] = html_content
 
-                        self.current_page["hash_content"] = hash_driver.create_content_hash(html_content)
+                        for link in parsed_page.links:
+                            self.add_page_to_frontier_array(link)
+
+                        for image_url in parsed_page.images:
+                            self.add_page_to_frontier_array(image_url)
 
-                        parsed_page = self.parse_page(self.current_page["html_content"])
+                        # Resolve the new hosts before their pages are claimed
+                        self.dns_resolver.prefetch({urlparse(link).hostname for link in parsed_page.links})
 
-                        if len(parsed_page['links']):
-                            for link in parsed_page['links']:
-                                self.add_page_to_frontier_array(link)
+                        for reason, number_of_links in parsed_page.dropped.items():
+                            if number_of_links:
+                                metrics.increment("crawler_dropped_links_total", number_of_links, reason=reason)
+                elif self.should_stop():
+                    # The chrome driver was most likely interrupted by the shutdown, crawl the page again next time
 
-                        if len(parsed_page['images']):
-                            for image_url in parsed_page['images']:
-                                self.add_page_to_frontier_array(image_url)
+                    database_handler.return_page_to_frontier(self.current_page)
+
+                    return
                 else:
                     # An error occurred while rendering page
 
@@ -243,16 +691,25 @@ class CrawlerProcess:
 
                 filename = self.get_image_filename(self.current_page["url"])
 
+                # The perceptual hash is computed in the hash service, near duplicates are stored as references
+                with metrics.timer("crawler_hash_seconds", kind="image"):
+                    image_hash = self.hash_driver.submit_image_hash(page_response.content).result()
+
                 image_data = {
                     "page_id": self.current_page["id"],
                     "content_type": content_type,
                     "data": page_response.content,
                     "data_size": len(page_response.content),
                     "accessed_time": datetime.now(),
-                    "filename": filename
+                    "filename": filename,
+                    "image_hash": image_hash
                 }
 
-                database_handler.insert_image_data(image_data)
+                with metrics.timer("crawler_database_write_seconds", table="image"):
+                    duplicate_of = database_handler.insert_image_data(image_data)
+
+                if duplicate_of is not None:
+                    metrics.increment("crawler_image_duplicates_total")
 
             else:
                 # The crawler detected a non-image binary file
@@ -278,7 +735,8 @@ class CrawlerProcess:
                         "data_size": len(page_response.content)
                     }
 
-                    database_handler.insert_page_data(page_data)
+                    with metrics.timer("crawler_database_write_seconds", table="page_data"):
+                        database_handler.insert_page_data(page_data)
 
         else:
             # An error occurred while fetching page (SSL certificate error, timeout, etc.)
@@ -287,11 +745,21 @@ class CrawlerProcess:
 
             self.current_page["http_status_code"] = 500
 
+        if self.current_page.get("page_type_code") == PAGE_TYPES["html"]:
+            # Only html pages are revisited
+            schedule_next_visit(self.current_page, changed=revisit)
+
         # Update the page in the database, remove FRONTIER type and replace it with the correct one
-        database_handler.remove_page_from_frontier(self.current_page)
+        with metrics.timer("crawler_database_write_seconds", table="page"):
+            database_handler.remove_page_from_frontier(self.current_page)
+
+        # Add all the links from the page to the frontier
+        with metrics.timer("crawler_database_write_seconds", table="link"):
+            database_handler.add_pages_to_frontier(self.pages_to_add_to_frontier)
+
+        metrics.increment("crawler_pages_total", page_type_code=self.current_page["page_type_code"])
 
-        # Add all the links from the page and sitemap to the frontier
-        database_handler.add_pages_to_frontier(self.pages_to_add_to_frontier)
+        self.remember_seen_urls(self.pages_to_add_to_frontier)
 
         #print(" {} - [CRAWLING] Finished crawling".format(self.current_process_id))
 
@@ -300,9 +768,9 @@ class CrawlerProcess:
         (some sites for example require a certificate to connect, some sites timeout, etc.)
     """
 
-    def fetch_response(self, url):
+    def fetch_response(self, url, headers=None):
         try:
-            response = requests.get(url)
+            response = self.session.get(url, headers=headers)
 
             return response
         except requests.exceptions.RequestException as exception:
@@ -311,38 +779,33 @@ class CrawlerProcess:
             return None
 
     """
-        Create a new site object and insert it into the database
+        A revisited page is fetched with the validators of its previous visit, so that the server can answer with
+        304 Not Modified instead of sending the whole page
     """
 
-    def create_site(self, domain):
-        # We need to create a new site object
+    def get_conditional_request_headers(self):
+        headers = {}
 
-        self.site = {
-            "domain": domain
-        }
-
-        robots_content = self.fetch_robots(domain)
+        if self.current_page.get("revisit"):
+            if self.current_page.get("etag"):
+                headers["If-None-Match"] = self.current_page["etag"]
 
-        sitemap_content = None
+            if self.current_page.get("last_modified"):
+                headers["If-Modified-Since"] = self.current_page["last_modified"]
 
-        if robots_content is not None:
-            # Create robots_parser from fetched robots.txt
-            self.parse_robots(robots_content)
+        return headers
 
-            sitemaps = self.robots_parser.get_sitemaps()
-
-            if len(sitemaps) > 0:
-                for sitemap_url in sitemaps:
-                    sitemap_content = self.fetch_sitemap(sitemap_url)
+    """
+        The revisited page did not change, only its freshness data is updated and the next visit is scheduled
+    """
 
-                    if sitemap_content is not None:
-                        self.parse_sitemap(sitemap_content)
+    def finish_revisit(self, result):
+        schedule_next_visit(self.current_page, changed=False)
 
-        self.site["robots_content"] = robots_content
-        self.site["sitemap_content"] = sitemap_content
+        with metrics.timer("crawler_database_write_seconds", table="page"):
+            database_handler.update_page_freshness(self.current_page)
 
-        # Insert the new site into database and return the id
-        self.site["id"] = database_handler.insert_site(self.site)
+        metrics.increment("crawler_revisits_total", result=result)
 
     """
         Fetch and render the site in the chrome driver then return the resulting html so that it can be saved in the 
@@ -388,15 +851,6 @@ class CrawlerProcess:
 
         return None
 
-    def fetch_sitemap(self, sitemap_url):
-        response = self.fetch_response(sitemap_url)
-
-        if response and response.status_code is 200:
-            # Sitemap found
-            return response.text
-
-        return None
-
     """
         This function parses the robots.txt from memory using the modified robotparser class
         The self.robots_parser includes functions to check if the parser is allowed to parse a certain site
@@ -407,27 +861,17 @@ class CrawlerProcess:
         self.robots_parser.read()
 
     """
-        https://stackoverflow.com/questions/31276001/parse-xml-sitemap-with-python
-        
-        This only works for the standard XML sitemap
+        Sitemap urls (of pages and of nested sitemaps) are normalized like the links and only kept in the allowed domain,
+        it is called from the site discovery threads, so the domain of the sitemap is given explicitly
     """
 
-    def parse_sitemap(self, sitemap_xml):
-        try:
-            soup = BeautifulSoup(sitemap_xml, 'lxml')
+    def get_parsed_sitemap_url(self, url, domain):
+        url = self.get_parsed_url(url, domain)
 
-            sitemap_tags = soup.find_all("loc")
-
-            if sitemap_tags is None:
-                return
-
-            for sitemap_tag in sitemap_tags:
-                url = self.get_parsed_url(sitemap_tag.text)
+        if url is None or ALLOWED_DOMAIN not in self.get_domain_url(url):
+            return None
 
-                if url:
-                    self.add_page_to_frontier_array(url)
-        except Exception as error:
-            print(error)
+        return url
 
     """
         Checks if robots are set for the current site and if they allow the crawling of the current page
@@ -449,9 +893,9 @@ class CrawlerProcess:
                 crawl_delay = self.robots_parser.crawl_delay('*')
 
                 if crawl_delay is not None:
-                    if "last_crawled_at" in self.site and self.site["last_crawled_at"] is not None:
-                        site_last_crawled_at = self.site["last_crawled_at"]
+                    site_last_crawled_at = self.get_site_last_crawled_at()
 
+                    if site_last_crawled_at is not None:
                         can_crawl_again_at = site_last_crawled_at + timedelta(seconds=crawl_delay)
 
                         current_time = datetime.now()
@@ -466,9 +910,26 @@ class CrawlerProcess:
         except Exception as error:
             print("     [CRAWLING] Error while handling crawl delay", error)
 
+    """
+        The cached site object may be older than the last crawl of this process, so the later of the two times is used
+    """
+
+    def get_site_last_crawled_at(self):
+        last_crawled_at = self.site.get("last_crawled_at")
+
+        scheduled_at = self.host_schedules.get(self.site["domain"])
+
+        if last_crawled_at is None or (scheduled_at is not None and scheduled_at > last_crawled_at):
+            return scheduled_at
+
+        return last_crawled_at
+
     """
         Use the chrome driver to fetch all links and image sources in the rendered page (the driver already returns 
         absolute urls)
+
+        Returns ExtractedLinks with the canonical urls in the allowed domain, every url only once (menus and footers
+        repeat the same links) and without spider traps, and the number of dropped urls by reason
         
         Note: Sometimes throws StaleElementReferenceException, need to check what that's about. The exception itself 
         just means that the desired element is no longer rendered in DOM. Maybe the memory was getting low, since I got the
@@ -476,8 +937,7 @@ class CrawlerProcess:
     """
 
     def parse_page(self, html_content):
-        links = []
-        images = []
+        extracted_links = ExtractedLinks(self.current_page["url"], ALLOWED_DOMAIN, self.trap_detector)
 
         try:
             browser = self.driver
@@ -487,21 +947,14 @@ class CrawlerProcess:
             for anchor_tag in anchor_tags:
                 href = anchor_tag.get_attribute("href")
 
-                url = self.get_parsed_url(href)
-
-                if url:
-                    links.append(url)
+                extracted_links.add_link(self.get_parsed_url(href))
 
             image_tags = browser.find_elements_by_tag_name("img")
 
             for image_tag in image_tags:
                 src = image_tag.get_attribute("src")
 
-                if src:
-                    image_url = self.get_parsed_image_url(src)
-
-                    if image_url:
-                        images.append(image_url)
+                extracted_links.add_image(self.get_parsed_image_url(src))
 
             soup = BeautifulSoup(html_content, 'html.parser')
 
@@ -511,50 +964,37 @@ class CrawlerProcess:
                 links_from_javascript = self.parse_links_from_javacript(script_tag.text)
 
                 for link in links_from_javascript:
-                    links.append(self.get_parsed_url(link))
-
-            return {
-                "links": links,
-                "images": images
-            }
+                    extracted_links.add_link(self.get_parsed_url(link))
         except Exception as error:
             print("[ERROR WHILE RENDERING WITH WEB DRIVER]", error)
 
-            return {
-                "links": links,
-                "images": images
-            }
+        return extracted_links
 
     """
-        Find all the hrefs that are set in javascript code (window.location changes)
+        Find all the hrefs that are set in javascript code (window.location changes), see script_link_scanner.py
     """
 
     def parse_links_from_javacript(self, javascript_text):
         links = []
 
         try:
-            links = re.findall(r'(http://|https://)([\w_-]+(?:(?:\.[\w_-]+)+))([\w.,@?^=%&:/~+#-]*[\w@?^=%&/~+#-])?',
-                               javascript_text)
-
-            if not links:
-                return []
-
-            links = [''.join(link) for link in links]
+            links = self.script_link_scanner.scan(javascript_text)
         except Exception as error:
             print("     [CRAWLING] Error while parsing links from Javascript", error)
 
         return links
 
     """
-        Create a parsed url (ignore javascript and html actions, remove hashes, fix relative urls etc.)
+        Create a parsed url (ignore javascript and html actions, fix relative urls etc.) in its canonical form (see
+        canonicalize_url), so that the same page is not added to the frontier under different urls
     """
 
-    # TODO: remove index.html index.php
-    def get_parsed_url(self, url):
+    def get_parsed_url(self, url, domain=None):
         if url is None or url is "":
             return None
 
-        domain = self.site["domain"]
+        if domain is None:
+            domain = self.site["domain"]
 
         if not url.startswith("http"):
             # Since the chrome driver returns absolute urls, the url is most likely javascript or action
@@ -594,9 +1034,10 @@ class CrawlerProcess:
 
             url = "{}{}".format(domain, url).strip()
 
-        # Remove everything after the hash
-        if "#" in url:
-            url = url.split("#")[0]
+        url = canonicalize_url(url)
+
+        if url is None:
+            return None
 
         # Encode special characters (the second parameter are characters that the encoder will not encode)
         url = quote(url.encode("UTF-8"), ':/-_.~&?+=')
@@ -637,53 +1078,104 @@ class CrawlerProcess:
             # Create an absolute url
             url = "{}{}".format(domain, url).strip()
 
-        return url
+        return canonicalize_url(url)
 
     """
         The duplicate page should not have the html_content value set, page_type_code should be DUPLICATE and
          that's it
     """
 
-    def is_duplicate_page(self, html_content):
-
-        # sha256 digest of complete html_content
-        h = hash_driver.create_content_hash(html_content)
+    def is_duplicate_page(self, content_digest, signature_future, site_template):
 
         # first check if page is exact copy of already parsed documents
-        if database_handler.find_page_duplicate(h):
+        with metrics.timer("crawler_similarity_query_seconds", kind="exact"):
+            is_exact_duplicate = self.is_exact_duplicate_page(content_digest)
+
+        if is_exact_duplicate:
+            signature_future.cancel()
+
             return True
         else:
 
-            # create set of hash shingles
-            # in order to prevent pages using lots of same tags to be treated as similar, remove html tags
-            hash_set = hash_driver.text_to_shingle_set(self.remove_markups(html_content))
+            # wait for the set of hash shingles from the hash service (only the main content is shingled)
+            with metrics.timer("crawler_hash_seconds", kind="shingles"):
+                hash_set, block_fingerprints = self.hash_driver.page_signature_result(signature_future)
+
+            # the first pages of a site teach its template
+            site_template.learn(block_fingerprints)
 
             # hash signature will be inserted to db later
             self.current_page["hash_signature"] = hash_set
 
             # calculate similarity between current document and already parsed documents using Jaccard similarity
-            similarity = database_handler.calculate_biggest_similarity(hash_set)
+            with metrics.timer("crawler_similarity_query_seconds", kind="jaccard"):
+                similarity = database_handler.calculate_biggest_similarity(hash_set)
 
             #print("SIMILARITY: ", similarity)
 
             return similarity > MAX_SIMILARITY
 
     """
-       Remove markup tags from html content 
+        The digest of the page content is stored for the page unless another page already has it. Digests in the cache
+        are not stored again, a cached digest of another page is an exact duplicate without a database round trip
+    """
+
+    def is_exact_duplicate_page(self, content_digest):
+        if content_digest is None:
+            return False
+
+        digest_page_id = self.digest_cache.get(content_digest)
+
+        if digest_page_id is not None:
+            metrics.increment("crawler_digest_cache_total", result="hit")
+        else:
+            metrics.increment("crawler_digest_cache_total", result="miss")
+
+            digest_page_id = database_handler.insert_content_digest(content_digest, self.current_page["id"])
+
+            if digest_page_id is None:
+                return False
+
+            self.digest_cache.add(content_digest, digest_page_id)
+
+        return digest_page_id != self.current_page["id"]
+
+    """
+        The urls come from parse_page, so they are already in the allowed domain and unique in the current page
     """
-    def remove_markups(self, html_content):
-        return BeautifulSoup(html_content, "html.parser").text
 
     def add_page_to_frontier_array(self, page_url):
-        page_domain = self.get_domain_url(page_url)
+        self.pages_to_add_to_frontier.append({
+            "from": self.current_page["id"],
+            "to": page_url,
+            "to_id": self.seen_urls.get(page_url)
+        })
+
+    """
+        Remember the page ids that the database handler resolved for the added urls
+    """
 
-        if ALLOWED_DOMAIN in page_domain:
-            # Only add pages in the allowed domain
+    def remember_seen_urls(self, pages):
+        if len(self.seen_urls) + len(pages) > MAX_SEEN_URLS:
+            self.seen_urls = {}
 
-            self.pages_to_add_to_frontier.append({
-                "from": self.current_page["id"],
-                "to": page_url
-            })
+        for page in pages:
+            if page.get("to_id") is not None:
+                self.seen_urls[page["to"]] = page["to_id"]
 
     def quit(self):
+        self.checkpoint.save(self.get_checkpoint_state())
+
+        metrics.flush()
+
         self.driver.quit()
+
+        self.site_discovery.shutdown()
+
+        self.dns_resolver.shutdown()
+
+        self.session.close()
+
+        self.coordinator.stop()
+
+        self.hash_driver.hash_service.shutdown()
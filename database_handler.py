@@ -1,6 +1,11 @@
-from urllib.parse import unquote
+from urllib.parse import unquote, urlparse
+import os
+import re
+import threading
 import psycopg2
+import psycopg2.extensions
 from psycopg2 import pool
+from psycopg2.extras import execute_values
 from config import config
 from datetime import datetime
 
@@ -12,104 +17,1166 @@ MAX_URL_LEN = 2000
 
 MAX_BINARY_TABLE_SIZE = 1024 * 1024 * 1024  # 1GB
 
+# Images whose 64-bit perceptual hashes differ in at most this many bits are the same image. The hashes are indexed in
+# 4 bands of 16 bits, two hashes within 3 bits of each other always share a band
+MAX_IMAGE_HAMMING_DISTANCE = 3
+
+# ... and only when their mean colors differ by at most this much (the sum of the red, green and blue differences)
+MAX_IMAGE_COLOR_DIFFERENCE = 24
+
 MAX_PAGES_TABLE_ROWS = 100000
 
+# Default budgets of a site, a site row can override them (max_pages, max_bytes, max_render_seconds). The pages of a
+# site count when they are added to the frontier, so one big site can not take all of MAX_PAGES_TABLE_ROWS
+SITE_MAX_PAGES = MAX_PAGES_TABLE_ROWS // 10
+
+SITE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2GB
+
+SITE_MAX_RENDER_SECONDS = 6 * 60 * 60
+
+# Number of frontier pages locked at once when a worker claims a page, so that it can pick one from its own hosts
+CLAIM_BATCH_SIZE = 32
+
+# Number of rows a server-side cursor fetches from the database at once when exporting
+EXPORT_BATCH_SIZE = 5000
+
+# Text search configuration of the search vectors and queries (there is no Slovenian stemmer in Postgres)
+SEARCH_CONFIGURATION = "simple"
+
+# A site bootstrap (robots and sitemaps) which did not finish in this time is taken over by another worker (seconds)
+SITE_BOOTSTRAP_TIMEOUT = 300
+
+# Pool mode of a connection pooler (pgbouncer) in front of the database, set pool_mode in database.ini. A
+# transaction-mode pooler runs every transaction on any server connection, so nothing is prepared on the sessions
+TRANSACTION_POOL_MODE = "transaction"
+
+"""
+    Hot queries which are prepared once per connection and then run with EXECUTE, so the server parses and plans them
+    only once. Every statement has the types of its parameters and the query with %s placeholders
+"""
+PREPARED_QUERIES = {
+    "claim_frontier_candidates": (
+        ("integer", "integer", "bigint", "real", "integer", "integer", "integer"),
+        """
+            SELECT candidate.id, candidate.url FROM (
+                SELECT frontier.id, frontier.url, fair_site.share FROM (
+                    SELECT id, (crawled_pages + render_seconds) / NULLIF(crawl_weight, 0) AS share 
+                    FROM crawldb.site 
+                    WHERE (bootstrap_status<>'PENDING' OR bootstrap_started_at IS NULL 
+                    OR bootstrap_started_at < now() - %s * interval '1 second') 
+                    AND crawled_pages < COALESCE(max_pages, %s) AND crawled_bytes < COALESCE(max_bytes, %s) 
+                    AND render_seconds < COALESCE(max_render_seconds, %s) 
+                    AND EXISTS (
+                        SELECT 1 FROM crawldb.page 
+                        WHERE page.site_id=site.id AND page_type_code='FRONTIER' AND active_in_crawler IS NULL
+                    )
+                    ORDER BY share
+                    LIMIT %s
+                ) fair_site CROSS JOIN LATERAL (
+                    SELECT id, url FROM crawldb.page 
+                    WHERE site_id=fair_site.id AND page_type_code='FRONTIER' AND active_in_crawler IS NULL 
+                    ORDER BY priority DESC, added_at_time
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                ) frontier
+                UNION ALL
+                SELECT unassigned.id, unassigned.url, NULL FROM (
+                    SELECT id, url FROM crawldb.page 
+                    WHERE page_type_code='FRONTIER' AND active_in_crawler IS NULL AND site_id IS NULL 
+                    ORDER BY priority DESC, added_at_time
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                ) unassigned
+            ) candidate
+            ORDER BY candidate.share NULLS LAST
+            LIMIT %s
+        """
+    ),
+    "claim_page": (
+        ("integer", "integer"),
+        """
+            UPDATE crawldb.page 
+            SET active_in_crawler=TRUE, worker_id=%s 
+            WHERE id=%s
+        """
+    ),
+    "find_page_by_url": (
+        ("text",),
+        """
+            SELECT id FROM crawldb.page 
+            WHERE url=%s
+        """
+    ),
+    "insert_frontier_page": (
+        ("text", "timestamp", "integer"),
+        """
+            INSERT INTO crawldb.page("url", "page_type_code", "added_at_time", "site_id") 
+            VALUES(%s, 'FRONTIER', %s, %s)
+            RETURNING id
+        """
+    ),
+    "create_frontier_sites": (
+        ("text[]",),
+        """
+            INSERT INTO crawldb.site(domain, bootstrap_status) 
+            SELECT domain, 'PENDING' FROM unnest(%s::text[]) AS domain 
+            ORDER BY domain
+            ON CONFLICT (domain) DO NOTHING
+        """
+    ),
+    "find_site_budgets": (
+        ("integer", "text[]"),
+        """
+            SELECT domain, id, queued_pages, COALESCE(max_pages, %s) 
+            FROM crawldb.site WHERE domain = ANY(%s::text[])
+        """
+    ),
+    "add_queued_pages": (
+        ("integer[]", "integer[]"),
+        """
+            UPDATE crawldb.site 
+            SET queued_pages=site.queued_pages + queued.pages 
+            FROM unnest(%s::integer[], %s::integer[]) AS queued(site_id, pages) 
+            WHERE site.id=queued.site_id
+        """
+    ),
+    "find_link": (
+        ("integer", "integer"),
+        """
+            SELECT 1 FROM crawldb.link
+            WHERE from_page=%s AND to_page=%s
+        """
+    ),
+    "insert_link": (
+        ("integer", "integer"),
+        """
+            INSERT INTO crawldb.link("from_page", "to_page") 
+            VALUES(%s, %s)
+        """
+    ),
+    "finish_page": (
+        ("integer", "text", "text", "text", "integer", "timestamp", "text", "text", "real", "integer", "timestamp",
+         "integer"),
+        """
+            UPDATE crawldb.page 
+            SET site_id=%s, page_type_code=%s, html_content=%s, hash_content=%s, http_status_code=%s, 
+            accessed_time=%s, etag=%s, last_modified=%s, change_rate=%s, visit_count=%s, next_visit_at=%s, 
+            active_in_crawler=NULL, worker_id=NULL, indexed_at=NULL 
+            WHERE id=%s
+        """
+    ),
+    "update_site_usage": (
+        ("timestamp", "bigint", "real", "integer"),
+        """
+            UPDATE crawldb.site 
+            SET last_crawled_at=%s, crawled_pages=crawled_pages + 1, crawled_bytes=crawled_bytes + %s, 
+            render_seconds=render_seconds + %s
+            WHERE id=%s
+        """
+    ),
+    "insert_content_digest": (
+        ("bytea", "integer"),
+        """
+            INSERT INTO crawldb.content_digest(digest, page_id)
+            VALUES (%s, %s)
+            ON CONFLICT (digest) DO UPDATE SET digest=EXCLUDED.digest
+            RETURNING page_id
+        """
+    ),
+    "insert_page_signatures": (
+        ("integer", "bigint[]", "integer"),
+        """
+            INSERT INTO crawldb.content_hash(page_id, hash, hash_length)
+            VALUES (%s, %s, %s)
+        """
+    ),
+    "find_most_similar_signatures": (
+        ("bigint[]", "integer"),
+        """
+           SELECT * 
+           FROM   crawldb.content_hash i, LATERAL (
+                SELECT count(*) AS ct
+                FROM   unnest(i.hash) signature
+                WHERE  signature = ANY(%s::bigint[])
+            ) x, LATERAL (
+                SELECT (i.hash_length + %s) AS total_sum
+            ) y
+            ORDER  BY x.ct DESC, hash_length ASC
+            LIMIT 1
+        """
+    ),
+    "find_similar_image": (
+        ("bytea", "bigint", "integer", "integer", "integer"),
+        """
+            SELECT image_id FROM (
+                SELECT image_id, -1 AS distance FROM crawldb.image_hash 
+                WHERE digest=%s
+                UNION ALL
+                SELECT candidate.image_id, candidate.distance FROM (
+                    SELECT i.image_id, length(replace((i.hash # t.hash)::bit(64)::text, '0', '')) AS distance, 
+                    abs(((i.mean_color >> 16) & 255) - ((t.mean_color >> 16) & 255)) 
+                    + abs(((i.mean_color >> 8) & 255) - ((t.mean_color >> 8) & 255)) 
+                    + abs((i.mean_color & 255) - (t.mean_color & 255)) AS color_difference 
+                    FROM crawldb.image_hash i, (SELECT %s::bigint AS hash, %s::integer AS mean_color) t
+                    WHERE ((i.hash >> 48) & 65535) = ((t.hash >> 48) & 65535) 
+                    OR ((i.hash >> 32) & 65535) = ((t.hash >> 32) & 65535) 
+                    OR ((i.hash >> 16) & 65535) = ((t.hash >> 16) & 65535) 
+                    OR (i.hash & 65535) = (t.hash & 65535)
+                ) candidate
+                WHERE candidate.distance <= %s AND candidate.color_difference <= %s
+            ) similar_image
+            ORDER BY distance
+            LIMIT 1
+        """
+    ),
+    "get_site": (
+        ("text",),
+        """
+            SELECT id, domain, robots_content, last_crawled_at, bootstrap_status 
+            FROM crawldb.site WHERE domain=%s
+        """
+    )
+}
+
+PLACEHOLDER_PATTERN = re.compile(r"%s")
+
+"""
+    PREPARE uses numbered parameters ($1, $2, ...) instead of %s
+"""
+
+
+def positional_query(query):
+    placeholders = iter(range(1, query.count("%s") + 1))
+
+    return PLACEHOLDER_PATTERN.sub(lambda match: "${}".format(next(placeholders)), query)
+
+
+"""
+    Domain of the site of the url, in the same form as crawldb.site.domain
+"""
+
+
+def site_domain(url):
+    parsed_uri = urlparse(url)
+
+    return '{uri.scheme}://{uri.netloc}/'.format(uri=parsed_uri)
+
+
+"""
+    Arguments of the find_similar_image query for the hashes of an image (see hash_driver.create_image_hash), an exact
+    copy (same sha256) is always a match, a near duplicate needs a close perceptual hash and a similar mean color
+"""
+
+
+def similar_image_arguments(image_hash):
+    return (image_hash["digest"], image_hash["hash"], image_hash["mean_color"], MAX_IMAGE_HAMMING_DISTANCE,
+            MAX_IMAGE_COLOR_DIFFERENCE)
+
+
+"""
+    Arguments of the claim_frontier_candidates query
+"""
+
+
+def claim_arguments():
+    return (SITE_BOOTSTRAP_TIMEOUT, SITE_MAX_PAGES, SITE_MAX_BYTES, SITE_MAX_RENDER_SECONDS, CLAIM_BATCH_SIZE,
+            CLAIM_BATCH_SIZE, CLAIM_BATCH_SIZE)
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """
+        Connection which remembers the statements prepared on its session
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.prepared_statements = set()
+
+
+class DatabaseHandler:
+    """
+        Every process builds its own connection pool the first time it uses the database, so forked crawler processes
+        never share the sockets of the parent's pool. The pool inherited from the parent is kept referenced and never
+        closed, closing it in the child would close the connections of the parent
+
+        max_connections is the size of the pool of one process
+    """
+
+    def __init__(self, minimum_connections, max_connections, prepare_statements=True):
+        self.minimum_connections = minimum_connections
+
+        self.max_connections = max_connections
+
+        self.connection_parameters = None
+
+        self.prepare_statements = prepare_statements
+
+        self.pool = None
+
+        self.pool_pid = None
+
+        self.pool_lock = threading.Lock()
+
+        self.inherited_connection_pools = []
+
+        try:
+            # read connection parameters
+            params = config()
+
+            self.connection_parameters = {
+                "user": params.get('user'),
+                "password": params.get('password'),
+                "host": params.get('host'),
+                "port": params.get('port'),
+                "database": params.get('database')
+            }
+
+            if params.get('pool_mode') == TRANSACTION_POOL_MODE:
+                self.prepare_statements = False
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE READING DATABASE CONFIGURATION]", error)
+
+    @property
+    def connection_pool(self):
+        pid = os.getpid()
+
+        if self.pool_pid != pid:
+            with self.pool_lock:
+                if self.pool_pid != pid:
+                    if self.pool is not None:
+                        # The connections belong to the parent process
+                        self.inherited_connection_pools.append(self.pool)
+
+                    self.pool = pool.ThreadedConnectionPool(
+                        self.minimum_connections,
+                        self.max_connections,
+                        connection_factory=PreparingConnection,
+                        **self.connection_parameters
+                    )
+
+                    self.pool_pid = pid
+
+                    print('[DATABASE] Connection pool created for process', pid)
+
+        return self.pool
+
+    """
+        Read-only queries run in autocommit mode, there is no transaction to begin and commit around them
+    """
+
+    def get_read_connection(self):
+        connection = self.connection_pool.getconn()
+
+        connection.autocommit = True
+
+        return connection
+
+    def put_read_connection(self, connection):
+        if not connection.closed:
+            connection.autocommit = False
+
+        self.connection_pool.putconn(connection)
+
+    """
+        Execute a statement of PREPARED_QUERIES, it is prepared the first time it runs on a connection. Behind a
+        transaction-mode pooler the query is sent as it is
+    """
+
+    def execute_prepared(self, cursor, name, query_vars):
+        parameter_types, query = PREPARED_QUERIES[name]
+
+        if not self.prepare_statements:
+            cursor.execute(query, query_vars)
+
+            return
+
+        connection = cursor.connection
+
+        if name not in connection.prepared_statements:
+            cursor.execute("PREPARE {} ({}) AS {}".format(name, ", ".join(parameter_types), positional_query(query)))
+
+            connection.prepared_statements.add(name)
+
+        cursor.execute("EXECUTE {} ({})".format(name, ", ".join(["%s"] * len(query_vars))), query_vars)
+
+    """
+        Claim a page from the frontier without a process lock, so that workers on different nodes can claim pages at
+        the same time. The candidate rows are locked with SKIP LOCKED, which means concurrent workers never wait for
+        each other and never get the same page
+
+        owns_url is an optional function which tells if the url belongs to the hosts of the worker, pages of its own
+        hosts are preferred, but if none are available in the claimed batch the first page is taken so that the worker
+        does not stay idle
+
+        Pages of sites whose robots and sitemaps are still being fetched are skipped, unless the bootstrap timed out
+
+        The candidates are the best frontier pages of different sites, the sites which used the smallest share of the
+        crawl come first (crawled pages plus seconds of rendering, divided by the crawl_weight of the site), so one big
+        or slow site can not take all the workers. Sites over one of their budgets are not crawled any more, frontier
+        pages without a site come last
+    """
+
+    def claim_page_from_frontier(self, worker_id, owns_url=None):
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            self.execute_prepared(cursor, "claim_frontier_candidates", claim_arguments())
+
+            candidates = cursor.fetchall()
+
+            cursor.close()
+
+            if not candidates:
+                connection.commit()
+
+                return
+
+            frontier = candidates[0]
+
+            if owns_url is not None:
+                for candidate in candidates:
+                    if owns_url(unquote(candidate[1])):
+                        frontier = candidate
+
+                        break
+
+            cursor = connection.cursor()
+
+            self.execute_prepared(cursor, "claim_page", (worker_id, frontier[0]))
+
+            # Committing releases the locks on the candidates which were not claimed
+            connection.commit()
+
+            cursor.close()
+
+            # Decode the url
+            url = unquote(frontier[1])
+
+            return {
+                'id': frontier[0],
+                'url': url,
+                'html_content': None,
+                'hash_content': None
+            }
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE CLAIMING PAGE FROM FRONTIER]", error)
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
+
+    """
+        Claim an already crawled html page whose revisit is due, the returned page holds the validators (etag,
+        last_modified) for a conditional request and the hash of the stored content
+    """
+
+    def claim_page_for_revisit(self, worker_id):
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    SELECT id, url, site_id, hash_content, etag, last_modified, change_rate, visit_count, accessed_time 
+                    FROM crawldb.page 
+                    WHERE next_visit_at <= now() AND page_type_code='HTML' AND active_in_crawler IS NULL
+                    ORDER BY next_visit_at
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                """
+            )
+
+            page = cursor.fetchone()
+
+            if page is None:
+                connection.commit()
+
+                return
+
+            self.execute_prepared(cursor, "claim_page", (worker_id, page[0]))
+
+            connection.commit()
+
+            cursor.close()
+
+            return {
+                'id': page[0],
+                'url': unquote(page[1]),
+                'html_content': None,
+                'hash_content': None,
+                'revisit': True,
+                'previous_hash_content': page[3],
+                'etag': page[4],
+                'last_modified': page[5],
+                'change_rate': page[6],
+                'visit_count': page[7],
+                'previous_accessed_time': page[8]
+            }
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE CLAIMING PAGE FOR REVISIT]", error)
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
+
+    """
+        A revisited page did not change (or could not be fetched), only its freshness data and the next visit are
+        updated, the stored content stays as it is
+    """
+
+    def update_page_freshness(self, current_page):
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    UPDATE crawldb.page 
+                    SET accessed_time=%s, etag=COALESCE(%s, etag), last_modified=COALESCE(%s, last_modified), 
+                    change_rate=%s, visit_count=%s, next_visit_at=%s, active_in_crawler=NULL, worker_id=NULL 
+                    WHERE id=%s;
+                """,
+                (current_page["accessed_time"], current_page.get("etag"), current_page.get("last_modified"),
+                 current_page.get("change_rate"), current_page.get("visit_count"), current_page.get("next_visit_at"),
+                 current_page["id"])
+            )
+
+            connection.commit()
+
+            cursor.close()
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE UPDATING PAGE FRESHNESS]", error)
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
+
+    """
+        Register a new crawler worker and return its id, the worker has to send heartbeats to keep its leases
+    """
+
+    def register_worker(self, hostname, pid):
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    INSERT INTO crawldb.worker(hostname, pid, started_at, heartbeat_at)
+                    VALUES (%s, %s, now(), now()) RETURNING id;
+                """,
+                (hostname, pid)
+            )
+
+            connection.commit()
+
+            worker_id = cursor.fetchone()[0]
+
+            cursor.close()
+
+            return worker_id
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE REGISTERING WORKER]", error)
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
+
+    """
+        The database clock is used for heartbeats, so that the clocks of different nodes do not need to be in sync
+    """
+
+    def update_worker_heartbeat(self, worker_id):
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    UPDATE crawldb.worker 
+                    SET heartbeat_at=now() 
+                    WHERE id=%s;
+                """,
+                (worker_id,)
+            )
+
+            connection.commit()
+
+            cursor.close()
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE UPDATING WORKER HEARTBEAT]", error)
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
+
+    """
+        Mark the worker as stopped and return all the pages it still holds back to the frontier
+    """
+
+    def stop_worker(self, worker_id):
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    UPDATE crawldb.page 
+                    SET active_in_crawler=NULL, worker_id=NULL 
+                    WHERE worker_id=%s AND page_type_code='FRONTIER';
+                """,
+                (worker_id,)
+            )
+
+            cursor.execute(
+                """
+                    UPDATE crawldb.worker 
+                    SET stopped_at=now() 
+                    WHERE id=%s;
+                """,
+                (worker_id,)
+            )
+
+            connection.commit()
+
+            cursor.close()
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE STOPPING WORKER]", error)
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
+
+    """
+        Return the ids of all the workers which have sent a heartbeat in the last timeout seconds
+    """
+
+    def fetch_live_workers(self, timeout):
+        connection = None
+
+        try:
+            connection = self.get_read_connection()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    SELECT id FROM crawldb.worker 
+                    WHERE stopped_at IS NULL AND heartbeat_at >= now() - %s * interval '1 second'
+                    ORDER BY id
+                """,
+                (timeout,)
+            )
+
+            return [worker[0] for worker in cursor.fetchall()]
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE FETCHING LIVE WORKERS]", error)
+
+            return []
+        finally:
+            if connection:
+                self.put_read_connection(connection)
+
+    """
+        Workers that have not sent a heartbeat in the last timeout seconds are considered dead, their pages are returned
+        to the frontier so that other workers can claim them. Returns the number of released pages
+    """
+
+    def release_dead_worker_leases(self, timeout):
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    UPDATE crawldb.worker 
+                    SET stopped_at=now() 
+                    WHERE stopped_at IS NULL AND heartbeat_at < now() - %s * interval '1 second'
+                    RETURNING id;
+                """,
+                (timeout,)
+            )
+
+            dead_workers = [worker[0] for worker in cursor.fetchall()]
+
+            released_pages = 0
+
+            if dead_workers:
+                cursor.execute(
+                    """
+                        UPDATE crawldb.page 
+                        SET active_in_crawler=NULL, worker_id=NULL 
+                        WHERE worker_id = ANY(%s) AND page_type_code='FRONTIER';
+                    """,
+                    (dead_workers,)
+                )
+
+                released_pages = cursor.rowcount
+
+            connection.commit()
+
+            cursor.close()
+
+            return released_pages
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE RELEASING DEAD WORKER LEASES]", error)
+
+            return 0
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
+
+    """
+        Count the pages waiting in the frontier, counting stops at limit so that a big frontier is not scanned
+    """
+
+    def count_frontier_pages(self, limit):
+        connection = None
+
+        try:
+            connection = self.get_read_connection()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    SELECT COUNT(*) FROM (
+                        SELECT 1 FROM crawldb.page 
+                        WHERE page_type_code='FRONTIER' AND active_in_crawler IS NULL
+                        LIMIT %s
+                    ) frontier
+                """,
+                (limit,)
+            )
+
+            return cursor.fetchone()[0]
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE COUNTING FRONTIER PAGES]", error)
+
+            return 0
+        finally:
+            if connection:
+                self.put_read_connection(connection)
+
+    """
+        Identity of the crawl in the database (server, database, the oid of the crawldb schema, which changes when the
+        schema is created again, and the generation of the crawl, which reset_database increases), so that local state
+        of another crawl or of the crawl before a reset is never restored
+    """
+
+    def get_crawl_identity(self):
+        connection = None
+
+        try:
+            connection = self.get_read_connection()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    SELECT namespace.oid, crawl.generation FROM pg_namespace namespace, crawldb.crawl crawl 
+                    WHERE namespace.nspname='crawldb'
+                """
+            )
+
+            schema = cursor.fetchone()
+
+            if schema is None:
+                return None
+
+            return "{}:{}/{}/{}/{}".format(self.connection_parameters["host"], self.connection_parameters["port"],
+                                           self.connection_parameters["database"], schema[0], schema[1])
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE READING CRAWL IDENTITY]", error)
+
+            return None
+        finally:
+            if connection:
+                self.put_read_connection(connection)
+
+    """
+        Return the page back to the frontier, used mainly for crawl delay purposes
+    """
+
+    def return_page_to_frontier(self, current_page):
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    UPDATE crawldb.page 
+                    SET active_in_crawler=NULL, worker_id=NULL 
+                    WHERE id=%s;
+                """,
+                (current_page["id"],)
+            )
+
+            connection.commit()
+
+            cursor.close()
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE RETURNING PAGE TO FRONTIER]", error)
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
+
+    """
+        Create a new entry in the links table
+    """
+
+    def link_pages(self, from_page, to_page):
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            self.execute_prepared(cursor, "find_link", (from_page, to_page))
+
+            existing_link = cursor.fetchone()
+
+            cursor.close()
+
+            if existing_link is None:
+                cursor = connection.cursor()
+
+                self.execute_prepared(cursor, "insert_link", (from_page, to_page))
+
+                connection.commit()
+
+                cursor.close()
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE LINKING PAGES]", error)
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
+
+    """
+        Add a single page to the frontier
+    """
+
+    def add_seed_page_to_frontier(self, seed_page):
+        connection = None
+
+        if len(seed_page) <= MAX_URL_LEN:
+            try:
+                connection = self.connection_pool.getconn()
+
+                cursor = connection.cursor()
+
+                site = self.find_site_budgets(cursor, [seed_page])[site_domain(seed_page)]
+
+                cursor.execute(
+                    """
+                        INSERT INTO crawldb.page("url", "page_type_code", "added_at_time", "site_id") 
+                        VALUES(%s, %s, %s, %s);
+                    """,
+                    (seed_page, "FRONTIER", datetime.now(), site["id"])
+                )
+
+                self.execute_prepared(cursor, "add_queued_pages", ([site["id"]], [1]))
+
+                connection.commit()
+
+                cursor.close()
+            except (Exception, psycopg2.DatabaseError) as error:
+                print("[ERROR WHILE ADDING PAGE TO FRONTIER]", error)
+            finally:
+                if connection:
+                    self.connection_pool.putconn(connection)
+
+    """
+        Add multiple pages to the frontier
+
+        Pages with a known to_id (the caller has already seen the url) only get the link, for the others the to_id is
+        set to the id of the existing or inserted page, so that the caller can remember it
+    """
+
+    def add_pages_to_frontier(self, pages_to_add):
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    SELECT COUNT(id) 
+                    FROM crawldb.page 
+                """
+            )
+
+            number_of_pages = cursor.fetchone()[0]
+
+            cursor.close()
+
+            if number_of_pages > MAX_PAGES_TABLE_ROWS:
+                # The limit for the pages table has been reached
+
+                return
+
+            cursor = connection.cursor()
+
+            sites = self.find_site_budgets(cursor, [page["to"] for page in pages_to_add
+                                                    if page.get("to_id") is None and len(page["to"]) <= MAX_URL_LEN])
+
+            connection.commit()
+
+            cursor.close()
+
+            for page in pages_to_add:
+                # avoid spider traps - if page's URL is longer than limit, do not add it to frontier
+                if len(page["to"]) <= MAX_URL_LEN:
+                    try:
+                        if page.get("to_id") is not None:
+                            self.link_pages(page["from"], page["to_id"])
+
+                            continue
+
+                        cursor = connection.cursor()
+
+                        self.execute_prepared(cursor, "find_page_by_url", (page["to"],))
+
+                        # Check if the page already exists
+                        to_page = cursor.fetchone()
+
+                        cursor.close()
+
+                        if to_page is None:
+                            site = sites[site_domain(page["to"])]
+
+                            if site["queued_pages"] >= site["max_pages"]:
+                                # The page budget of the site has been spent
+                                continue
+
+                            cursor = connection.cursor()
+
+                            self.execute_prepared(cursor, "insert_frontier_page",
+                                                  (page["to"], datetime.now(), site["id"]))
+
+                            to_page = cursor.fetchone()
+
+                            self.execute_prepared(cursor, "add_queued_pages", ([site["id"]], [1]))
+
+                            connection.commit()
+
+                            cursor.close()
+
+                            site["queued_pages"] += 1
+
+                        page["to_id"] = to_page[0]
+
+                        self.link_pages(page["from"], to_page[0])
+                    except psycopg2.IntegrityError:
+                        print("[ERROR WHILE ADDING PAGES TO FRONTIER] Integrity error, adding a duplicate url")
+
+                        # Do not print duplicate key errors (integrity error is thrown when inserting a duplicate url)
+
+                        self.connection_pool.putconn(connection)
+
+                        connection = self.connection_pool.getconn()
+                    except (Exception, psycopg2.DatabaseError) as error:
+                        print("[ERROR WHILE ADDING PAGES TO FRONTIER]", error)
+
+                        self.connection_pool.putconn(connection)
+
+                        connection = self.connection_pool.getconn()
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE ADDING PAGES TO FRONTIER]", error)
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
+
+    """
+        Bulk insert the urls of a sitemap into the frontier, pages is a list of (url, priority, lastmod) tuples
+
+        Urls which are already in the database are skipped, but crawled html pages whose lastmod is newer than their
+        last visit are scheduled for an immediate revisit. Sitemap urls are not linked to any page
+    """
+
+    def add_sitemap_pages_to_frontier(self, pages):
+        connection = None
+
+        pages = [page for page in pages if len(page[0]) <= MAX_URL_LEN]
+
+        if not pages:
+            return
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    SELECT COUNT(id) 
+                    FROM crawldb.page 
+                """
+            )
+
+            number_of_pages = cursor.fetchone()[0]
+
+            if number_of_pages > MAX_PAGES_TABLE_ROWS:
+                # The limit for the pages table has been reached
+
+                cursor.close()
+
+                return
+
+            added_at_time = datetime.now()
+
+            sites = self.find_site_budgets(cursor, [url for url, priority, lastmod in pages])
+
+            new_pages = []
+
+            for url, priority, lastmod in pages:
+                site = sites[site_domain(url)]
+
+                # Urls which are already in the database are skipped by the insert and not added to queued_pages
+                if site["queued_pages"] < site["max_pages"]:
+                    site["queued_pages"] += 1
+
+                    new_pages.append((url, "FRONTIER", added_at_time, priority, site["id"]))
+
+            if new_pages:
+                inserted_sites = execute_values(
+                    cursor,
+                    """
+                        INSERT INTO crawldb.page("url", "page_type_code", "added_at_time", "priority", "site_id") 
+                        VALUES %s
+                        ON CONFLICT (url) DO NOTHING
+                        RETURNING site_id;
+                    """,
+                    new_pages,
+                    page_size=len(new_pages),
+                    fetch=True
+                )
+
+                queued_pages = {}
+
+                for site_id, in inserted_sites:
+                    queued_pages[site_id] = queued_pages.get(site_id, 0) + 1
+
+                self.execute_prepared(cursor, "add_queued_pages", (list(queued_pages), list(queued_pages.values())))
+
+            modified_pages = [(url, lastmod) for url, priority, lastmod in pages if lastmod is not None]
+
+            if modified_pages:
+                execute_values(
+                    cursor,
+                    """
+                        UPDATE crawldb.page 
+                        SET next_visit_at=now() 
+                        FROM (VALUES %s) AS sitemap(url, lastmod) 
+                        WHERE page.url=sitemap.url AND page.page_type_code='HTML' 
+                        AND page.accessed_time < sitemap.lastmod;
+                    """,
+                    modified_pages,
+                    template="(%s, %s::timestamp)",
+                    page_size=len(modified_pages)
+                )
+
+            connection.commit()
 
-class DatabaseHandler:
-    def __init__(self, minimum_connections, max_connections):
-        # Set a lock object, so that only one connection to the database is allowed
+            cursor.close()
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE ADDING SITEMAP PAGES TO FRONTIER]", error)
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
 
-        self.connection_pool = None
+    """
+        Budgets of the sites of the urls as a domain -> {id, queued_pages, max_pages} dictionary, the sites which are not
+        in the database yet are created as PENDING (their robots and sitemaps are fetched when their first page is
+        crawled), so that every frontier page belongs to a site
+    """
 
-        try:
-            # read connection parameters
-            params = config()
+    def find_site_budgets(self, cursor, urls):
+        domains = sorted({site_domain(url) for url in urls})
 
-            self.connection_pool = pool.ThreadedConnectionPool(
-                minimum_connections,
-                max_connections,
-                user=params.get('user'),
-                password=params.get('password'),
-                host=params.get('host'),
-                database=params.get('database')
-            )
+        if not domains:
+            return {}
 
-            if self.connection_pool:
-                print('[DATABASE] Connection successfully established')
+        self.execute_prepared(cursor, "create_frontier_sites", (domains,))
 
+        self.execute_prepared(cursor, "find_site_budgets", (SITE_MAX_PAGES, domains))
 
-        except (Exception, psycopg2.DatabaseError) as error:
-            print("[ERROR WHILE ESTABLISHING CONNECTION TO DATABASE]", error)
+        return {domain: {"id": site_id, "queued_pages": queued_pages, "max_pages": max_pages}
+                for domain, site_id, queued_pages, max_pages in cursor.fetchall()}
 
     """
-        This function uses the lock so that no two crawler processes get the same frontier url
+        Remove the page from the frontier and populate all the necessary data
     """
 
-    def get_page_from_frontier(self, lock):
-        lock.acquire()
-
+    def remove_page_from_frontier(self, current_page):
         connection = None
 
         try:
             connection = self.connection_pool.getconn()
 
-            # create a cursor
             cursor = connection.cursor()
 
-            # execute a statement
-            cursor.execute(
-                """
-                    SELECT * FROM crawldb.page 
-                    WHERE page_type_code='FRONTIER' AND active_in_crawler IS NULL
-                    ORDER BY added_at_time
-                    LIMIT 1
-                """
+            self.execute_prepared(
+                cursor,
+                "finish_page",
+                (current_page["site_id"], current_page["page_type_code"], current_page["html_content"],
+                 current_page["hash_content"], current_page["http_status_code"], current_page["accessed_time"],
+                 current_page.get("etag"), current_page.get("last_modified"), current_page.get("change_rate"),
+                 current_page.get("visit_count"), current_page.get("next_visit_at"), current_page["id"])
             )
 
-            frontier = cursor.fetchone()
-
-            if frontier is None:
-                return
+            connection.commit()
 
             cursor.close()
 
             cursor = connection.cursor()
 
-            cursor.execute(
-                """
-                    UPDATE crawldb.page 
-                    SET active_in_crawler=TRUE 
-                    WHERE id=%s;
-                """,
-                (frontier[0],)
-            )
+            self.execute_prepared(cursor, "update_site_usage",
+                                  (datetime.now(), current_page.get("content_bytes", 0),
+                                   current_page.get("render_seconds", 0), current_page["site_id"]))
 
             connection.commit()
 
             cursor.close()
-
-            # Decode the url
-            url = unquote(frontier[3])
-
-            return {
-                'id': frontier[0],
-                'url': url,
-                'html_content': None,
-                'hash_content': None
-            }
         except (Exception, psycopg2.DatabaseError) as error:
-            print("[ERROR WHILE FETCHING PAGE FROM FRONTIER]", error)
+            print("[ERROR WHILE REMOVING PAGE FROM FRONTIER]", error)
         finally:
             if connection:
                 self.connection_pool.putconn(connection)
 
-            lock.release()
-
     """
-        Return the page back to the frontier, used mainly for crawl delay purposes
+        Store the sha256 digest of the content of a page unless another page already has it and return the id of the
+        page the digest belongs to, the page is an exact duplicate when that is not its own id. The digest is the
+        primary key, so the lookup is an index probe and two workers can not both store the same content
+
+        On a conflict the existing row is updated (without changing it), so the row is always returned: when another
+        worker is inserting the same digest, the statement waits for its commit and returns the page of that worker
     """
 
-    def return_page_to_frontier(self, current_page):
+    def insert_content_digest(self, digest, page_id):
         connection = None
 
         try:
@@ -117,29 +1184,27 @@ class DatabaseHandler:
 
             cursor = connection.cursor()
 
-            cursor.execute(
-                """
-                    UPDATE crawldb.page 
-                    SET active_in_crawler=NULL 
-                    WHERE id=%s;
-                """,
-                (current_page["id"],)
-            )
+            self.execute_prepared(cursor, "insert_content_digest", (digest, page_id))
+
+            digest_page = cursor.fetchone()
 
             connection.commit()
 
             cursor.close()
+
+            return digest_page[0]
+
         except (Exception, psycopg2.DatabaseError) as error:
-            print("[ERROR WHILE RETURNING PAGE TO FRONTIER]", error)
+            print("[ERROR WHILE INSERTING CONTENT DIGEST]", error)
         finally:
             if connection:
                 self.connection_pool.putconn(connection)
 
     """
-        Create a new entry in the links table
+        Insert hash signatures for current page
     """
 
-    def link_pages(self, from_page, to_page):
+    def insert_page_signatures(self, page_id, signatures):
         connection = None
 
         try:
@@ -147,159 +1212,127 @@ class DatabaseHandler:
 
             cursor = connection.cursor()
 
-            cursor.execute(
-                """
-                    SELECT * FROM crawldb.link
-                    WHERE from_page=%s AND to_page=%s
-                """,
-                (from_page, to_page)
-            )
+            self.execute_prepared(cursor, "insert_page_signatures", (page_id, str(signatures), len(signatures)))
 
-            existing_link = cursor.fetchone()
+            connection.commit()
 
             cursor.close()
 
-            if existing_link is None:
-                cursor = connection.cursor()
-
-                cursor.execute(
-                    """
-                        INSERT INTO crawldb.link("from_page", "to_page") 
-                        VALUES(%s, %s);
-                    """,
-                    (from_page, to_page)
-                )
-
-                connection.commit()
-
-                cursor.close()
         except (Exception, psycopg2.DatabaseError) as error:
-            print("[ERROR WHILE LINKING PAGES]", error)
+            print("[ERROR WHILE INSERTING HASH]", error)
         finally:
             if connection:
                 self.connection_pool.putconn(connection)
 
     """
-        Add a single page to the frontier
+        Delete the hash signatures and the content digest of a page, used when a revisited page changed so that it is
+        not compared to itself
     """
 
-    def add_seed_page_to_frontier(self, seed_page):
+    def delete_page_signatures(self, page_id):
         connection = None
 
-        if len(seed_page) <= MAX_URL_LEN:
-            try:
-                connection = self.connection_pool.getconn()
+        try:
+            connection = self.connection_pool.getconn()
 
-                cursor = connection.cursor()
+            cursor = connection.cursor()
 
-                cursor.execute(
-                    """
-                        INSERT INTO crawldb.page("url", "page_type_code", "added_at_time") 
-                        VALUES(%s, %s, %s);
-                    """,
-                    (seed_page, "FRONTIER", datetime.now())
-                )
+            cursor.execute(
+                """
+                    DELETE FROM crawldb.content_hash WHERE page_id=%s;
+                    DELETE FROM crawldb.content_digest WHERE page_id=%s;
+                """,
+                (page_id, page_id)
+            )
 
-                connection.commit()
+            connection.commit()
 
-                cursor.close()
-            except (Exception, psycopg2.DatabaseError) as error:
-                print("[ERROR WHILE ADDING PAGE TO FRONTIER]", error)
-            finally:
-                if connection:
-                    self.connection_pool.putconn(connection)
+            cursor.close()
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE DELETING HASH]", error)
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
 
     """
-        Add multiple pages to the frontier
+        Check out what is the percentage of similarity between current page containing set of hash signatures and 
+        already crawled pages
     """
 
-    def add_pages_to_frontier(self, pages_to_add):
+    def calculate_biggest_similarity(self, signatures):
         connection = None
+        first_matching = None
 
         try:
-            connection = self.connection_pool.getconn()
+            connection = self.get_read_connection()
 
             cursor = connection.cursor()
 
-            cursor.execute(
-                """
-                    SELECT COUNT(id) 
-                    FROM crawldb.page 
-                """
-            )
-
-            number_of_pages = cursor.fetchone()[0]
-
-            cursor.close()
-
-            if number_of_pages > MAX_PAGES_TABLE_ROWS:
-                # The limit for the pages table has been reached
+            self.execute_prepared(cursor, "find_most_similar_signatures", (str(signatures), len(signatures)))
 
-                return
+            first_matching = cursor.fetchone()
 
-            for page in pages_to_add:
-                # avoid spider traps - if page's URL is longer than limit, do not add it to frontier
-                if len(page["to"]) <= MAX_URL_LEN:
-                    try:
-                        cursor = connection.cursor()
+            if first_matching is None:
+                return 0
 
-                        cursor.execute(
-                            """
-                                SELECT * FROM crawldb.page 
-                                WHERE url=%s
-                            """,
-                            (page["to"],)
-                        )
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE FINDING SIMILAR PAGES]", error)
+        finally:
 
-                        # Check if the page already exists
-                        to_page = cursor.fetchone()
+            if connection:
+                self.put_read_connection(connection)
 
-                        cursor.close()
+        if first_matching and first_matching[4] > 0:
 
-                        if to_page is None:
-                            cursor = connection.cursor()
+            # calculate jaccard similarity (intersection over union)
+            return first_matching[4] / (first_matching[5] - first_matching[4])
 
-                            cursor.execute(
-                                """
-                                    INSERT INTO crawldb.page("url", "page_type_code", "added_at_time") 
-                                    VALUES(%s, %s, %s)
-                                    RETURNING id;
-                                """,
-                                (page["to"], "FRONTIER", datetime.now())
-                            )
+        else:
+            return 0
 
-                            connection.commit()
+    """
+        Find a site in the database by the domain name and return it if it exists
+    """
 
-                            to_page = cursor.fetchone()
+    def get_site(self, domain):
+        connection = None
 
-                            cursor.close()
+        try:
+            connection = self.get_read_connection()
 
-                        self.link_pages(page["from"], to_page[0])
-                    except psycopg2.IntegrityError:
-                        print("[ERROR WHILE ADDING PAGES TO FRONTIER] Integrity error, adding a duplicate url")
+            cursor = connection.cursor()
 
-                        # Do not print duplicate key errors (integrity error is thrown when inserting a duplicate url)
+            self.execute_prepared(cursor, "get_site", (domain,))
 
-                        self.connection_pool.putconn(connection)
+            site = cursor.fetchone()
 
-                        connection = self.connection_pool.getconn()
-                    except (Exception, psycopg2.DatabaseError) as error:
-                        print("[ERROR WHILE ADDING PAGES TO FRONTIER]", error)
+            if site is None:
+                return
 
-                        self.connection_pool.putconn(connection)
+            cursor.close()
 
-                        connection = self.connection_pool.getconn()
+            return {
+                "id": site[0],
+                "domain": site[1],
+                "robots_content": site[2],
+                "last_crawled_at": site[3],
+                "bootstrap_status": site[4]
+            }
         except (Exception, psycopg2.DatabaseError) as error:
-            print("[ERROR WHILE ADDING PAGES TO FRONTIER]", error)
+            print("[ERROR WHILE FETCHING SITE]", error)
         finally:
             if connection:
-                self.connection_pool.putconn(connection)
+                self.put_read_connection(connection)
 
     """
-        Remove the page from the frontier and populate all the necessary data
+        Claim the bootstrap (fetching robots and sitemaps) of a site, the site is created as PENDING if it does not
+        exist yet. Only one worker gets the claim, the others get the id of the pending site, a pending site whose
+        bootstrap timed out or was released can be claimed again
+
+        Returns a (site_id, claimed) tuple
     """
 
-    def remove_page_from_frontier(self, current_page):
+    def claim_site_bootstrap(self, domain):
         connection = None
 
         try:
@@ -309,45 +1342,49 @@ class DatabaseHandler:
 
             cursor.execute(
                 """
-                    UPDATE crawldb.page 
-                    SET site_id=%s, page_type_code=%s, html_content=%s, hash_content=%s, http_status_code=%s, 
-                    accessed_time=%s, active_in_crawler=NULL 
-                    WHERE id=%s;
+                    INSERT INTO crawldb.site(domain, bootstrap_status, bootstrap_started_at) 
+                    VALUES (%s, 'PENDING', now()) 
+                    ON CONFLICT (domain) DO UPDATE SET bootstrap_started_at=now() 
+                    WHERE site.bootstrap_status='PENDING' AND (site.bootstrap_started_at IS NULL 
+                    OR site.bootstrap_started_at < now() - %s * interval '1 second')
+                    RETURNING id;
                 """,
-                (current_page["site_id"], current_page["page_type_code"], current_page["html_content"],
-                 current_page["hash_content"], current_page["http_status_code"], current_page["accessed_time"],
-                 current_page["id"])
+                (domain, SITE_BOOTSTRAP_TIMEOUT)
             )
 
-            connection.commit()
+            site = cursor.fetchone()
 
-            cursor.close()
+            claimed = site is not None
 
-            cursor = connection.cursor()
+            if not claimed:
+                # Another worker is bootstrapping the site (or it is already ready)
+                cursor.execute(
+                    """
+                        SELECT id FROM crawldb.site WHERE domain=%s;
+                    """,
+                    (domain,)
+                )
 
-            cursor.execute(
-                """
-                    UPDATE crawldb.site 
-                    SET last_crawled_at=%s
-                    WHERE id=%s;
-                """,
-                (datetime.now(), current_page["site_id"])
-            )
+                site = cursor.fetchone()
 
             connection.commit()
 
             cursor.close()
+
+            return (site[0] if site else None), claimed
         except (Exception, psycopg2.DatabaseError) as error:
-            print("[ERROR WHILE REMOVING PAGE FROM FRONTIER]", error)
+            print("[ERROR WHILE CLAIMING SITE BOOTSTRAP]", error)
+
+            return None, False
         finally:
             if connection:
                 self.connection_pool.putconn(connection)
 
     """
-        Find a page in the database by the hash_content and return it if it exists
+        Store the robots and sitemaps of a bootstrapped site and release its frontier pages to the crawlers
     """
 
-    def find_page_duplicate(self, hash_content):
+    def finish_site_bootstrap(self, site_id, robots_content, sitemap_content):
         connection = None
 
         try:
@@ -357,28 +1394,27 @@ class DatabaseHandler:
 
             cursor.execute(
                 """
-                    SELECT * FROM crawldb.page WHERE hash_content=%s;
+                    UPDATE crawldb.site 
+                    SET robots_content=%s, sitemap_content=%s, bootstrap_status='READY' 
+                    WHERE id=%s;
                 """,
-                (hash_content,)
+                (robots_content, sitemap_content, site_id)
             )
 
             connection.commit()
 
-            page = cursor.fetchone()
-
-            return page is not None
-
+            cursor.close()
         except (Exception, psycopg2.DatabaseError) as error:
-            print("[ERROR WHILE CHECKING PAGE DUPLICATE]", error)
+            print("[ERROR WHILE FINISHING SITE BOOTSTRAP]", error)
         finally:
             if connection:
                 self.connection_pool.putconn(connection)
 
     """
-        Insert hash signatures for current page
+        Give up an unfinished bootstrap (e. g. when the worker stops), so that another worker can claim it immediately
     """
 
-    def insert_page_signatures(self, page_id, signatures):
+    def release_site_bootstrap(self, site_id):
         connection = None
 
         try:
@@ -388,118 +1424,98 @@ class DatabaseHandler:
 
             cursor.execute(
                 """
-                    INSERT INTO crawldb.content_hash(page_id, hash, hash_length)
-                    VALUES (%s, %s, %s);
+                    UPDATE crawldb.site 
+                    SET bootstrap_started_at=NULL 
+                    WHERE id=%s AND bootstrap_status='PENDING';
                 """,
-                (page_id, str(signatures), len(signatures))
+                (site_id,)
             )
 
             connection.commit()
 
             cursor.close()
-
         except (Exception, psycopg2.DatabaseError) as error:
-            print("[ERROR WHILE INSERTING HASH]", error)
+            print("[ERROR WHILE RELEASING SITE BOOTSTRAP]", error)
         finally:
             if connection:
                 self.connection_pool.putconn(connection)
 
     """
-        Check out what is the percentage of similarity between current page containing set of hash signatures and 
-        already crawled pages
+        Tells if any worker is still bootstrapping a site, its pages will be released to the frontier when it is done
     """
 
-    def calculate_biggest_similarity(self, signatures):
+    def has_pending_site_bootstraps(self):
         connection = None
-        first_matching = None
 
         try:
-            connection = self.connection_pool.getconn()
+            connection = self.get_read_connection()
 
             cursor = connection.cursor()
 
             cursor.execute(
                 """
-                   SELECT * 
-                   FROM   crawldb.content_hash i, LATERAL (
-                        SELECT count(*) AS ct
-                        FROM   unnest(i.hash) signature
-                        WHERE  signature = ANY(%s::bigint[])
-                    ) x, LATERAL (
-                        SELECT (i.hash_length + %s) AS total_sum
-                    ) y
-                    ORDER  BY x.ct DESC, hash_length ASC; 
+                    SELECT EXISTS (
+                        SELECT 1 FROM crawldb.site 
+                        WHERE bootstrap_status='PENDING' 
+                        AND bootstrap_started_at >= now() - %s * interval '1 second'
+                    );
                 """,
-                (str(signatures), len(signatures))
+                (SITE_BOOTSTRAP_TIMEOUT,)
             )
 
-            connection.commit()
-
-            first_matching = cursor.fetchone()
+            pending = cursor.fetchone()[0]
 
-            if first_matching is None:
-                return 0
+            cursor.close()
 
+            return pending
         except (Exception, psycopg2.DatabaseError) as error:
-            print("[ERROR WHILE FINDING SIMILAR PAGES]", error)
-        finally:
+            print("[ERROR WHILE CHECKING SITE BOOTSTRAPS]", error)
 
+            return False
+        finally:
             if connection:
-                self.connection_pool.putconn(connection)
-
-        if first_matching and first_matching[4] > 0:
-
-            # calculate jaccard similarity (intersection over union)
-            return first_matching[4] / (first_matching[5] - first_matching[4])
-
-        else:
-            return 0
+                self.put_read_connection(connection)
 
     """
-        Find a site in the database by the domain name and return it if it exists
+        Seconds until the earliest scheduled revisit of a crawled html page (0 when one is due), None when no revisit is
+        scheduled
     """
 
-    def get_site(self, domain):
+    def get_seconds_until_next_revisit(self):
         connection = None
 
         try:
-            connection = self.connection_pool.getconn()
+            connection = self.get_read_connection()
 
             cursor = connection.cursor()
 
             cursor.execute(
                 """
-                    SELECT * FROM crawldb.site WHERE domain=%s;
-                """,
-                (domain,)
+                    SELECT GREATEST(EXTRACT(EPOCH FROM MIN(next_visit_at) - now()), 0) 
+                    FROM crawldb.page 
+                    WHERE next_visit_at IS NOT NULL AND page_type_code='HTML';
+                """
             )
 
-            connection.commit()
-
-            site = cursor.fetchone()
-
-            if site is None:
-                return
+            seconds = cursor.fetchone()[0]
 
             cursor.close()
 
-            return {
-                "id": site[0],
-                "domain": site[1],
-                "robots_content": site[2],
-                "last_crawled_at": site[4]
-            }
+            return float(seconds) if seconds is not None else None
         except (Exception, psycopg2.DatabaseError) as error:
-            print("[ERROR WHILE FETCHING SITE]", error)
+            print("[ERROR WHILE READING NEXT REVISIT]", error)
+
+            return None
         finally:
             if connection:
-                self.connection_pool.putconn(connection)
+                self.put_read_connection(connection)
 
     """
-        Create a new site if it doesn't exist and return its id
+        Return a page of a site which is not bootstrapped yet to the frontier, with the site id set the page is not
+        claimed again until the site is ready
     """
 
-    def insert_site(self, site):
+    def defer_page_until_site_ready(self, current_page):
         connection = None
 
         try:
@@ -509,24 +1525,18 @@ class DatabaseHandler:
 
             cursor.execute(
                 """
-                    INSERT INTO crawldb.site(domain, robots_content, sitemap_content)
-	                VALUES (%s, %s, %s) RETURNING ID;
+                    UPDATE crawldb.page 
+                    SET site_id=%s, active_in_crawler=NULL, worker_id=NULL 
+                    WHERE id=%s;
                 """,
-                (site["domain"], site["robots_content"], site["sitemap_content"])
+                (current_page["site_id"], current_page["id"])
             )
 
             connection.commit()
 
-            site_id = cursor.fetchone()[0]
-
-            if site_id is None:
-                print("[ERROR WHILE INSERTING SITE] Inserted site was not found")
-
             cursor.close()
-
-            return site_id
         except (Exception, psycopg2.DatabaseError) as error:
-            print("[ERROR WHILE INSERTING SITE]", error)
+            print("[ERROR WHILE DEFERRING PAGE]", error)
         finally:
             if connection:
                 self.connection_pool.putconn(connection)
@@ -582,7 +1592,9 @@ class DatabaseHandler:
                 self.connection_pool.putconn(connection)
 
     """
-        Insert the image that the crawler fetched
+        Insert the image that the crawler fetched. An exact copy of a stored image, or an image with a perceptual hash
+        and a mean color close to those of a stored image, is inserted without its data and only references the stored
+        image (duplicate_of), the id of the stored image is returned for it
     """
 
     def insert_image_data(self, image_data):
@@ -593,6 +1605,36 @@ class DatabaseHandler:
 
             cursor = connection.cursor()
 
+            image_hash = image_data.get("image_hash")
+
+            duplicate_of = None
+
+            if image_hash is not None:
+                self.execute_prepared(cursor, "find_similar_image", similar_image_arguments(image_hash))
+
+                similar_image = cursor.fetchone()
+
+                if similar_image is not None:
+                    duplicate_of = similar_image[0]
+
+            if duplicate_of is not None:
+                # A near duplicate only references the stored image, it does not count towards the size limit
+                cursor.execute(
+                    """
+                        INSERT INTO crawldb.image(page_id, filename, content_type, data, data_size, accessed_time, 
+                        duplicate_of)
+                        VALUES (%s, %s, %s, NULL, 0, %s, %s);
+                    """,
+                    (image_data["page_id"], image_data["filename"], image_data["content_type"],
+                     image_data["accessed_time"], duplicate_of)
+                )
+
+                connection.commit()
+
+                cursor.close()
+
+                return duplicate_of
+
             cursor.execute(
                 """
                     SELECT SUM(data_size)
@@ -617,12 +1659,24 @@ class DatabaseHandler:
             cursor.execute(
                 """
                     INSERT INTO crawldb.image(page_id, filename, content_type, data, data_size, accessed_time)
-                    VALUES (%s, %s, %s, %s, %s, %s);
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    RETURNING id;
                 """,
                 (image_data["page_id"], image_data["filename"], image_data["content_type"], image_data["data"],
                  image_data["data_size"], image_data["accessed_time"])
             )
 
+            image_id = cursor.fetchone()[0]
+
+            if image_hash is not None:
+                cursor.execute(
+                    """
+                        INSERT INTO crawldb.image_hash(image_id, hash, mean_color, digest)
+                        VALUES (%s, %s, %s, %s);
+                    """,
+                    (image_id, image_hash["hash"], image_hash["mean_color"], image_hash["digest"])
+                )
+
             connection.commit()
 
             cursor.close()
@@ -634,7 +1688,7 @@ class DatabaseHandler:
 
     """
         The crawler might have been shut down prematurely and some pages may have the active_in_crawler flag still set
-        This function simply resets all active_in_crawler flags
+        This function resets the active_in_crawler flags of those pages only, the other frontier rows are not rewritten
     """
 
     def reset_frontier(self):
@@ -648,8 +1702,8 @@ class DatabaseHandler:
             cursor.execute(
                 """
                     UPDATE crawldb.page 
-                    SET active_in_crawler=NULL 
-                    WHERE page_type_code = 'FRONTIER';
+                    SET active_in_crawler=NULL, worker_id=NULL 
+                    WHERE page_type_code = 'FRONTIER' AND active_in_crawler IS TRUE;
                 """
             )
 
@@ -674,6 +1728,16 @@ class DatabaseHandler:
 
             cursor = connection.cursor()
 
+            cursor.execute(
+                "DELETE FROM crawldb.image_hash"
+            )
+
+            connection.commit()
+
+            cursor.close()
+
+            cursor = connection.cursor()
+
             cursor.execute(
                 "DELETE FROM crawldb.image"
             )
@@ -695,6 +1759,16 @@ class DatabaseHandler:
             # create a cursor
             cursor = connection.cursor()
 
+            cursor.execute(
+                "DELETE FROM crawldb.content_digest"
+            )
+
+            connection.commit()
+
+            cursor.close()
+
+            cursor = connection.cursor()
+
             cursor.execute(
                 "DELETE FROM crawldb.page_data"
             )
@@ -725,6 +1799,16 @@ class DatabaseHandler:
 
             cursor = connection.cursor()
 
+            cursor.execute(
+                "DELETE FROM crawldb.worker"
+            )
+
+            connection.commit()
+
+            cursor.close()
+
+            cursor = connection.cursor()
+
             cursor.execute(
                 "DELETE FROM crawldb.content_hash"
             )
@@ -732,6 +1816,17 @@ class DatabaseHandler:
             connection.commit()
 
             cursor.close()
+
+            # The checkpoints of every node hold ids of the deleted rows, a new generation makes them all stale
+            cursor = connection.cursor()
+
+            cursor.execute(
+                "UPDATE crawldb.crawl SET generation=generation + 1"
+            )
+
+            connection.commit()
+
+            cursor.close()
         except (Exception, psycopg2.DatabaseError) as error:
             print("[ERROR WHILE RESETTING DATABASE]", error)
         finally:
@@ -742,7 +1837,7 @@ class DatabaseHandler:
         connection = None
 
         try:
-            connection = self.connection_pool.getconn()
+            connection = self.get_read_connection()
 
             cursor = connection.cursor()
 
@@ -752,21 +1847,19 @@ class DatabaseHandler:
                 """
             )
 
-            connection.commit()
-
             return cursor.fetchall()
 
         except (Exception, psycopg2.DatabaseError) as error:
             print("[ERROR WHILE FETCHING SITE]", error)
         finally:
             if connection:
-                self.connection_pool.putconn(connection)
+                self.put_read_connection(connection)
 
     def fetch_all_pages(self):
         connection = None
 
         try:
-            connection = self.connection_pool.getconn()
+            connection = self.get_read_connection()
 
             cursor = connection.cursor()
 
@@ -776,21 +1869,19 @@ class DatabaseHandler:
                 """
             )
 
-            connection.commit()
-
             return cursor.fetchall()
 
         except (Exception, psycopg2.DatabaseError) as error:
             print("[ERROR WHILE FETCHING PAGES]", error)
         finally:
             if connection:
-                self.connection_pool.putconn(connection)
+                self.put_read_connection(connection)
 
     def fetch_all_links(self):
         connection = None
 
         try:
-            connection = self.connection_pool.getconn()
+            connection = self.get_read_connection()
 
             cursor = connection.cursor()
 
@@ -800,21 +1891,19 @@ class DatabaseHandler:
                 """
             )
 
-            connection.commit()
-
             return cursor.fetchall()
 
         except (Exception, psycopg2.DatabaseError) as error:
             print("[ERROR WHILE FETCHING LINKS]", error)
         finally:
             if connection:
-                self.connection_pool.putconn(connection)
+                self.put_read_connection(connection)
 
     def fetch_links_from_specific_domain(self, domain):
         connection = None
 
         try:
-            connection = self.connection_pool.getconn()
+            connection = self.get_read_connection()
 
             cursor = connection.cursor()
 
@@ -831,21 +1920,19 @@ class DatabaseHandler:
                 (domain,)
             )
 
-            connection.commit()
-
             return cursor.fetchall()
 
         except (Exception, psycopg2.DatabaseError) as error:
             print("[ERROR WHILE FETCHING SITE LINKS]", error)
         finally:
             if connection:
-                self.connection_pool.putconn(connection)
+                self.put_read_connection(connection)
 
     def fetch_pages_by_site(self, site_id):
         connection = None
 
         try:
-            connection = self.connection_pool.getconn()
+            connection = self.get_read_connection()
 
             cursor = connection.cursor()
 
@@ -856,12 +1943,336 @@ class DatabaseHandler:
                 (site_id,)
             )
 
-            connection.commit()
-
             return cursor.fetchall()
 
         except (Exception, psycopg2.DatabaseError) as error:
             print("[ERROR WHILE FETCHING SITE]", error)
+        finally:
+            if connection:
+                self.put_read_connection(connection)
+
+    """
+        Stream the pre-aggregated data of the visualisations, the rows are read with named (server-side) cursors, so
+        only batch_size rows are in memory at once. The connection is held until the generator is exhausted or closed.
+        Errors are printed and raised again, so that the caller never takes a partial stream for the whole data
+
+        The in and out degree of every page and its rank in its site (by PageRank, then in degree) are computed once
+        into a temporary table. Frontier pages do not have a site yet, their site is found by the domain of their url
+
+        Yields (section, row) tuples, the sections come one after another:
+            site_summary   (site_id, domain, page_type_code, number_of_pages, in_degree, out_degree) ordered by site
+            site_link      (from_site_id, to_site_id, number_of_links) between different sites
+            page           (site_id, url, page_type_code, in_degree, out_degree, page_rank) of the crawled pages,
+                           ordered by site and rank
+            page_link      (site_id, from_url, to_url, from_in_degree, to_in_degree) between the pages_per_site top
+                           ranked pages of the same site, ordered by site
+    """
+
+    def stream_visualisation_data(self, pages_per_site, batch_size=EXPORT_BATCH_SIZE):
+        queries = (
+            (
+                "site_summary",
+                """
+                    SELECT s.id, s.domain, v.page_type_code, COUNT(v.id), COALESCE(SUM(v.in_degree), 0), 
+                    COALESCE(SUM(v.out_degree), 0) 
+                    FROM crawldb.site s 
+                    LEFT JOIN visualisation_page v ON (v.site_id = s.id) 
+                    GROUP BY s.id, s.domain, v.page_type_code 
+                    ORDER BY s.id
+                """,
+                None
+            ),
+            (
+                "site_link",
+                """
+                    SELECT v1.site_id, v2.site_id, COUNT(*) 
+                    FROM crawldb.link l 
+                    INNER JOIN visualisation_page v1 ON (l.from_page = v1.id) 
+                    INNER JOIN visualisation_page v2 ON (l.to_page = v2.id) 
+                    WHERE v1.site_id <> v2.site_id 
+                    GROUP BY v1.site_id, v2.site_id
+                """,
+                None
+            ),
+            (
+                "page",
+                """
+                    SELECT site_id, url, page_type_code, in_degree, out_degree, page_rank 
+                    FROM visualisation_page 
+                    WHERE site_id IS NOT NULL AND page_type_code <> 'FRONTIER' 
+                    ORDER BY site_id, site_rank
+                """,
+                None
+            ),
+            (
+                "page_link",
+                """
+                    SELECT v1.site_id, v1.url, v2.url, v1.in_degree, v2.in_degree 
+                    FROM crawldb.link l 
+                    INNER JOIN visualisation_page v1 ON (l.from_page = v1.id) 
+                    INNER JOIN visualisation_page v2 ON (l.to_page = v2.id) 
+                    WHERE v1.site_id = v2.site_id AND v1.site_rank <= %s AND v2.site_rank <= %s 
+                    ORDER BY v1.site_id
+                """,
+                (pages_per_site, pages_per_site)
+            )
+        )
+
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    CREATE TEMPORARY TABLE visualisation_page ON COMMIT DROP AS 
+                    SELECT page.*, ROW_NUMBER() OVER (
+                        PARTITION BY site_id ORDER BY page_rank DESC NULLS LAST, in_degree DESC, id
+                    ) AS site_rank 
+                    FROM (
+                        SELECT p.id, COALESCE(p.site_id, s.id) AS site_id, p.url, p.page_type_code, p.page_rank, 
+                        COALESCE(in_links.degree, 0) AS in_degree, COALESCE(out_links.degree, 0) AS out_degree 
+                        FROM crawldb.page p 
+                        LEFT JOIN crawldb.site s 
+                        ON (p.site_id IS NULL AND s.domain = substring(p.url from '^[^:]+://[^/]+') || '/') 
+                        LEFT JOIN (
+                            SELECT to_page, COUNT(*) AS degree FROM crawldb.link GROUP BY to_page
+                        ) in_links ON (in_links.to_page = p.id) 
+                        LEFT JOIN (
+                            SELECT from_page, COUNT(*) AS degree FROM crawldb.link GROUP BY from_page
+                        ) out_links ON (out_links.from_page = p.id)
+                    ) page;
+
+                    CREATE INDEX ON visualisation_page (id);
+
+                    ANALYZE visualisation_page;
+                """
+            )
+
+            cursor.close()
+
+            for section, query, query_vars in queries:
+                cursor = connection.cursor(name="stream_visualisation_{}".format(section))
+
+                cursor.itersize = batch_size
+
+                cursor.execute(query, query_vars)
+
+                for row in cursor:
+                    yield section, row
+
+                cursor.close()
+
+            # Drops the temporary table
+            connection.commit()
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE STREAMING VISUALISATION DATA]", error)
+
+            raise
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
+
+    """
+        Run COPY ... TO STDOUT for every (query, output) pair, the rows are written to the output file-like objects as
+        they are read. All the queries see the same snapshot of the database, so e. g. the exported links never point
+        to pages which are missing in the exported pages
+
+        copy_format is csv or binary (the binary rows are parsed by the reader, see graph.py)
+    """
+
+    def copy_queries_to(self, copies, copy_format="csv"):
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            connection.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+
+            cursor = connection.cursor()
+
+            for query, output in copies:
+                cursor.copy_expert("COPY ({}) TO STDOUT WITH (FORMAT {})".format(query, copy_format), output)
+
+            connection.commit()
+
+            cursor.close()
+
+            return True
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE COPYING DATA]", error)
+
+            return False
+        finally:
+            if connection:
+                connection.rollback()
+
+                connection.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
+
+                self.connection_pool.putconn(connection)
+
+    """
+        Store the PageRank of the pages, ranks is a file-like object with the binary COPY input of (id, page_rank,
+        score) rows. Frontier pages get the higher of their priority and score, so the frontier is ordered by the
+        importance of the pages in the link graph. The ranks are copied into a temporary table and stored with one
+        UPDATE
+    """
+
+    def update_page_ranks(self, ranks):
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    CREATE TEMPORARY TABLE page_rank (id integer, page_rank real, score real) ON COMMIT DROP
+                """
+            )
+
+            cursor.copy_expert("COPY page_rank FROM STDIN WITH (FORMAT binary)", ranks)
+
+            cursor.execute(
+                """
+                    UPDATE crawldb.page p 
+                    SET page_rank = r.page_rank, 
+                    priority = CASE 
+                        WHEN p.page_type_code = 'FRONTIER' THEN GREATEST(p.priority, r.score) 
+                        ELSE p.priority 
+                    END 
+                    FROM page_rank r 
+                    WHERE p.id = r.id
+                """
+            )
+
+            number_of_pages = cursor.rowcount
+
+            connection.commit()
+
+            cursor.close()
+
+            return number_of_pages
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE UPDATING PAGE RANKS]", error)
+        finally:
+            if connection:
+                self.connection_pool.putconn(connection)
+
+    """
+        HTML pages which were crawled (or changed) since they were last indexed, as (id, accessed_time, html_content)
+        tuples
+    """
+
+    def fetch_unindexed_pages(self, batch_size):
+        connection = None
+
+        try:
+            connection = self.get_read_connection()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    SELECT id, accessed_time, html_content FROM crawldb.page 
+                    WHERE page_type_code='HTML' AND indexed_at IS NULL 
+                    ORDER BY id 
+                    LIMIT %s
+                """,
+                (batch_size,)
+            )
+
+            pages = cursor.fetchall()
+
+            cursor.close()
+
+            return pages
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE FETCHING UNINDEXED PAGES]", error)
+
+            return []
+        finally:
+            if connection:
+                self.put_read_connection(connection)
+
+    """
+        Store the search vectors of the indexed pages from their (id, accessed_time, title, content) tuples, the title is
+        weighted higher than the content. Pages which were crawled again while they were indexed are left for the next
+        batch. Returns the number of updated pages
+    """
+
+    def update_search_vectors(self, documents):
+        connection = None
+
+        try:
+            connection = self.connection_pool.getconn()
+
+            cursor = connection.cursor()
+
+            execute_values(
+                cursor,
+                """
+                    UPDATE crawldb.page 
+                    SET search_vector = setweight(to_tsvector('{0}', document.title), 'A') || 
+                    setweight(to_tsvector('{0}', document.content), 'B'), 
+                    indexed_at = now() 
+                    FROM (VALUES %s) AS document(id, accessed_time, title, content) 
+                    WHERE page.id = document.id AND page.accessed_time IS NOT DISTINCT FROM document.accessed_time
+                """.format(SEARCH_CONFIGURATION),
+                documents,
+                template="(%s, %s::timestamp, %s, %s)",
+                page_size=len(documents)
+            )
+
+            number_of_pages = cursor.rowcount
+
+            connection.commit()
+
+            cursor.close()
+
+            return number_of_pages
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE UPDATING SEARCH VECTORS]", error)
         finally:
             if connection:
                 self.connection_pool.putconn(connection)
+
+    """
+        Search the indexed pages, the query is in the web search syntax ("quoted phrases", or, -excluded). Returns the
+        best matching pages as dictionaries with id, url and rank, pages with a higher PageRank win the ties
+    """
+
+    def search_pages(self, query, limit=10):
+        connection = None
+
+        try:
+            connection = self.get_read_connection()
+
+            cursor = connection.cursor()
+
+            cursor.execute(
+                """
+                    SELECT p.id, p.url, ts_rank_cd(p.search_vector, q.query) AS rank 
+                    FROM crawldb.page p, websearch_to_tsquery(%s::regconfig, %s) q(query) 
+                    WHERE p.search_vector @@ q.query AND p.page_type_code='HTML' 
+                    ORDER BY rank DESC, p.page_rank DESC NULLS LAST 
+                    LIMIT %s
+                """,
+                (SEARCH_CONFIGURATION, query, limit)
+            )
+
+            pages = [{"id": page[0], "url": unquote(page[1]), "rank": page[2]} for page in cursor.fetchall()]
+
+            cursor.close()
+
+            return pages
+        except (Exception, psycopg2.DatabaseError) as error:
+            print("[ERROR WHILE SEARCHING PAGES]", error)
+
+            return []
+        finally:
+            if connection:
+                self.put_read_connection(connection)
@@ -0,0 +1,281 @@
+import ipaddress
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.managers import SyncManager
+
+from metrics import metrics
+
+try:
+    import dns.resolver
+except ImportError:
+    dns = None
+
+"""
+    Caching DNS resolver of the crawler processes. Many gov.si hostnames are virtual hosts of the same few servers, so
+    the addresses of a host are cached (as long as their TTL allows) and the politeness delay is kept per server
+    (resolved address) instead of per site
+
+    The cache and the server schedules are shared by all the crawler processes through a multiprocessing manager, every
+    process also keeps its own copy of the cached addresses, so most lookups never leave the process. The hosts of newly
+    found links are resolved in background threads before their pages are crawled
+
+    install() makes urllib3 (and so requests) connect to the cached addresses, the Host header and SNI still use the
+    hostname. The TTL of the records is only known with dnspython (pip install dnspython), otherwise the addresses of
+    socket.getaddrinfo are cached for DEFAULT_TTL seconds
+"""
+
+# How long the addresses are cached when the TTL is not known (seconds)
+DEFAULT_TTL = 300
+
+# The TTL of the records is kept between these bounds (seconds)
+MIN_TTL = 60
+
+MAX_TTL = 3600
+
+# Hosts which can not be resolved are not looked up again for this long (seconds)
+NEGATIVE_TTL = 60
+
+# Minimum time between two requests of all the crawler processes to the same server (seconds)
+SERVER_DELAY = 1
+
+# Number of threads of a crawler process which resolve the hosts of new links
+DNS_PREFETCH_THREADS = 2
+
+# Hosts which wait for the prefetch threads, new hosts are not prefetched when there are more
+MAX_PENDING_PREFETCHES = 1000
+
+
+def ignore_interrupt():
+    # Ctrl-C is handled by the Crawler, the manager has to stay alive until the processes finish their pages
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+"""
+    Start the manager which holds the resolver state shared by the crawler processes, the returned state is passed to
+    every DnsResolver
+"""
+
+
+def create_shared_state():
+    manager = SyncManager()
+    manager.start(ignore_interrupt)
+
+    shared_state = {
+        "addresses": manager.dict(),
+        "server_schedules": manager.dict(),
+        "lock": manager.Lock()
+    }
+
+    return manager, shared_state
+
+
+"""
+    Addresses (sorted tuple of IPv4 addresses) and TTL of a host, an empty tuple when it could not be resolved
+"""
+
+
+def lookup_host(host):
+    try:
+        ipaddress.ip_address(host)
+
+        return (host,), MAX_TTL
+    except ValueError:
+        pass
+
+    try:
+        if dns is not None:
+            answer = dns.resolver.resolve(host, "A")
+
+            return tuple(sorted(record.address for record in answer)), min(max(answer.rrset.ttl, MIN_TTL), MAX_TTL)
+
+        addresses = socket.getaddrinfo(host, None, socket.AF_INET, socket.SOCK_STREAM)
+
+        return tuple(sorted({address[4][0] for address in addresses})), DEFAULT_TTL
+    except Exception:
+        return (), NEGATIVE_TTL
+
+
+class DnsResolver:
+    """
+        shared_state comes from create_shared_state, without it the cache and the server schedules are only kept in
+        this process
+    """
+
+    def __init__(self, shared_state=None, server_delay=SERVER_DELAY, prefetch_threads=DNS_PREFETCH_THREADS):
+        self.shared_state = shared_state
+
+        self.server_delay = server_delay
+
+        # host -> (addresses, expires_at) of this process
+        self.addresses = {}
+
+        self.server_schedules = {}
+
+        self.lock = threading.Lock()
+
+        self.executor = ThreadPoolExecutor(max_workers=prefetch_threads)
+
+        self.pending_prefetches = set()
+
+        self.original_create_connection = None
+
+    """
+        Cached addresses of the host, it is resolved when it is not in the cache of this process or of the shared state
+    """
+
+    def resolve(self, host):
+        now = time.time()
+
+        cached = self.addresses.get(host)
+
+        if cached is not None and cached[1] > now:
+            metrics.increment("crawler_dns_lookups_total", result="hit")
+
+            return cached[0]
+
+        if self.shared_state is not None:
+            try:
+                cached = self.shared_state["addresses"].get(host)
+            except Exception as error:
+                print("[DNS] Error while reading the shared cache", error)
+
+                cached = None
+
+            if cached is not None and cached[1] > now:
+                self.addresses[host] = cached
+
+                metrics.increment("crawler_dns_lookups_total", result="shared")
+
+                return cached[0]
+
+        with metrics.timer("crawler_dns_seconds"):
+            addresses, ttl = lookup_host(host)
+
+        metrics.increment("crawler_dns_lookups_total", result="miss" if addresses else "error")
+
+        cached = (addresses, time.time() + ttl)
+
+        self.addresses[host] = cached
+
+        if self.shared_state is not None:
+            try:
+                self.shared_state["addresses"][host] = cached
+            except Exception as error:
+                print("[DNS] Error while updating the shared cache", error)
+
+        return addresses
+
+    """
+        Resolve the hosts which are not cached yet in the background
+    """
+
+    def prefetch(self, hosts):
+        now = time.time()
+
+        for host in hosts:
+            if not host:
+                continue
+
+            cached = self.addresses.get(host)
+
+            if cached is not None and cached[1] > now:
+                continue
+
+            with self.lock:
+                if host in self.pending_prefetches or len(self.pending_prefetches) >= MAX_PENDING_PREFETCHES:
+                    continue
+
+                self.pending_prefetches.add(host)
+
+            self.executor.submit(self.prefetch_host, host)
+
+    def prefetch_host(self, host):
+        try:
+            self.resolve(host)
+        finally:
+            with self.lock:
+                self.pending_prefetches.discard(host)
+
+    """
+        Hosts with the same (first) address are served by the same server, hosts which can not be resolved are their
+        own server
+    """
+
+    def server_of(self, host):
+        addresses = self.resolve(host)
+
+        return addresses[0] if addresses else host
+
+    """
+        Reserve the next request slot of the server of the host and wait for it, the slots of a server are at least
+        server_delay seconds apart for all the crawler processes
+    """
+
+    def wait_for_server(self, host):
+        server = self.server_of(host)
+
+        if self.shared_state is not None:
+            lock, server_schedules = self.shared_state["lock"], self.shared_state["server_schedules"]
+        else:
+            lock, server_schedules = self.lock, self.server_schedules
+
+        try:
+            with lock:
+                now = time.time()
+
+                requested_at = max(now, server_schedules.get(server, 0) + self.server_delay)
+
+                server_schedules[server] = requested_at
+        except Exception as error:
+            print("[DNS] Error while scheduling the request to server {}".format(server), error)
+
+            return
+
+        if requested_at > now:
+            metrics.observe("crawler_server_wait_seconds", requested_at - now)
+
+            time.sleep(requested_at - now)
+
+    """
+        Make urllib3 connect to the cached addresses of the hosts, the addresses are tried in order
+    """
+
+    def install(self):
+        try:
+            import urllib3.util.connection as urllib3_connection
+        except ImportError:
+            print("[DNS] urllib3 is not installed, the requests are resolved without the cache")
+
+            return
+
+        if self.original_create_connection is not None:
+            return
+
+        self.original_create_connection = urllib3_connection.create_connection
+
+        def create_connection(address, *args, **kwargs):
+            host, port = address
+
+            addresses = self.resolve(host)
+
+            if not addresses:
+                # Let urllib3 resolve the host and report the error
+                return self.original_create_connection(address, *args, **kwargs)
+
+            last_error = None
+
+            for ip_address in addresses:
+                try:
+                    return self.original_create_connection((ip_address, port), *args, **kwargs)
+                except OSError as error:
+                    last_error = error
+
+            raise last_error
+
+        urllib3_connection.create_connection = create_connection
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
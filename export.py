@@ -1,66 +1,405 @@
+import argparse
 import json
-from database_handler import DatabaseHandler
+import os
+import shutil
+import sys
+from urllib.parse import urlparse
+from database_handler import DatabaseHandler, EXPORT_BATCH_SIZE
 
 """
     Run this script every time you want to export data from db for visualisation. For every graphic json file is
     generated and placed into prepared directory (visualisation/...)
+
+    The data is exported in two levels of detail, so the visualisations only lay out what is shown:
+        - data.json holds one node per site (number of pages by type, in and out degree) and for the links view the
+          number of links between sites
+        - sites/<site id>.json holds the pages of one site and is loaded when the site is clicked. The pages are
+          clustered by the first segment of their path and only the pages_per_site pages with the highest PageRank
+          (the most incoming links, if graph.py has not ranked them yet) are drawn, the other pages of a cluster are
+          summed into one node
+
+    The degrees and ranks are computed in the database and the rows are streamed with server-side cursors, the drill
+    down files are written one site at a time, so the memory use does not grow with the number of pages
 """
 
+PAGES_DIRECTORY = 'visualisation/pages'
 
-# ----------- EXPORT DATA FOR PACK VISUALISATION SITES AND PAGES -------------------
+LINKS_DIRECTORY = 'visualisation/links'
+
+# Number of pages (with the highest rank) of a site which are drawn when the site is opened
+PAGES_PER_SITE = 500
+
+SITES_DIRECTORY = 'sites'
+
+# Node size of a page in the pages view
+PAGE_SIZE = 5
+
+
+"""
+    The json is written to a temporary file which replaces the output at the end, so the visualisation never reads a
+    half written file
+"""
+
+
+def open_output(path):
+    return open(path + '.tmp', 'w')
+
+
+def close_output(outfile, path):
+    outfile.close()
+
+    os.replace(path + '.tmp', path)
+
+
+"""
+    The drill down files are written into a temporary directory which replaces the previous one at the end
+"""
+
+
+def create_sites_directory(directory):
+    path = os.path.join(directory, SITES_DIRECTORY + '.tmp')
+
+    shutil.rmtree(path, ignore_errors=True)
+
+    os.makedirs(path)
+
+    return path
+
+
+def replace_sites_directory(directory):
+    path = os.path.join(directory, SITES_DIRECTORY)
+
+    shutil.rmtree(path, ignore_errors=True)
+
+    os.replace(path + '.tmp', path)
+
+
+def discard_sites_directory(directory):
+    shutil.rmtree(os.path.join(directory, SITES_DIRECTORY + '.tmp'), ignore_errors=True)
+
+
+def site_file(site_id):
+    return '{}/{}.json'.format(SITES_DIRECTORY, site_id)
+
+
+def cluster_name(url):
+    segments = urlparse(url).path.split('/')
+
+    if len(segments) > 2 and segments[1]:
+        return '/{}/'.format(segments[1])
+
+    return '/'
+
+
+class SitePagesWriter:
+    """
+        Writes the drill down file of the pages view for every site, the pages come ordered by site and rank
+    """
+
+    def __init__(self, directory, sites, pages_per_site):
+        self.path = create_sites_directory(directory)
+
+        self.sites = sites
+
+        self.pages_per_site = pages_per_site
+
+        self.site_id = None
+
+        self.clusters = {}
+
+        self.number_of_pages = 0
+
+        self.written_sites = set()
+
+    def add_page(self, site_id, url, page_type_code, in_degree, out_degree, page_rank):
+        if site_id != self.site_id:
+            self.write_site()
+
+            self.site_id = site_id
+
+            self.clusters = {}
+
+            self.number_of_pages = 0
+
+        cluster = self.clusters.setdefault(cluster_name(url), {'pages': [], 'hidden': 0})
+
+        if self.number_of_pages < self.pages_per_site:
+            cluster['pages'].append(
+                {
+                    'name': url,
+                    'type': page_type_code,
+                    'size': PAGE_SIZE,
+                    'in_degree': in_degree,
+                    'out_degree': out_degree,
+                    'page_rank': page_rank,
+                    'children': []
+                }
+            )
+        else:
+            cluster['hidden'] += 1
+
+        self.number_of_pages += 1
+
+    def write_site(self):
+        if self.site_id is None:
+            return
+
+        children = []
+
+        for name, cluster in sorted(self.clusters.items()):
+            pages = cluster['pages']
+
+            if cluster['hidden']:
+                pages.append(
+                    {
+                        'name': '+{}'.format(cluster['hidden']),
+                        'type': 'MORE',
+                        'size': PAGE_SIZE * cluster['hidden'],
+                        'children': []
+                    }
+                )
+
+            children.append(
+                {
+                    'name': name,
+                    'children': pages
+                }
+            )
+
+        self.write_site_file(self.site_id, children)
+
+    def write_site_file(self, site_id, children):
+        self.written_sites.add(site_id)
+
+        site = self.sites.get(site_id, {})
+
+        with open(os.path.join(self.path, '{}.json'.format(site_id)), 'w') as outfile:
+            json.dump({'name': site.get('name'), 'children': children}, outfile)
 
-export_data = {
-    'name': 'Sites',
-    'children': []
-}
+    def close(self):
+        self.write_site()
 
-database_handler = DatabaseHandler(1, 1)
+        # Every site gets a file, so the visualisation can open sites without crawled pages
+        for site_id in self.sites:
+            if site_id not in self.written_sites:
+                self.write_site_file(site_id, [])
 
-sites = database_handler.fetch_all_sites()
 
-for site in sites:
+class SiteLinksWriter:
+    """
+        Writes the drill down file of the links view for every site, the links are written as they arrive
+    """
 
-    site_pages = database_handler.fetch_pages_by_site(site[0])
+    def __init__(self, directory):
+        self.path = create_sites_directory(directory)
 
-    child_pages = []
+        self.site_id = None
 
-    for page in site_pages:
-        child_pages.append(
+        self.outfile = None
+
+        self.number_of_links = 0
+
+        self.written_sites = set()
+
+    def add_link(self, site_id, from_url, to_url, from_in_degree, to_in_degree):
+        if site_id != self.site_id:
+            self.close_site()
+
+            self.site_id = site_id
+
+            self.outfile = self.open_site(site_id)
+
+            self.number_of_links = 0
+
+        if self.number_of_links > 0:
+            self.outfile.write(', ')
+
+        json.dump(
             {
-                'name': page[3],
-                'type': page[2],
-                'size': 5,
-                'children': []
-            }
+                'source': from_url,
+                'target': to_url,
+                'source_in_degree': from_in_degree,
+                'target_in_degree': to_in_degree,
+                'weight': 1,
+                'type': ''
+            },
+            self.outfile
         )
 
-    export_data['children'].append(
+        self.number_of_links += 1
+
+    def open_site(self, site_id):
+        self.written_sites.add(site_id)
+
+        outfile = open(os.path.join(self.path, '{}.json'.format(site_id)), 'w')
+
+        outfile.write('{"links": [')
+
+        return outfile
+
+    def close_site(self):
+        if self.outfile is not None:
+            self.outfile.write(']}')
+
+            self.outfile.close()
+
+            self.outfile = None
+
+    def close(self, site_ids):
+        self.close_site()
+
+        # Every site gets a file, so the visualisation can open sites without links between their pages
+        for site_id in site_ids:
+            if site_id not in self.written_sites:
+                self.outfile = self.open_site(site_id)
+
+                self.close_site()
+
+
+def add_site_summary(sites, site_id, domain, page_type_code, number_of_pages, in_degree, out_degree):
+    site = sites.setdefault(site_id, {'name': domain, 'types': {}, 'pages': 0, 'in_degree': 0, 'out_degree': 0})
+
+    if page_type_code is None:
+        # A site without pages
+        return
+
+    site['types'][page_type_code] = number_of_pages
+
+    if page_type_code != 'FRONTIER':
+        site['pages'] += number_of_pages
+
+    site['in_degree'] += in_degree
+
+    site['out_degree'] += out_degree
+
+
+# ----------- EXPORT DATA FOR PACK VISUALISATION SITES AND PAGES -------------------
+
+def write_pages_summary(path, sites):
+    outfile = open_output(path)
+
+    json.dump(
         {
-            'name': site[1],
-            'children': child_pages
-        }
+            'name': 'Sites',
+            'children': [
+                {
+                    'name': site['name'],
+                    'size': max(site['pages'], 1),
+                    'pages': site['pages'],
+                    'types': site['types'],
+                    'file': site_file(site_id),
+                    'children': []
+                } for site_id, site in sites.items()
+            ]
+        },
+        outfile
     )
 
-with open('visualisation/pages/data.json', 'w') as outfile:
-    json.dump(export_data, outfile)
+    close_output(outfile, path)
 
-# ----------- EXPORT DATA FOR NETWORK VISUALISATION CONNECTIONS BETWEEN PAGES ---------------------
 
-export_links_data = {
-    'links': []
-}
+# ----------- EXPORT DATA FOR NETWORK VISUALISATION CONNECTIONS BETWEEN PAGES ---------------------
 
-links = database_handler.fetch_links_from_specific_domain('http://evem.gov.si/')
+def write_links_summary(path, sites, site_links):
+    outfile = open_output(path)
 
-for link in links:
-    export_links_data['links'].append(
+    json.dump(
         {
-            'source': link[2],
-            'target': link[3],
-            'weight': 1,
-            'type': ''
-        }
+            'nodes': [
+                {
+                    'id': site_id,
+                    'name': site['name'],
+                    'pages': site['pages'],
+                    'in_degree': site['in_degree'],
+                    'out_degree': site['out_degree'],
+                    'file': site_file(site_id)
+                } for site_id, site in sites.items()
+            ],
+            'links': [
+                {
+                    'source': from_site_id,
+                    'target': to_site_id,
+                    'weight': number_of_links
+                } for from_site_id, to_site_id, number_of_links in site_links
+            ]
+        },
+        outfile
     )
 
-with open('visualisation/links/data.json', 'w') as links_outfile:
-    json.dump(export_links_data, links_outfile)
+    close_output(outfile, path)
+
+
+def export(database_handler, pages_directory, links_directory, pages_per_site, batch_size):
+    sites = {}
+
+    site_links = []
+
+    pages_writer = SitePagesWriter(pages_directory, sites, pages_per_site)
+
+    links_writer = SiteLinksWriter(links_directory)
+
+    number_of_pages = 0
+
+    try:
+        for section, row in database_handler.stream_visualisation_data(pages_per_site, batch_size):
+            if section == 'site_summary':
+                add_site_summary(sites, *row)
+            elif section == 'site_link':
+                site_links.append(row)
+            elif section == 'page':
+                pages_writer.add_page(*row)
+
+                number_of_pages += 1
+            elif section == 'page_link':
+                links_writer.add_link(*row)
+
+        pages_writer.close()
+
+        links_writer.close(sites.keys())
+    except Exception as error:
+        # The files of the previous export are only replaced after a complete stream
+        print("[EXPORT] Export failed, the previous files are kept", error)
+
+        links_writer.close_site()
+
+        discard_sites_directory(pages_directory)
+
+        discard_sites_directory(links_directory)
+
+        return False
+
+    write_pages_summary(os.path.join(pages_directory, 'data.json'), sites)
+
+    write_links_summary(os.path.join(links_directory, 'data.json'), sites, site_links)
+
+    replace_sites_directory(pages_directory)
+
+    replace_sites_directory(links_directory)
+
+    print("[EXPORT] Exported {} sites, {} links between sites and {} pages".format(len(sites), len(site_links),
+                                                                                  number_of_pages))
+
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the crawled data for the visualisations")
+
+    parser.add_argument("--pages-directory", default=PAGES_DIRECTORY)
+    parser.add_argument("--links-directory", default=LINKS_DIRECTORY)
+    parser.add_argument("--pages-per-site", type=int, default=PAGES_PER_SITE,
+                        help="number of pages with the highest rank which are drawn for a site")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE,
+                        help="number of rows fetched from the database at once")
+
+    arguments = parser.parse_args()
+
+    database_handler = DatabaseHandler(1, 1)
+
+    if not export(database_handler, arguments.pages_directory, arguments.links_directory, arguments.pages_per_site,
+                  arguments.batch_size):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
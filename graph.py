@@ -0,0 +1,360 @@
+import argparse
+import io
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from database_handler import DatabaseHandler
+
+"""
+    In-memory link graph of the crawl, used to compute PageRank and in-degrees of all the pages at once
+
+    The graph is stored in the compressed sparse row (CSR) format over the incoming links: for the page with id v the
+    ids of the pages linking to it are sources[indptr[v]:indptr[v + 1]]. Page ids are used as node ids directly. An
+    edge takes 4 bytes (one int32 source) and a node 12 bytes (int64 offset and int32 out-degree), instead of a Python
+    tuple per link
+
+    New links are appended to a pending buffer and merged into the CSR arrays in batches, PageRank is warm started from
+    the previous ranks, so a refresh only costs a few iterations
+
+    Run it next to the crawler, it periodically loads the new links, stores the PageRank of every page into
+    page.page_rank and raises the priority of the frontier pages with a high rank
+
+    Usage: python graph.py --interval 300
+"""
+
+# Probability of following a link (the rest is a jump to a random page)
+DAMPING = 0.85
+
+# PageRank stops when the L1 change of the ranks drops below this
+TOLERANCE = 1e-6
+
+MAX_ITERATIONS = 100
+
+# Pending links are merged into the CSR arrays when there are more than this many of them
+MIN_PENDING_EDGES = 100000
+
+# ... or when they are more than this fraction of the edges in the graph
+MAX_PENDING_RATIO = 0.1
+
+# How often the new links are loaded and the ranks are stored (seconds)
+REFRESH_INTERVAL = 300
+
+# Links are inserted when the crawl of a page ends, the page was accessed before that, so the links of the pages
+# accessed shortly before the previous refresh are loaded again (duplicates are removed when merging)
+REFRESH_OVERLAP = timedelta(minutes=10)
+
+# Signature of the binary COPY format, followed by the flags and the length of the header extension
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+COPY_HEADER_LENGTH = len(COPY_SIGNATURE) + 8
+
+# A (from_page, to_page) row of the binary COPY format: number of fields and (length, value) of each integer
+COPY_EDGE_TYPE = np.dtype([("fields", ">i2"), ("from_length", ">i4"), ("from_page", ">i4"), ("to_length", ">i4"),
+                           ("to_page", ">i4")])
+
+# A (id, page_rank, score) row of the binary COPY format
+COPY_RANK_TYPE = np.dtype([("fields", ">i2"), ("id_length", ">i4"), ("id", ">i4"), ("rank_length", ">i4"),
+                           ("page_rank", ">f4"), ("score_length", ">i4"), ("score", ">f4")])
+
+
+class LinkGraph:
+    def __init__(self):
+        self.number_of_nodes = 0
+
+        # CSR of the incoming links, indptr has number_of_nodes + 1 offsets into sources
+        self.indptr = np.zeros(1, dtype=np.int64)
+
+        self.sources = np.zeros(0, dtype=np.int32)
+
+        self.out_degree = np.zeros(0, dtype=np.int32)
+
+        # Links which are not merged into the CSR arrays yet, as (sources, targets) array pairs
+        self.pending = []
+
+        self.number_of_pending_edges = 0
+
+        # Ranks of the last PageRank computation, the next one starts from them
+        self.rank = None
+
+    @property
+    def number_of_edges(self):
+        return len(self.sources)
+
+    def add_edges(self, sources, targets):
+        if len(sources) == 0:
+            return
+
+        self.pending.append((np.asarray(sources, dtype=np.int32), np.asarray(targets, dtype=np.int32)))
+
+        self.number_of_pending_edges += len(sources)
+
+        if self.number_of_pending_edges > max(MIN_PENDING_EDGES, MAX_PENDING_RATIO * self.number_of_edges):
+            self.merge()
+
+    """
+        Merge the pending links into the CSR arrays. A link is one int64 key (target << 32 | source), the keys of the
+        graph are already sorted, so only the new keys are sorted and inserted at their positions, duplicates are
+        dropped
+    """
+
+    def merge(self):
+        if not self.pending:
+            return
+
+        new_keys = np.unique(np.concatenate([
+            pending_targets.astype(np.int64) << 32 | pending_sources.astype(np.int64)
+            for pending_sources, pending_targets in self.pending
+        ]))
+
+        self.pending = []
+
+        self.number_of_pending_edges = 0
+
+        keys = np.repeat(np.arange(self.number_of_nodes, dtype=np.int64), np.diff(self.indptr)) << 32 | self.sources
+
+        positions = np.searchsorted(keys, new_keys)
+
+        known = np.zeros(len(new_keys), dtype=bool)
+
+        if len(keys) > 0:
+            known = keys[np.minimum(positions, len(keys) - 1)] == new_keys
+
+        keys = np.insert(keys, positions[~known], new_keys[~known])
+
+        del new_keys, positions, known
+
+        targets = (keys >> 32).astype(np.int32)
+
+        self.sources = (keys & 0xffffffff).astype(np.int32)
+
+        del keys
+
+        self.number_of_nodes = max(self.number_of_nodes, int(targets[-1]) + 1, int(self.sources.max()) + 1)
+
+        self.indptr = np.zeros(self.number_of_nodes + 1, dtype=np.int64)
+
+        np.cumsum(np.bincount(targets, minlength=self.number_of_nodes), out=self.indptr[1:])
+
+        self.out_degree = np.bincount(self.sources, minlength=self.number_of_nodes).astype(np.int32)
+
+    def in_degree(self):
+        self.merge()
+
+        return np.diff(self.indptr).astype(np.int32)
+
+    """
+        Power iteration of PageRank, the rank of the pages without outgoing links is spread over all the pages. Node ids
+        which are not pages (gaps in the page ids) only get the random jump share of the rank
+    """
+
+    def page_rank(self, damping=DAMPING, tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS):
+        self.merge()
+
+        n = self.number_of_nodes
+
+        if n == 0:
+            return np.zeros(0)
+
+        rank = np.full(n, 1.0 / n)
+
+        if self.rank is not None:
+            # Warm start, new nodes start with the uniform rank
+            rank[:len(self.rank)] = self.rank[:n]
+
+            rank /= rank.sum()
+
+        dangling = self.out_degree == 0
+
+        inverse_out_degree = np.zeros(n)
+
+        inverse_out_degree[~dangling] = 1.0 / self.out_degree[~dangling]
+
+        # np.add.reduceat sums the contributions of every target with incoming links
+        has_incoming = np.diff(self.indptr) > 0
+
+        row_starts = self.indptr[:-1][has_incoming]
+
+        for iteration in range(max_iterations):
+            incoming = np.zeros(n)
+
+            if self.number_of_edges > 0:
+                incoming[has_incoming] = np.add.reduceat((rank * inverse_out_degree)[self.sources], row_starts)
+
+            new_rank = (1 - damping) / n + damping * (incoming + rank[dangling].sum() / n)
+
+            change = np.abs(new_rank - rank).sum()
+
+            rank = new_rank
+
+            if change < tolerance:
+                break
+
+        self.rank = rank
+
+        return rank
+
+
+"""
+    The score of a page is its percentile by PageRank [0,1], frontier pages get the higher of their priority and score
+"""
+
+
+def rank_percentiles(rank):
+    percentiles = np.empty(len(rank))
+
+    if len(rank) > 1:
+        percentiles[np.argsort(rank, kind="stable")] = np.arange(len(rank)) / (len(rank) - 1)
+    else:
+        percentiles[:] = 1
+
+    return percentiles
+
+
+class BinaryEdgeReader:
+    """
+        File-like object which receives the binary COPY output of (from_page, to_page) rows and parses the complete
+        rows with numpy, the header is skipped and the 2 byte trailer is left in the buffer
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+        self.buffer = bytearray()
+
+        self.header_skipped = False
+
+        self.number_of_edges = 0
+
+    def write(self, data):
+        self.buffer += data
+
+        if not self.header_skipped:
+            if len(self.buffer) < COPY_HEADER_LENGTH:
+                return len(data)
+
+            extension_length = int.from_bytes(self.buffer[COPY_HEADER_LENGTH - 4:COPY_HEADER_LENGTH], "big")
+
+            if len(self.buffer) < COPY_HEADER_LENGTH + extension_length:
+                return len(data)
+
+            del self.buffer[:COPY_HEADER_LENGTH + extension_length]
+
+            self.header_skipped = True
+
+        number_of_rows = len(self.buffer) // COPY_EDGE_TYPE.itemsize
+
+        if number_of_rows > 0:
+            end = number_of_rows * COPY_EDGE_TYPE.itemsize
+
+            rows = np.frombuffer(bytes(self.buffer[:end]), dtype=COPY_EDGE_TYPE)
+
+            del self.buffer[:end]
+
+            self.graph.add_edges(rows["from_page"], rows["to_page"])
+
+            self.number_of_edges += number_of_rows
+
+        return len(data)
+
+
+"""
+    Binary COPY input of (id, page_rank, score) rows for DatabaseHandler.update_page_ranks
+"""
+
+
+def encode_ranks(page_ids, rank, score):
+    rows = np.empty(len(page_ids), dtype=COPY_RANK_TYPE)
+
+    rows["fields"] = 3
+    rows["id_length"] = 4
+    rows["id"] = page_ids
+    rows["rank_length"] = 4
+    rows["page_rank"] = rank
+    rows["score_length"] = 4
+    rows["score"] = score
+
+    return io.BytesIO(COPY_SIGNATURE + bytes(8) + rows.tobytes() + b"\xff\xff")
+
+
+class GraphUpdater:
+    """
+        Keeps the link graph in sync with crawldb.link and writes the ranks back to the database
+    """
+
+    def __init__(self, database_handler):
+        self.database_handler = database_handler
+
+        self.graph = LinkGraph()
+
+        self.refreshed_at = None
+
+    def load_links(self):
+        refresh_started_at = datetime.now()
+
+        query = """
+            SELECT l.from_page, l.to_page
+            FROM crawldb.link l
+        """
+
+        if self.refreshed_at is not None:
+            # Only the links of the pages crawled since the previous refresh
+            query += """
+                INNER JOIN crawldb.page p ON (l.from_page = p.id)
+                WHERE p.accessed_time >= '{}'::timestamp
+            """.format((self.refreshed_at - REFRESH_OVERLAP).isoformat())
+
+        reader = BinaryEdgeReader(self.graph)
+
+        if not self.database_handler.copy_queries_to([(query, reader)], copy_format="binary"):
+            return None
+
+        self.refreshed_at = refresh_started_at
+
+        return reader.number_of_edges
+
+    def refresh(self):
+        started_at = time.time()
+
+        number_of_edges = self.load_links()
+
+        if number_of_edges is None:
+            return
+
+        rank = self.graph.page_rank()
+
+        # Only the pages with links are updated, the others keep the rank of a page without links
+        in_degree = self.graph.in_degree()
+
+        linked = (in_degree > 0) | (self.graph.out_degree > 0)
+
+        page_ids = np.flatnonzero(linked).astype(np.int32)
+
+        self.database_handler.update_page_ranks(encode_ranks(page_ids, rank[linked], rank_percentiles(rank)[linked]))
+
+        print("[GRAPH] Loaded {} links, {} pages and {} links in the graph, ranked in {:.1f}s".format(
+            number_of_edges, len(page_ids), self.graph.number_of_edges, time.time() - started_at))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the PageRank of the crawled pages from the link graph")
+
+    parser.add_argument("--interval", type=int, default=REFRESH_INTERVAL, help="seconds between the refreshes")
+    parser.add_argument("--once", action="store_true", help="compute the ranks once and exit")
+
+    arguments = parser.parse_args()
+
+    graph_updater = GraphUpdater(DatabaseHandler(1, 1))
+
+    while True:
+        graph_updater.refresh()
+
+        if arguments.once:
+            break
+
+        time.sleep(arguments.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,47 @@
 import binascii
 import hashlib
+import io
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from content_extractor import extract_main_content
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
 # size of substring shingle
 SHINGLE_SIZE = 10
 
+# Typecode of the compact signature array (unsigned 32-bit integers, CRC32 values fit exactly)
+SIGNATURE_TYPECODE = 'I'
+
+# The image hash compares neighbouring pixels of the image scaled to IMAGE_HASH_SIZE + 1 x IMAGE_HASH_SIZE, 64 bits
+IMAGE_HASH_SIZE = 8
+
+# Images whose grayscale thumbnail has less contrast (flat images, e. g. a solid square or a 1x1 pixel) have no
+# perceptual hash, their bits would only be noise or all 0
+MIN_IMAGE_CONTRAST = 16
+
+# Hashes with fewer set bits (or fewer unset bits) describe a smooth gradient, not the image, they are not used
+MIN_IMAGE_HASH_BITS = 8
+
+# Number of content digests (and their page ids) a crawler process remembers, the least recently seen are dropped
+MAX_CACHED_DIGESTS = 10000
+
+
 class HashDriver:
+    def __init__(self, hash_service=None):
+        """
+            hash_service is an optional HashService, if it is set the shingling is done in its worker processes,
+            otherwise it is done inline
+        """
+        self.hash_service = hash_service
+
+        if hash_service is not None and Image is None:
+            print("[HASH DRIVER] Pillow is not installed (pip install Pillow), only exact copies of images are "
+                  "deduplicated")
 
     """
         Split  text to shingles of size SHINGLE_SIZE and output them as integers of fixed size
@@ -38,13 +75,178 @@ class HashDriver:
         return shingles_in_doc_ints
 
     def create_content_hash(self, html_content):
-        try:
-            m = hashlib.sha256()
+        digest = self.create_content_digest(html_content)
+
+        return digest.hex() if digest is not None else None
 
-            m.update(html_content.encode('utf-8'))
+    """
+        sha256 digest of the html content as 32 bytes, the key of crawldb.content_digest
+    """
 
-            return m.hexdigest()
+    def create_content_digest(self, html_content):
+        try:
+            return hashlib.sha256(html_content.encode('utf-8')).digest()
         except Exception as error:
             print("     [CRAWLING] Error while creating content hash", error)
 
             return None
+
+    """
+        Submit the html content for shingling and return a future which resolves to the compact signature and the block
+        fingerprints of the page, the blocks of the site template (a set of block fingerprints) are not shingled
+    """
+
+    def submit_page_signature(self, html_content, template=frozenset()):
+        if self.hash_service is not None:
+            return self.hash_service.submit(html_content, template)
+
+        future = Future()
+
+        future.set_result(create_page_signature(html_content, template))
+
+        return future
+
+    """
+        Submit the content of an image for its hashes, the future resolves to the dictionary of create_image_hash
+    """
+
+    def submit_image_hash(self, image_content):
+        if self.hash_service is not None and Image is not None:
+            return self.hash_service.submit_image(image_content)
+
+        future = Future()
+
+        future.set_result(create_image_hash(image_content))
+
+        return future
+
+    """
+        Wait for the submitted signature and convert it back to the set of hashed shingles and the set of the block
+        fingerprints
+    """
+
+    def page_signature_result(self, signature_future):
+        signature, block_fingerprints = signature_future.result()
+
+        return signature_to_shingle_set(signature), signature_to_shingle_set(block_fingerprints)
+
+
+class DigestCache:
+    """
+        Content digests recently seen by a crawler process mapped to the id of the page they belong to, so boilerplate
+        pages (error templates, login walls) which are crawled over and over are found without a database round trip
+    """
+
+    def __init__(self, max_digests=MAX_CACHED_DIGESTS):
+        self.max_digests = max_digests
+
+        self.digests = OrderedDict()
+
+    def get(self, digest):
+        page_id = self.digests.get(digest)
+
+        if page_id is not None:
+            self.digests.move_to_end(digest)
+
+        return page_id
+
+    def add(self, digest, page_id):
+        self.digests[digest] = page_id
+
+        self.digests.move_to_end(digest)
+
+        if len(self.digests) > self.max_digests:
+            self.digests.popitem(last=False)
+
+    def discard(self, digest):
+        self.digests.pop(digest, None)
+
+
+"""
+    Create the signature of a page as a compact array of sorted shingle hashes, together with the compact array of the
+    fingerprints of its text blocks. This is a module level function so that it can be pickled and run in the hash
+    service worker processes
+"""
+
+
+def create_page_signature(html_content, template=frozenset()):
+    # only the main content is shingled, the html tags and the blocks every page of the site repeats are removed
+    content, block_fingerprints = extract_main_content(html_content, template)
+
+    shingles = HashDriver().text_to_shingle_set(content)
+
+    return (array(SIGNATURE_TYPECODE, sorted(shingles)).tobytes(),
+            array(SIGNATURE_TYPECODE, sorted(block_fingerprints)).tobytes())
+
+
+def create_page_signatures(documents):
+    return [create_page_signature(html_content) for html_content in documents]
+
+
+"""
+    Hashes of an image as a dictionary:
+        digest      sha256 of the content, exact copies are always found by it
+        hash        difference hash (dHash) as a signed 64-bit integer (a bigint in the database): the image is
+                    converted to grayscale and scaled to 9x8 pixels, every bit tells if a pixel is brighter than its
+                    right neighbour. It does not change when the image is resized or recompressed. None when Pillow can
+                    not read the image or the image has too little detail (see MIN_IMAGE_CONTRAST)
+        mean_color  mean color of the image as 0xRRGGBB, a near duplicate also has to have a similar color
+"""
+
+
+def create_image_hash(image_content):
+    image_hashes = {
+        "digest": hashlib.sha256(image_content).digest(),
+        "hash": None,
+        "mean_color": None
+    }
+
+    if Image is None:
+        return image_hashes
+
+    try:
+        image = Image.open(io.BytesIO(image_content))
+
+        # JPEG images are decoded at a reduced size
+        image.draft("RGB", (IMAGE_HASH_SIZE * 8, IMAGE_HASH_SIZE * 8))
+
+        image = image.convert("RGB")
+
+        red, green, blue = image.resize((1, 1), Image.BOX).getpixel((0, 0))
+
+        pixels = list(image.convert("L").resize((IMAGE_HASH_SIZE + 1, IMAGE_HASH_SIZE), Image.BILINEAR).getdata())
+    except Exception:
+        return image_hashes
+
+    image_hashes["mean_color"] = red << 16 | green << 8 | blue
+
+    if max(pixels) - min(pixels) < MIN_IMAGE_CONTRAST:
+        return image_hashes
+
+    image_hash = 0
+
+    for row in range(IMAGE_HASH_SIZE):
+        for column in range(IMAGE_HASH_SIZE):
+            left = pixels[row * (IMAGE_HASH_SIZE + 1) + column]
+
+            image_hash = image_hash << 1 | (left > pixels[row * (IMAGE_HASH_SIZE + 1) + column + 1])
+
+    number_of_bits = bin(image_hash).count("1")
+
+    if number_of_bits < MIN_IMAGE_HASH_BITS or number_of_bits > IMAGE_HASH_SIZE * IMAGE_HASH_SIZE - MIN_IMAGE_HASH_BITS:
+        return image_hashes
+
+    if image_hash >= 1 << 63:
+        image_hash -= 1 << 64
+
+    image_hashes["hash"] = image_hash
+
+    return image_hashes
+
+
+def signature_to_shingle_set(signature):
+    shingles = array(SIGNATURE_TYPECODE)
+
+    shingles.frombytes(signature)
+
+    return set(shingles)
@@ -0,0 +1,79 @@
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from hash_driver import create_page_signature, create_page_signatures, create_image_hash
+
+# The hashing workers are sized by the number of cores, not by the number of crawler processes
+HASH_SERVICE_WORKERS = os.cpu_count() or 1
+
+# Number of documents sent to a worker process in one task when submitting a batch
+HASH_SERVICE_BATCH_SIZE = 16
+
+
+class HashService:
+    """
+        Runs the CPU heavy part of duplicate detection (main content extraction and shingling, image hashing) in a pool
+        of worker processes, so that the crawler process can keep using the chrome driver while the page is being hashed
+    """
+
+    def __init__(self, max_workers=HASH_SERVICE_WORKERS):
+        self.max_workers = max(1, max_workers)
+
+        self.executor = None
+
+    """
+        The executor is created lazily, so that the worker processes are started by the crawler process which uses them
+        and not by the parent process before forking
+    """
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=ignore_interrupts)
+
+        return self.executor
+
+    """
+        Submit a single html document and the template of its site, the returned future resolves to its compact
+        signature and block fingerprints
+    """
+
+    def submit(self, html_content, template=frozenset()):
+        return self.get_executor().submit(create_page_signature, html_content, template)
+
+    """
+        Submit the content of an image, the returned future resolves to its perceptual hash
+    """
+
+    def submit_image(self, image_content):
+        return self.get_executor().submit(create_image_hash, image_content)
+
+    """
+        Submit a batch of html documents, the returned futures resolve to lists of compact signatures (and block
+        fingerprints) in the same order as the documents
+    """
+
+    def submit_batch(self, documents):
+        futures = []
+
+        for index in range(0, len(documents), HASH_SERVICE_BATCH_SIZE):
+            batch = documents[index:index + HASH_SERVICE_BATCH_SIZE]
+
+            futures.append(self.get_executor().submit(create_page_signatures, batch))
+
+        return futures
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+            self.executor = None
+
+
+"""
+    Ctrl-C is delivered to the whole process group, the hash workers ignore it so that the crawler process can drain
+    its submitted pages while shutting down
+"""
+
+
+def ignore_interrupts():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
@@ -0,0 +1,156 @@
+import argparse
+import html
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from database_handler import DatabaseHandler
+from content_extractor import extract_main_content
+from hash_service import HASH_SERVICE_WORKERS, ignore_interrupts
+
+"""
+    Full-text index of the crawled pages. Runs next to the crawler (or after it), takes the html pages which were
+    crawled or changed since they were last indexed, extracts their title and main content in worker processes and
+    stores them as the search vector of the page (a tsvector column with a GIN index), the crawler itself never waits
+    for it
+
+    Searching is DatabaseHandler.search_pages, from the command line:
+
+        python indexer.py --interval 60
+        python indexer.py --search "gradbeno dovoljenje"
+"""
+
+# Number of pages indexed in one transaction
+INDEX_BATCH_SIZE = 500
+
+# How often the new pages are indexed (seconds)
+INDEX_INTERVAL = 60
+
+# Only the beginning of very long pages is indexed (a tsvector is limited to 1MB)
+MAX_INDEXED_CHARACTERS = 200000
+
+# Number of documents sent to a worker process at once
+INDEX_CHUNK_SIZE = 16
+
+TITLE_PATTERN = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+
+"""
+    (id, accessed_time, title, content) of a page for DatabaseHandler.update_search_vectors, a module level function so
+    that it can be run in the worker processes
+"""
+
+
+def index_document(page):
+    page_id, accessed_time, html_content = page
+
+    if not html_content:
+        return page_id, accessed_time, "", ""
+
+    title = TITLE_PATTERN.search(html_content)
+
+    title = " ".join(html.unescape(title.group(1)).split()) if title else ""
+
+    try:
+        content, _ = extract_main_content(html_content)
+    except Exception as error:
+        print("[INDEXER] Error while extracting the content of page {}".format(page_id), error)
+
+        content = ""
+
+    return page_id, accessed_time, title[:MAX_INDEXED_CHARACTERS], content[:MAX_INDEXED_CHARACTERS]
+
+
+class Indexer:
+    def __init__(self, database_handler, workers=HASH_SERVICE_WORKERS, batch_size=INDEX_BATCH_SIZE):
+        self.database_handler = database_handler
+
+        self.batch_size = batch_size
+
+        self.executor = ProcessPoolExecutor(max_workers=max(1, workers), initializer=ignore_interrupts)
+
+    """
+        Index one batch of pages, returns the number of pages taken from the database
+    """
+
+    def index_batch(self):
+        pages = self.database_handler.fetch_unindexed_pages(self.batch_size)
+
+        if not pages:
+            return 0
+
+        documents = list(self.executor.map(index_document, pages, chunksize=INDEX_CHUNK_SIZE))
+
+        if self.database_handler.update_search_vectors(documents) is None:
+            return 0
+
+        return len(pages)
+
+    """
+        Index the pages until there are no unindexed pages left
+    """
+
+    def index_pages(self):
+        started_at = time.time()
+
+        number_of_pages = 0
+
+        while True:
+            number_of_batch_pages = self.index_batch()
+
+            number_of_pages += number_of_batch_pages
+
+            if number_of_batch_pages < self.batch_size:
+                break
+
+        if number_of_pages > 0:
+            print("[INDEXER] Indexed {} pages in {:.1f}s".format(number_of_pages, time.time() - started_at))
+
+        return number_of_pages
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the crawled pages for full-text search and search them")
+
+    parser.add_argument("--interval", type=int, default=INDEX_INTERVAL, help="seconds between the indexing runs")
+    parser.add_argument("--once", action="store_true", help="index the unindexed pages once and exit")
+    parser.add_argument("--batch-size", type=int, default=INDEX_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=HASH_SERVICE_WORKERS, help="content extraction processes")
+    parser.add_argument("--search", default=None, help="print the pages matching this query and exit")
+    parser.add_argument("--limit", type=int, default=10, help="number of search results")
+
+    arguments = parser.parse_args()
+
+    database_handler = DatabaseHandler(1, 1)
+
+    if arguments.search is not None:
+        started_at = time.time()
+
+        pages = database_handler.search_pages(arguments.search, arguments.limit)
+
+        for page in pages:
+            print("{:8.4f}  {:>8}  {}".format(page["rank"], page["id"], page["url"]))
+
+        print("[INDEXER] {} results in {:.1f}ms".format(len(pages), (time.time() - started_at) * 1000))
+
+        return
+
+    indexer = Indexer(database_handler, arguments.workers, arguments.batch_size)
+
+    try:
+        while True:
+            indexer.index_pages()
+
+            if arguments.once:
+                break
+
+            time.sleep(arguments.interval)
+    finally:
+        indexer.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+"""
+    Links extracted from a page are canonicalized and deduplicated before they are added to the frontier, menus and
+    footers repeat the same links on every page and every url would otherwise be looked up in the database
+"""
+
+# Index pages are the same page as their directory
+INDEX_PAGES = ("index.html", "index.htm", "index.php")
+
+# Query parameters with session ids, every visit would otherwise produce new urls of the same pages
+SESSION_PARAMETERS = frozenset(("sid", "sessid", "sessionid", "session_id", "jsessionid", "phpsessid", "aspsessionid",
+                                "cfid", "cftoken"))
+
+# Session ids in the path, e. g. /page.jsp;jsessionid=0A1B2C
+PATH_SESSION_PATTERN = re.compile(r";jsessionid=[^/]*", re.IGNORECASE)
+
+DEFAULT_PORTS = {
+    "http": ":80",
+    "https": ":443"
+}
+
+# Reasons for dropping an extracted url
+DROPPED_INVALID = "invalid"
+DROPPED_DUPLICATE = "duplicate"
+DROPPED_OUTSIDE_DOMAIN = "outside_domain"
+DROPPED_SELF = "self"
+DROPPED_TRAP = "trap"
+
+"""
+    Canonical form of an absolute url: lowercase scheme and host, no default port, no fragment, no session ids and no
+    index page (when there is no query), an empty path is /
+"""
+
+
+def canonicalize_url(url):
+    try:
+        scheme, netloc, path, query, fragment = urlsplit(url)
+    except ValueError:
+        # e. g. an invalid IPv6 host
+        return None
+
+    scheme = scheme.lower()
+
+    netloc = netloc.lower()
+
+    default_port = DEFAULT_PORTS.get(scheme)
+
+    if default_port is not None and netloc.endswith(default_port):
+        netloc = netloc[:-len(default_port)]
+
+    path = PATH_SESSION_PATTERN.sub("", path)
+
+    if query:
+        query = "&".join(parameter for parameter in query.split("&")
+                         if parameter.split("=", 1)[0].lower() not in SESSION_PARAMETERS)
+
+    if not query:
+        segments = path.rsplit("/", 1)
+
+        if len(segments) == 2 and segments[1].lower() in INDEX_PAGES:
+            path = segments[0] + "/"
+
+    if not path:
+        path = "/"
+
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+class ExtractedLinks:
+    """
+        Ordered set of the urls (links and images) extracted from one page, only urls in the allowed domain are kept and
+        every dropped url is counted by the reason it was dropped. Links which trap_detector finds to be spider traps
+        are dropped too
+    """
+
+    def __init__(self, page_url, allowed_domain, trap_detector=None):
+        self.page_url = page_url
+
+        self.allowed_domain = allowed_domain
+
+        self.trap_detector = trap_detector
+
+        self.links = []
+
+        self.images = []
+
+        self.seen_urls = {page_url}
+
+        self.dropped = {
+            DROPPED_INVALID: 0,
+            DROPPED_DUPLICATE: 0,
+            DROPPED_OUTSIDE_DOMAIN: 0,
+            DROPPED_SELF: 0,
+            DROPPED_TRAP: 0
+        }
+
+    def add_link(self, url):
+        if not self.accept(url):
+            return
+
+        if self.trap_detector is not None and self.trap_detector.check(url) is not None:
+            self.dropped[DROPPED_TRAP] += 1
+
+            return
+
+        self.links.append(url)
+
+    def add_image(self, url):
+        if self.accept(url):
+            self.images.append(url)
+
+    def accept(self, url):
+        if not url:
+            self.dropped[DROPPED_INVALID] += 1
+
+            return False
+
+        if url in self.seen_urls:
+            reason = DROPPED_SELF if url == self.page_url else DROPPED_DUPLICATE
+
+            self.dropped[reason] += 1
+
+            return False
+
+        self.seen_urls.add(url)
+
+        if self.allowed_domain not in urlsplit(url).netloc:
+            self.dropped[DROPPED_OUTSIDE_DOMAIN] += 1
+
+            return False
+
+        return True
+
+    def number_of_dropped(self):
+        return sum(self.dropped.values())
@@ -0,0 +1,360 @@
+import bisect
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Upper bounds of the latency histogram buckets (seconds), the last bucket catches everything else
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+# How often a crawler process sends its collected metrics to the aggregator (seconds)
+METRICS_FLUSH_INTERVAL = 5
+
+# How often the aggregator writes the metrics json file (seconds)
+METRICS_DUMP_INTERVAL = 30
+
+# File with the periodic json dump of the aggregated metrics
+METRICS_JSON_PATH = "metrics.json"
+
+
+class Metrics:
+    """
+        Collects counters and latency histograms in a single process. Recording is a dictionary update, the collected
+        values are sent to the aggregator in the parent process as deltas every METRICS_FLUSH_INTERVAL seconds, so the
+        processes never share any state
+
+        Labels are given as keyword arguments, e. g. metrics.increment("crawler_pages_total", page_type_code="HTML")
+
+        Background threads of the process (e. g. the site discovery) record metrics too, so updates are done under a lock
+    """
+
+    def __init__(self):
+        self.queue = None
+
+        self.counters = {}
+
+        self.histograms = {}
+
+        self.lock = threading.Lock()
+
+        self.last_flushed_at = time.time()
+
+    """
+        Set the queue of the aggregator, until it is set the metrics are only collected locally
+    """
+
+    def connect(self, metrics_queue):
+        self.queue = metrics_queue
+
+        self.counters = {}
+
+        self.histograms = {}
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            histogram = self.histograms.get(key)
+
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+
+            histogram[0][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started_at = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at, **labels)
+
+    def flush_if_due(self):
+        if time.time() - self.last_flushed_at >= METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.last_flushed_at = time.time()
+
+        if self.queue is None:
+            return
+
+        with self.lock:
+            if not self.counters and not self.histograms:
+                return
+
+            flushed = {
+                "counters": self.counters,
+                "histograms": self.histograms
+            }
+
+            self.counters = {}
+
+            self.histograms = {}
+
+        self.queue.put(flushed)
+
+
+class MetricsAggregator:
+    """
+        Merges the metrics of all the crawler processes in the parent process and exposes them as a json dump and in
+        the Prometheus text format (optionally over http)
+    """
+
+    def __init__(self, metrics_queue):
+        self.queue = metrics_queue
+
+        self.counters = {}
+
+        self.histograms = {}
+
+        self.started_at = time.time()
+
+        self.lock = threading.Lock()
+
+        self.stop_event = threading.Event()
+
+        self.http_server = None
+
+    def collect(self):
+        with self.lock:
+            while True:
+                try:
+                    snapshot = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                for key, value in snapshot["counters"].items():
+                    self.counters[key] = self.counters.get(key, 0) + value
+
+                for key, (buckets, total, count) in snapshot["histograms"].items():
+                    histogram = self.histograms.get(key)
+
+                    if histogram is None:
+                        histogram = self.histograms[key] = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+
+                    for index, bucket_count in enumerate(buckets):
+                        histogram[0][index] += bucket_count
+
+                    histogram[1] += total
+                    histogram[2] += count
+
+    """
+        Sum of a counter over all of its labels
+    """
+
+    def counter_total(self, name):
+        with self.lock:
+            return sum(value for (counter_name, labels), value in self.counters.items() if counter_name == name)
+
+    """
+        Number of observations and their sum over all the labels of a histogram
+    """
+
+    def histogram_total(self, name):
+        with self.lock:
+            count = 0
+            total = 0.0
+
+            for (histogram_name, labels), histogram in self.histograms.items():
+                if histogram_name == name:
+                    total += histogram[1]
+                    count += histogram[2]
+
+            return count, total
+
+    """
+        Estimate a quantile of a histogram over all of its labels (linear interpolation inside the bucket)
+    """
+
+    def quantile(self, name, q):
+        with self.lock:
+            buckets = [0] * len(LATENCY_BUCKETS)
+
+            for (histogram_name, labels), histogram in self.histograms.items():
+                if histogram_name == name:
+                    for index, bucket_count in enumerate(histogram[0]):
+                        buckets[index] += bucket_count
+
+        return estimate_quantile(buckets, q)
+
+    def to_json(self):
+        with self.lock:
+            elapsed = max(time.time() - self.started_at, 1)
+
+            counters = {}
+
+            for (name, labels), value in sorted(self.counters.items()):
+                counters.setdefault(name, []).append({
+                    "labels": dict(labels),
+                    "value": value,
+                    "per_second": value / elapsed
+                })
+
+            histograms = {}
+
+            for (name, labels), (buckets, total, count) in sorted(self.histograms.items()):
+                histograms.setdefault(name, []).append({
+                    "labels": dict(labels),
+                    "count": count,
+                    "sum": total,
+                    "mean": total / count if count else 0,
+                    "p50": estimate_quantile(buckets, 0.5),
+                    "p99": estimate_quantile(buckets, 0.99)
+                })
+
+            return {
+                "uptime": elapsed,
+                "counters": counters,
+                "histograms": histograms
+            }
+
+    def to_prometheus(self):
+        lines = []
+
+        with self.lock:
+            for name in sorted({key[0] for key in self.counters}):
+                lines.append("# TYPE {} counter".format(name))
+
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append("{}{} {}".format(name, format_labels(labels), value))
+
+            for name in sorted({key[0] for key in self.histograms}):
+                lines.append("# TYPE {} histogram".format(name))
+
+                for (histogram_name, labels), (buckets, total, count) in sorted(self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+
+                    cumulative = 0
+
+                    for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                        cumulative += bucket_count
+
+                        bucket_labels = labels + (("le", "+Inf" if bound == float("inf") else str(bound)),)
+
+                        lines.append("{}_bucket{} {}".format(name, format_labels(bucket_labels), cumulative))
+
+                    lines.append("{}_sum{} {}".format(name, format_labels(labels), total))
+                    lines.append("{}_count{} {}".format(name, format_labels(labels), count))
+
+        return "\n".join(lines) + "\n"
+
+    """
+        The json file is replaced atomically, so a reader never sees a partially written file
+    """
+
+    def write_json(self, path=METRICS_JSON_PATH):
+        temporary_path = "{}.tmp".format(path)
+
+        try:
+            with open(temporary_path, "w") as metrics_file:
+                json.dump(self.to_json(), metrics_file, indent=2)
+
+            os.replace(temporary_path, path)
+        except Exception as error:
+            print("[METRICS] Error while writing metrics to {}".format(path), error)
+
+    """
+        Collect the metrics and dump them to the json file in a background thread, if a port is given the Prometheus
+        text format is also served on http://<host>:<port>/metrics
+    """
+
+    def start(self, port=None):
+        threading.Thread(target=self.dump_periodically, daemon=True).start()
+
+        if port is not None:
+            aggregator = self
+
+            class MetricsRequestHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path != "/metrics":
+                        self.send_error(404)
+
+                        return
+
+                    aggregator.collect()
+
+                    body = aggregator.to_prometheus().encode("utf-8")
+
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    # Scrapes are not logged
+                    pass
+
+            self.http_server = HTTPServer(("", port), MetricsRequestHandler)
+
+            threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+
+            print("[METRICS] Serving metrics on port {}".format(port))
+
+    def dump_periodically(self):
+        while not self.stop_event.wait(METRICS_DUMP_INTERVAL):
+            self.collect()
+
+            self.write_json()
+
+    def stop(self):
+        self.stop_event.set()
+
+        if self.http_server is not None:
+            self.http_server.shutdown()
+
+        self.collect()
+
+        self.write_json()
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+
+    return "{" + ",".join('{}="{}"'.format(key, str(value).replace('"', '\\"')) for key, value in labels) + "}"
+
+
+def estimate_quantile(buckets, q):
+    count = sum(buckets)
+
+    if count == 0:
+        return 0
+
+    rank = q * count
+
+    cumulative = 0
+
+    for index, bucket_count in enumerate(buckets):
+        if bucket_count and cumulative + bucket_count >= rank:
+            lower = LATENCY_BUCKETS[index - 1] if index > 0 else 0
+
+            upper = LATENCY_BUCKETS[index]
+
+            if upper == float("inf"):
+                return lower
+
+            return lower + (upper - lower) * (rank - cumulative) / bucket_count
+
+        cumulative += bucket_count
+
+    return LATENCY_BUCKETS[-2]
+
+
+# The metrics of the current process, the crawler process connects it to the aggregator queue after it is started
+metrics = Metrics()
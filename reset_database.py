@@ -1,4 +1,5 @@
 from database_handler import DatabaseHandler
+from checkpoint import Checkpoint
 
 """
     Deletes all the data from the database
@@ -6,3 +7,6 @@ from database_handler import DatabaseHandler
 
 database_handler = DatabaseHandler(1, 1)
 database_handler.reset_database()
+
+# The checkpoints reference rows of the deleted data
+Checkpoint.clear_all()
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+# Interval of the first revisit of a page, before anything is known about how often it changes
+INITIAL_REVISIT_INTERVAL = timedelta(days=1)
+
+# Pages are never revisited more often than this
+MIN_REVISIT_INTERVAL = timedelta(hours=1)
+
+# Pages are revisited at least this often, even if they never changed
+MAX_REVISIT_INTERVAL = timedelta(days=30)
+
+# Weight of the latest observation in the change rate estimate [0,1]
+CHANGE_RATE_SMOOTHING = 0.3
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+"""
+    The change rate of a page is the estimated number of changes per day. It is an exponential moving average of the
+    rate observed between two visits, the next visit is scheduled after the expected time until the next change
+"""
+
+
+def schedule_next_visit(page, changed, now=None):
+    """
+        Sets change_rate, visit_count and next_visit_at of the page dictionary, previous_accessed_time is the time of
+        the previous visit (None for the first visit)
+    """
+    now = now or datetime.now()
+
+    previous_accessed_time = page.get("previous_accessed_time")
+
+    change_rate = page.get("change_rate")
+
+    if previous_accessed_time is None or change_rate is None:
+        # First visit, assume the page changes once per initial interval
+        change_rate = SECONDS_PER_DAY / INITIAL_REVISIT_INTERVAL.total_seconds()
+    else:
+        elapsed_days = max((now - previous_accessed_time).total_seconds(),
+                           MIN_REVISIT_INTERVAL.total_seconds()) / SECONDS_PER_DAY
+
+        observed_change_rate = (1 if changed else 0) / elapsed_days
+
+        change_rate = (1 - CHANGE_RATE_SMOOTHING) * change_rate + CHANGE_RATE_SMOOTHING * observed_change_rate
+
+    if change_rate > 0:
+        revisit_interval = timedelta(days=1 / change_rate)
+    else:
+        revisit_interval = MAX_REVISIT_INTERVAL
+
+    revisit_interval = min(max(revisit_interval, MIN_REVISIT_INTERVAL), MAX_REVISIT_INTERVAL)
+
+    page["change_rate"] = change_rate
+
+    page["visit_count"] = (page.get("visit_count") or 0) + 1
+
+    page["next_visit_at"] = now + revisit_interval
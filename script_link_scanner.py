@@ -0,0 +1,76 @@
+import hashlib
+import os
+import re
+
+"""
+    Finds the absolute urls in the inline javascript of a page (window.location changes, urls in configuration objects)
+
+    Inline bundles can be hundreds of kilobytes. The pattern is compiled once and has no groups (no tuples to join),
+    scripts without "://" are not matched at all, at most MAX_SCRIPT_CHARACTERS of a script are scanned and known
+    library bundles can be skipped by their sha1 hash (KNOWN_BUNDLES_FILE)
+
+    benchmarks/script_scanner_benchmark.py compares it with the old regex
+"""
+
+# Only this many characters at the beginning of a script are scanned
+MAX_SCRIPT_CHARACTERS = 512 * 1024
+
+# Scripts shorter than this are never skipped by hash, the hash would cost more than the scan
+MIN_HASHED_SCRIPT_LENGTH = 4096
+
+# sha1 hashes of known library bundles (one hex digest per line, # starts a comment), their links are never scanned
+KNOWN_BUNDLES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "known_bundles.txt")
+
+# Every url contains this literal, a script without it is not matched
+URL_SEPARATOR = "://"
+
+URL_PATTERN = re.compile(r"https?://[\w-]+(?:\.[\w-]+)+(?:[\w.,@?^=%&:/~+#-]*[\w@?^=%&/~+#-])?")
+
+
+def load_known_bundle_hashes(path=KNOWN_BUNDLES_FILE):
+    if not os.path.exists(path):
+        return set()
+
+    with open(path) as known_bundles_file:
+        lines = [line.split("#")[0].strip().lower() for line in known_bundles_file]
+
+    return {line for line in lines if line}
+
+
+def script_hash(javascript_text):
+    return hashlib.sha1(javascript_text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+"""
+    Links in the first max_characters characters of the script, in the order they appear
+"""
+
+
+def find_links(javascript_text, max_characters=MAX_SCRIPT_CHARACTERS):
+    end = min(len(javascript_text), max_characters)
+
+    if javascript_text.find(URL_SEPARATOR, 0, end) == -1:
+        return []
+
+    return URL_PATTERN.findall(javascript_text, 0, end)
+
+
+class ScriptLinkScanner:
+    def __init__(self, known_bundle_hashes=None, max_characters=MAX_SCRIPT_CHARACTERS):
+        self.known_bundle_hashes = known_bundle_hashes if known_bundle_hashes is not None else set()
+
+        self.max_characters = max_characters
+
+        self.number_of_skipped_bundles = 0
+
+    def scan(self, javascript_text):
+        if not javascript_text:
+            return []
+
+        if self.known_bundle_hashes and len(javascript_text) >= MIN_HASHED_SCRIPT_LENGTH:
+            if script_hash(javascript_text) in self.known_bundle_hashes:
+                self.number_of_skipped_bundles += 1
+
+                return []
+
+        return find_links(javascript_text, self.max_characters)
@@ -0,0 +1,126 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from robotparser import RobotFileParser
+from sitemap_parser import SitemapIngester
+from metrics import metrics
+
+# Number of threads of a crawler process which fetch robots and sitemaps of new sites
+SITE_DISCOVERY_THREADS = 2
+
+SITE_PENDING = "PENDING"
+
+SITE_READY = "READY"
+
+
+class SiteDiscovery:
+    """
+        Bootstraps new sites in the background: robots.txt is fetched and the sitemaps are streamed into the frontier
+        while the crawler process keeps crawling pages of other sites
+
+        The bootstrap of a domain is claimed in the database, so only one worker (of all processes and nodes) fetches
+        the robots and sitemaps of a domain. The pages of the domain stay in the frontier until the site is ready
+
+        fetch_robots is a function which returns the robots.txt content of a domain (or None) and parse_url a function
+        which returns the normalized sitemap url for a domain (or None if it should not be crawled)
+
+        session and wait_for_server (the requests session and DnsResolver.wait_for_server of the crawler process) are
+        used for the sitemaps, wait_for_server is also called before robots.txt is fetched, so the bootstrap requests
+        keep the politeness delay of the servers like the pages
+    """
+
+    def __init__(self, database_handler, fetch_robots, parse_url, max_workers=SITE_DISCOVERY_THREADS, session=None,
+                 wait_for_server=None):
+        self.database_handler = database_handler
+
+        self.fetch_robots = fetch_robots
+
+        self.parse_url = parse_url
+
+        self.session = session
+
+        self.wait_for_server = wait_for_server
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        self.lock = threading.Lock()
+
+        """
+            Ids of the sites which are bootstrapped by this process, by domain
+        """
+        self.pending_sites = {}
+
+    """
+        Make sure the site of the domain gets bootstrapped and return its id (None if the site could not be created)
+    """
+
+    def discover(self, domain):
+        with self.lock:
+            if domain in self.pending_sites:
+                return self.pending_sites[domain]
+
+        site_id, claimed = self.database_handler.claim_site_bootstrap(domain)
+
+        if claimed:
+            with self.lock:
+                self.pending_sites[domain] = site_id
+
+            self.executor.submit(self.bootstrap, domain, site_id)
+
+            metrics.increment("crawler_site_bootstraps_total")
+
+        return site_id
+
+    def bootstrap(self, domain, site_id):
+        try:
+            if self.wait_for_server is not None:
+                self.wait_for_server(urlparse(domain).hostname)
+
+            robots_content = self.fetch_robots(domain)
+
+            sitemap_content = None
+
+            if robots_content is not None:
+                robots_parser = RobotFileParser(robots_content)
+                robots_parser.read()
+
+                sitemaps = robots_parser.get_sitemaps()
+
+                if len(sitemaps) > 0:
+                    # The urls of the sitemaps are streamed into the frontier, only the list of read sitemaps is stored
+                    sitemap_ingester = SitemapIngester(self.database_handler,
+                                                       lambda url: self.parse_url(url, domain),
+                                                       self.session, self.wait_for_server)
+
+                    with metrics.timer("crawler_sitemap_seconds"):
+                        read_sitemaps = sitemap_ingester.ingest(sitemaps)
+
+                    metrics.increment("crawler_sitemap_urls_total", sitemap_ingester.number_of_urls)
+
+                    if read_sitemaps:
+                        sitemap_content = "\n".join(read_sitemaps)
+
+            self.database_handler.finish_site_bootstrap(site_id, robots_content, sitemap_content)
+        except Exception as error:
+            # The site stays pending and is bootstrapped again after the timeout
+            print("[SITE DISCOVERY] Error while bootstrapping site {}".format(domain), error)
+        finally:
+            with self.lock:
+                self.pending_sites.pop(domain, None)
+
+    """
+        Bootstraps which have not finished are released, so that other workers can take them over without waiting for
+        the timeout
+    """
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+        with self.lock:
+            unfinished_sites = list(self.pending_sites.values())
+
+            self.pending_sites = {}
+
+        for site_id in unfinished_sites:
+            self.database_handler.release_site_bootstrap(site_id)
@@ -0,0 +1,297 @@
+import gzip
+import io
+from datetime import datetime
+from urllib.parse import urlparse
+from xml.etree.ElementTree import iterparse, ParseError
+
+import requests
+
+"""
+    Streaming sitemap ingester
+
+    Sitemaps are parsed with iterparse while they are downloaded, every <url> element is cleared as soon as it is read,
+    so the memory use does not depend on the size of the sitemap (the protocol allows 50k urls and 50MB per sitemap).
+    Sitemap indexes are followed recursively and gzip compressed sitemaps (.xml.gz) are decompressed on the fly
+
+    https://www.sitemaps.org/protocol.html
+"""
+
+# Number of sitemap urls sent to the database in one insert
+SITEMAP_BATCH_SIZE = 1000
+
+# Maximum depth of nested sitemap indexes (a sitemap index should only list sitemaps, but some list other indexes)
+MAX_SITEMAP_DEPTH = 3
+
+# Maximum number of sitemaps which are read for one site
+MAX_SITEMAPS_PER_SITE = 100
+
+# Maximum uncompressed size of one sitemap (bytes), as defined by the protocol, it also stops gzip bombs
+MAX_SITEMAP_SIZE = 50 * 1024 * 1024
+
+# Timeout for connecting to and reading from the server (seconds)
+SITEMAP_TIMEOUT = 30
+
+# Priority of a url without <priority>, as defined by the protocol, the pages found by links get the same priority
+DEFAULT_PRIORITY = 0.5
+
+# A url modified this many days ago gets half of the freshness of a url modified today
+LASTMOD_HALF_LIFE_DAYS = 30
+
+GZIP_MAGIC_NUMBER = b"\x1f\x8b"
+
+
+class SitemapTooLargeError(Exception):
+    pass
+
+
+class LimitedReader:
+    """
+        File-like wrapper which stops reading after max_size bytes
+    """
+
+    def __init__(self, stream, max_size):
+        self.stream = stream
+
+        self.max_size = max_size
+
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+
+        self.size += len(data)
+
+        if self.size > self.max_size:
+            raise SitemapTooLargeError("sitemap is larger than {} bytes".format(self.max_size))
+
+        return data
+
+
+"""
+    The tags are compared without the namespace, some sitemaps use an old namespace or none at all
+"""
+
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_lastmod(lastmod):
+    """
+        lastmod is in the W3C datetime format, a date (2019-03-01) or a date with time and timezone
+    """
+    if not lastmod:
+        return None
+
+    lastmod = lastmod.strip()
+
+    try:
+        if len(lastmod) == 10:
+            return datetime.strptime(lastmod, "%Y-%m-%d")
+
+        parsed = datetime.fromisoformat(lastmod.replace("Z", "+00:00"))
+
+        if parsed.tzinfo is not None:
+            # The crawler stores local times
+            parsed = parsed.astimezone().replace(tzinfo=None)
+
+        return parsed
+    except ValueError:
+        return None
+
+
+def parse_priority(priority):
+    try:
+        return min(max(float(priority), 0.0), 1.0)
+    except (TypeError, ValueError):
+        return DEFAULT_PRIORITY
+
+
+"""
+    The frontier priority of a sitemap url is the average of its <priority> and the freshness of its <lastmod>, a url
+    without both gets the default priority, which is the same as the priority of the pages found by links
+"""
+
+
+def calculate_frontier_priority(priority, lastmod, now=None):
+    if lastmod is None:
+        freshness = DEFAULT_PRIORITY
+    else:
+        age_days = max(((now or datetime.now()) - lastmod).total_seconds() / 86400, 0)
+
+        freshness = 1 / (1 + age_days / LASTMOD_HALF_LIFE_DAYS)
+
+    return (priority + freshness) / 2
+
+
+def iterate_sitemap(stream):
+    """
+        Yield a (kind, loc, lastmod, priority) tuple for every <url> (kind "url") and every <sitemap> (kind "sitemap")
+        entry of a sitemap or sitemap index read from the stream
+    """
+    context = iterparse(stream, events=("start", "end"))
+
+    root = None
+
+    for event, element in context:
+        if root is None:
+            root = element
+
+            continue
+
+        if event != "end":
+            continue
+
+        kind = local_name(element.tag)
+
+        if kind not in ("url", "sitemap"):
+            continue
+
+        loc = None
+
+        lastmod = None
+
+        priority = None
+
+        for child in element:
+            name = local_name(child.tag)
+
+            if name == "loc":
+                loc = (child.text or "").strip()
+            elif name == "lastmod":
+                lastmod = child.text
+            elif name == "priority":
+                priority = child.text
+
+        # The parsed entries are removed from the tree, so that it never grows
+        element.clear()
+        root.clear()
+
+        if loc:
+            yield kind, loc, parse_lastmod(lastmod), parse_priority(priority)
+
+
+class SitemapIngester:
+    """
+        Reads the sitemaps of a site and bulk loads their urls into the frontier
+
+        parse_url is a function which returns the normalized url (or None if the url should not be crawled) and is
+        used for both the page urls and the urls of nested sitemaps
+
+        The sitemaps are downloaded with session (the requests session of the crawler process, requests itself when it
+        is not given), wait_for_server is called with the host of every sitemap before it is requested, so the
+        politeness delay of the server is kept
+    """
+
+    def __init__(self, database_handler, parse_url, session=None, wait_for_server=None):
+        self.database_handler = database_handler
+
+        self.parse_url = parse_url
+
+        self.session = session if session is not None else requests
+
+        self.wait_for_server = wait_for_server
+
+        self.batch = []
+
+        self.number_of_urls = 0
+
+    """
+        Ingest the sitemaps listed in robots.txt and return the urls of all the sitemaps which were read
+    """
+
+    def ingest(self, sitemap_urls):
+        read_sitemaps = []
+
+        seen_sitemaps = set()
+
+        pending = [(sitemap_url, 0) for sitemap_url in reversed(sitemap_urls)]
+
+        while pending and len(read_sitemaps) < MAX_SITEMAPS_PER_SITE:
+            sitemap_url, depth = pending.pop()
+
+            if sitemap_url in seen_sitemaps:
+                continue
+
+            seen_sitemaps.add(sitemap_url)
+
+            nested_sitemaps = self.ingest_sitemap(sitemap_url)
+
+            if nested_sitemaps is None:
+                continue
+
+            read_sitemaps.append(sitemap_url)
+
+            if depth < MAX_SITEMAP_DEPTH:
+                for nested_sitemap in reversed(nested_sitemaps):
+                    pending.append((nested_sitemap, depth + 1))
+
+        self.flush()
+
+        return read_sitemaps
+
+    """
+        Stream a single sitemap, its urls are added to the frontier and the urls of nested sitemaps are returned (None
+        if the sitemap could not be read)
+    """
+
+    def ingest_sitemap(self, sitemap_url):
+        nested_sitemaps = []
+
+        response = None
+
+        try:
+            if self.wait_for_server is not None:
+                self.wait_for_server(urlparse(sitemap_url).hostname)
+
+            response = self.session.get(sitemap_url, stream=True, timeout=SITEMAP_TIMEOUT)
+
+            if response.status_code != 200:
+                return None
+
+            # Content-Encoding: gzip is decoded by urllib3, .xml.gz files are recognized by their first bytes
+            response.raw.decode_content = True
+
+            stream = io.BufferedReader(response.raw)
+
+            if stream.peek(2)[:2] == GZIP_MAGIC_NUMBER:
+                stream = gzip.GzipFile(fileobj=stream)
+
+            now = datetime.now()
+
+            for kind, loc, lastmod, priority in iterate_sitemap(LimitedReader(stream, MAX_SITEMAP_SIZE)):
+                url = self.parse_url(loc)
+
+                if url is None:
+                    continue
+
+                if kind == "sitemap":
+                    nested_sitemaps.append(url)
+                else:
+                    self.add_url(url, calculate_frontier_priority(priority, lastmod, now), lastmod)
+
+            return nested_sitemaps
+        except (requests.exceptions.RequestException, ParseError, OSError, EOFError, SitemapTooLargeError) as error:
+            print("     [SITEMAP] Error while reading sitemap {}".format(sitemap_url), error)
+
+            # The urls read before the error stay in the batch, a truncated sitemap still lists valid pages
+            return None
+        finally:
+            if response is not None:
+                response.close()
+
+    def add_url(self, url, priority, lastmod):
+        self.batch.append((url, priority, lastmod))
+
+        if len(self.batch) >= SITEMAP_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+
+        self.number_of_urls += len(self.batch)
+
+        self.database_handler.add_sitemap_pages_to_frontier(self.batch)
+
+        self.batch = []
@@ -1,5 +1,33 @@
+import argparse
 from crawler import Crawler
 
 if __name__ == "__main__":
-    crawler = Crawler(8)
+    parser = argparse.ArgumentParser(description="Crawl the gov.si domain")
+
+    parser.add_argument("--processes", type=int, default=8, help="number of crawler processes to start on this node")
+
+    parser.add_argument("--min-processes", type=int, default=None,
+                        help="the supervisor never stops crawler processes below this number (default --processes)")
+
+    parser.add_argument("--max-processes", type=int, default=None,
+                        help="the supervisor never starts crawler processes above this number (default --processes)")
+
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve the crawler metrics in the Prometheus text format on this port")
+
+    parser.add_argument("--recrawl", action="store_true",
+                        help="revisit crawled html pages when they are due, after the frontier is empty")
+
+    parser.add_argument("--hash-workers", type=int, default=None,
+                        help="hash worker processes of every crawler process (default the cores split between "
+                             "--max-processes)")
+
+    parser.add_argument("--join", action="store_true",
+                        help="join a crawl that is already running (e. g. on another node) instead of starting a new one")
+
+    arguments = parser.parse_args()
+
+    crawler = Crawler(arguments.processes, join_existing_crawl=arguments.join, min_processes=arguments.min_processes,
+                      max_processes=arguments.max_processes, metrics_port=arguments.metrics_port,
+                      recrawl=arguments.recrawl, hash_service_workers=arguments.hash_workers)
     crawler.run()
@@ -0,0 +1,333 @@
+import os
+import time
+
+# How often the supervisor measures the crawler processes and makes a scaling decision (seconds)
+SUPERVISOR_INTERVAL = 30
+
+# Do not start another crawler process if less than this fraction of the system memory would stay available
+MIN_AVAILABLE_MEMORY_RATIO = 0.15
+
+# Average time to claim a page from the frontier (seconds) above which the database is considered the bottleneck
+MAX_DATABASE_LATENCY = 0.5
+
+# Number of waiting frontier pages per crawler process needed before another process is started
+SCALE_UP_BACKLOG = 20
+
+# Minimum relative increase of pages per second after a scale up, otherwise scaling up is paused
+MIN_THROUGHPUT_GAIN = 0.05
+
+# Number of supervisor intervals in which no scale up is made after a scale up did not improve the throughput
+SCALE_UP_COOLDOWN = 10
+
+# Frontier pages are only counted up to this number, the exact number is not needed for the decisions
+MAX_COUNTED_FRONTIER_PAGES = 10000
+
+# A crashed crawler process is restarted after this delay, the delay doubles with every further crash (seconds)
+RESTART_BACKOFF = 30
+
+MAX_RESTART_BACKOFF = 3600
+
+# A process which crashes more times in a row is not restarted any more (e. g. chrome is missing)
+MAX_PROCESS_RESTARTS = 8
+
+# A process which ran for this long before it crashed starts counting its crashes again (seconds)
+STABLE_PROCESS_TIME = 600
+
+
+class Supervisor:
+    """
+        Watches the crawler processes of a Crawler: restarts the crashed ones and grows or shrinks their number within
+        [min_processes, max_processes] based on the measured throughput, memory of the browsers and database latency
+
+        The throughput and the stage latencies are taken from the metrics that the crawler processes send to the
+        metrics aggregator
+
+        Fetching and rendering are scaled together: a crawler process fetches a page and then renders the same page
+        with its own chrome driver, so there are no separate fetch or render workers whose numbers could differ. The
+        fetch and render latencies are logged with every decision, the memory of the browsers limits the growth
+    """
+
+    def __init__(self, crawler, database_handler, metrics_aggregator, min_processes, max_processes):
+        self.crawler = crawler
+
+        self.database_handler = database_handler
+
+        self.metrics_aggregator = metrics_aggregator
+
+        """
+            previous_totals holds the metric totals of the last measurement, the measurements are the differences
+        """
+        self.previous_totals = {}
+
+        self.min_processes = min_processes
+
+        self.max_processes = max_processes
+
+        self.last_measured_at = time.time()
+
+        self.last_decision = None
+
+        self.throughput_before_decision = None
+
+        self.cooldown = 0
+
+        """
+            restarts holds the number of crashes in a row of every process index, started_at the time when the index
+            was last (re)started and restart_at the time of its next restart
+        """
+        self.restarts = {}
+
+        self.started_at = {}
+
+        self.restart_at = {}
+
+        self.supervised_since = time.time()
+
+    def run(self):
+        while self.crawler.has_running_processes() or self.crawler.crashed_processes():
+            self.crawler.stop_event.wait(SUPERVISOR_INTERVAL)
+
+            if self.crawler.stop_event.is_set():
+                # Shutting down, the processes are only waited for
+                self.crawler.join_processes()
+
+                return
+
+            self.supervise()
+
+    def supervise(self):
+        self.restart_crashed_processes()
+
+        measurements = self.measure()
+
+        decision = self.decide(measurements)
+
+        print("[SUPERVISOR] {} | processes: {}, pages/s: {:.2f}, claim latency: {:.3f}s, fetch: {:.2f}s, render: {:.2f}s, "
+              "rss per process: {:.0f}MB, available memory: {:.0f}MB, frontier: {}".format(
+                  decision, measurements["processes"], measurements["pages_per_second"],
+                  measurements["claim_time"], measurements["fetch_time"], measurements["render_time"],
+                  measurements["rss_per_process"] / 2 ** 20, measurements["available_memory"] / 2 ** 20,
+                  measurements["frontier_pages"]))
+
+    """
+        Restart the crashed processes with an exponential backoff per index, an index which keeps crashing is given up
+    """
+
+    def restart_crashed_processes(self):
+        now = time.time()
+
+        for index in self.crawler.crashed_processes():
+            if index not in self.restart_at:
+                if now - self.started_at.get(index, self.supervised_since) >= STABLE_PROCESS_TIME:
+                    self.restarts[index] = 0
+
+                self.restarts[index] = self.restarts.get(index, 0) + 1
+
+                if self.restarts[index] > MAX_PROCESS_RESTARTS:
+                    print("[SUPERVISOR] [ERROR] Crawler process {} crashed {} times in a row, it is not restarted "
+                          "any more".format(index, MAX_PROCESS_RESTARTS + 1))
+
+                    self.crawler.fail_process(index)
+
+                    continue
+
+                delay = min(RESTART_BACKOFF * 2 ** (self.restarts[index] - 1), MAX_RESTART_BACKOFF)
+
+                self.restart_at[index] = now + delay
+
+                print("[SUPERVISOR] Crawler process {} crashed, restarting it in {}s (restart {} of {})".format(
+                    index, delay, self.restarts[index], MAX_PROCESS_RESTARTS))
+
+            if self.restart_at[index] <= now:
+                del self.restart_at[index]
+
+                self.started_at[index] = now
+
+                self.crawler.start_process(index)
+
+    """
+        Combine the metrics collected since the last measurement with the memory of the process trees (crawler process,
+        its chrome driver and browser, hash workers) and the size of the frontier
+    """
+
+    def measure(self):
+        self.metrics_aggregator.collect()
+
+        pages = self.metrics_aggregator.counter_total("crawler_pages_total")
+
+        mean_latencies = {}
+
+        for key, histogram_name in (("claim_time", "crawler_frontier_claim_seconds"),
+                                    ("fetch_time", "crawler_fetch_seconds"),
+                                    ("render_time", "crawler_render_seconds")):
+            count, total = self.metrics_aggregator.histogram_total(histogram_name)
+
+            previous_count, previous_total = self.previous_totals.get(key, (0, 0))
+
+            self.previous_totals[key] = (count, total)
+
+            mean_latencies[key] = (total - previous_total) / (count - previous_count) if count > previous_count else 0
+
+        new_pages = pages - self.previous_totals.get("pages", 0)
+
+        self.previous_totals["pages"] = pages
+
+        now = time.time()
+
+        elapsed = max(now - self.last_measured_at, 1)
+
+        self.last_measured_at = now
+
+        pids = self.crawler.running_process_ids()
+
+        process_tree_rss = get_process_trees_rss(pids)
+
+        measurements = {
+            "processes": len(pids),
+            "pages_per_second": new_pages / elapsed,
+            "rss_per_process": sum(process_tree_rss.values()) / len(pids) if pids else 0,
+            "available_memory": get_available_memory(),
+            "total_memory": get_total_memory(),
+            "frontier_pages": self.database_handler.count_frontier_pages(MAX_COUNTED_FRONTIER_PAGES)
+        }
+
+        measurements.update(mean_latencies)
+
+        return measurements
+
+    def decide(self, measurements):
+        processes = measurements["processes"]
+
+        if self.cooldown > 0:
+            self.cooldown -= 1
+
+        if self.last_decision == "grow" and self.throughput_before_decision is not None:
+            if measurements["pages_per_second"] < self.throughput_before_decision * (1 + MIN_THROUGHPUT_GAIN):
+                # The last process did not help, the bottleneck is not the number of processes
+                self.cooldown = SCALE_UP_COOLDOWN
+
+        self.last_decision = None
+
+        self.throughput_before_decision = measurements["pages_per_second"]
+
+        if processes > self.min_processes:
+            if measurements["available_memory"] < measurements["total_memory"] * MIN_AVAILABLE_MEMORY_RATIO:
+                self.crawler.retire_process()
+
+                self.last_decision = "shrink"
+
+                return "shrink: low on memory"
+
+            if measurements["claim_time"] > MAX_DATABASE_LATENCY:
+                self.crawler.retire_process()
+
+                self.last_decision = "shrink"
+
+                return "shrink: database latency too high"
+
+        # Crashed processes waiting for their restart still hold their index, the backoff would be undone otherwise
+        waiting_processes = len(self.restart_at)
+
+        if processes + waiting_processes + len(self.crawler.failed_processes) < self.min_processes:
+            self.crawler.start_process()
+
+            self.last_decision = "grow"
+
+            return "grow: below minimum processes"
+
+        if processes + waiting_processes >= self.max_processes:
+            return "hold: maximum processes reached"
+
+        if self.cooldown > 0:
+            return "hold: last scale up did not increase throughput"
+
+        if measurements["frontier_pages"] < SCALE_UP_BACKLOG * processes:
+            return "hold: not enough pages in frontier"
+
+        memory_after_growing = measurements["available_memory"] - measurements["rss_per_process"]
+
+        if memory_after_growing < measurements["total_memory"] * MIN_AVAILABLE_MEMORY_RATIO:
+            return "hold: not enough memory for another browser"
+
+        if measurements["claim_time"] > MAX_DATABASE_LATENCY / 2:
+            return "hold: database is getting slow"
+
+        self.crawler.start_process()
+
+        self.last_decision = "grow"
+
+        return "grow: frontier backlog with spare memory and database capacity"
+
+
+"""
+    Memory helpers, they read /proc directly so no extra packages are needed (on other systems they return 0)
+"""
+
+
+def read_meminfo(field):
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return 0
+
+
+def get_available_memory():
+    return read_meminfo("MemAvailable")
+
+
+def get_total_memory():
+    return read_meminfo("MemTotal")
+
+
+"""
+    Return the resident memory of every given process together with all of its descendants
+"""
+
+
+def get_process_trees_rss(pids):
+    children = {}
+
+    rss = {}
+
+    try:
+        process_ids = [int(entry) for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return {pid: 0 for pid in pids}
+
+    for process_id in process_ids:
+        try:
+            with open("/proc/{}/stat".format(process_id)) as stat_file:
+                # The name of the process is in brackets and can contain spaces
+                fields = stat_file.read().rsplit(")", 1)[1].split()
+
+            parent_id = int(fields[1])
+
+            # Resident set size is the 24th field of stat (in pages)
+            rss[process_id] = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+
+            children.setdefault(parent_id, []).append(process_id)
+        except (OSError, IndexError, ValueError):
+            continue
+
+    trees_rss = {}
+
+    for pid in pids:
+        total = 0
+
+        stack = [pid]
+
+        while stack:
+            process_id = stack.pop()
+
+            total += rss.get(process_id, 0)
+
+            stack.extend(children.get(process_id, []))
+
+        trees_rss[pid] = total
+
+    return trees_rss
@@ -0,0 +1,226 @@
+import binascii
+import re
+from urllib.parse import urlsplit, parse_qsl
+
+from metrics import metrics
+
+"""
+    Detects spider traps (calendars, faceted search, endless pagination, repeating path segments) in the links of the
+    crawled pages before they are added to the frontier
+
+    Every url is reduced to its template: numbers, dates and ids in the path are replaced by placeholders and only the
+    names of the query parameters are kept, e. g. /koledar/2019/05?dan=3&view=m is /koledar/{n}/{n}?dan&view. Statistics
+    are kept per site and template, a template is blocked when it has too many distinct urls, when a query parameter
+    takes too many values or when most of its crawled pages are (near) duplicates. Urls which are too deep or repeat
+    their path segments are rejected on their own
+
+    Every blocked template is printed once with [TRAP DETECTOR], the rejected urls are counted by reason
+"""
+
+# Urls with more path segments are rejected
+MAX_PATH_DEPTH = 12
+
+# Urls repeating one path segment more times are rejected (e. g. /a/b/a/b/a/b)
+MAX_REPEATED_SEGMENTS = 3
+
+# A template is blocked when it has more distinct urls (large sites have this many articles of one template)
+MAX_TEMPLATE_URLS = 10000
+
+# A query parameter of a template is blocked when it takes more distinct values (e. g. a date of a calendar). The only
+# parameter of a template with an id value (e. g. /novice?id=123) addresses the pages like a path, for it only the
+# MAX_TEMPLATE_URLS limit of the template applies
+MAX_PARAMETER_VALUES = 200
+
+# The duplicate rate of a template is only checked after this many of its pages were crawled
+MIN_CRAWLED_TEMPLATE_PAGES = 20
+
+# A template is blocked when this fraction of its crawled pages are duplicates
+MAX_DUPLICATE_RATE = 0.8
+
+# Templates tracked per site, the urls of new templates are not checked when there are more
+MAX_SITE_TEMPLATES = 5000
+
+# Reasons for rejecting a url
+TRAP_DEPTH = "depth"
+TRAP_REPEATED_SEGMENT = "repeated_segment"
+TRAP_TEMPLATE_URLS = "template_urls"
+TRAP_PARAMETER_VALUES = "parameter_values"
+TRAP_DUPLICATE_CONTENT = "duplicate_content"
+
+NUMBER_PATTERN = re.compile(r"\d+")
+
+ID_VALUE_PATTERN = re.compile(r"^\d+$")
+
+# Hexadecimal ids, uuids and other long tokens with digits
+ID_PATTERN = re.compile(r"^(?=.*\d)[0-9a-f-]{16,}$|^(?=.*\d)(?=.*[a-z])[\w-]{24,}$", re.IGNORECASE)
+
+
+def url_hash(text):
+    return binascii.crc32(text.encode("utf-8", "surrogatepass")) & 0xffffffff
+
+
+def path_segment_template(segment):
+    if ID_PATTERN.match(segment):
+        return "{id}"
+
+    return NUMBER_PATTERN.sub("{n}", segment)
+
+
+"""
+    Host, path segments and query parameters (name, value) of the url and its template
+"""
+
+
+def split_url(url):
+    parts = urlsplit(url)
+
+    segments = [segment for segment in parts.path.split("/") if segment]
+
+    parameters = parse_qsl(parts.query, keep_blank_values=True)
+
+    template = "/" + "/".join(path_segment_template(segment) for segment in segments)
+
+    if parameters:
+        template += "?" + "&".join(sorted({name for name, value in parameters}))
+
+    return parts.netloc, segments, parameters, template
+
+
+"""
+    Parameters whose number of values is limited, all of them except the only parameter of a url when its value is an id
+"""
+
+
+def capped_parameters(parameters):
+    if len(parameters) == 1 and (ID_VALUE_PATTERN.match(parameters[0][1]) or ID_PATTERN.match(parameters[0][1])):
+        return []
+
+    return parameters
+
+
+class TemplateStatistics:
+    def __init__(self):
+        # Hashes of the distinct urls of the template (at most MAX_TEMPLATE_URLS)
+        self.url_hashes = set()
+
+        # Hashes of the distinct values of every query parameter (at most MAX_PARAMETER_VALUES)
+        self.parameter_values = {}
+
+        self.crawled_pages = 0
+
+        self.duplicate_pages = 0
+
+        # The reason the template is blocked, None while it is not
+        self.blocked = None
+
+
+class TrapDetector:
+    def __init__(self):
+        # host -> template -> TemplateStatistics
+        self.sites = {}
+
+    """
+        The reason the url is a trap or None when it can be added to the frontier, the url is added to the statistics
+        of its template
+    """
+
+    def check(self, url):
+        host, segments, parameters, template = split_url(url)
+
+        if len(segments) > MAX_PATH_DEPTH:
+            return self.reject(TRAP_DEPTH)
+
+        segment_counts = {}
+
+        for segment in segments:
+            segment_counts[segment] = segment_counts.get(segment, 0) + 1
+
+            if segment_counts[segment] > MAX_REPEATED_SEGMENTS:
+                return self.reject(TRAP_REPEATED_SEGMENT)
+
+        statistics = self.template_statistics(host, template)
+
+        if statistics is None:
+            return None
+
+        hash_of_url = url_hash(url)
+
+        if hash_of_url in statistics.url_hashes:
+            # Already known, it is in the frontier
+            return None
+
+        if statistics.blocked is not None:
+            return self.reject(statistics.blocked)
+
+        for name, value in capped_parameters(parameters):
+            values = statistics.parameter_values.setdefault(name, set())
+
+            hash_of_value = url_hash(value)
+
+            if hash_of_value not in values:
+                if len(values) >= MAX_PARAMETER_VALUES:
+                    return self.block(host, template, statistics,
+                                      "{} (parameter {})".format(TRAP_PARAMETER_VALUES, name), TRAP_PARAMETER_VALUES)
+
+                values.add(hash_of_value)
+
+        if len(statistics.url_hashes) >= MAX_TEMPLATE_URLS:
+            return self.block(host, template, statistics, TRAP_TEMPLATE_URLS, TRAP_TEMPLATE_URLS)
+
+        statistics.url_hashes.add(hash_of_url)
+
+        return None
+
+    """
+        Count a crawled page of the template of the url, templates whose pages are mostly duplicates are blocked
+    """
+
+    def record_page(self, url, is_duplicate):
+        host, segments, parameters, template = split_url(url)
+
+        statistics = self.template_statistics(host, template)
+
+        if statistics is None or statistics.blocked is not None:
+            return
+
+        statistics.crawled_pages += 1
+
+        if is_duplicate:
+            statistics.duplicate_pages += 1
+
+        if statistics.crawled_pages >= MIN_CRAWLED_TEMPLATE_PAGES and \
+                statistics.duplicate_pages >= MAX_DUPLICATE_RATE * statistics.crawled_pages:
+            self.block(host, template, statistics, "{} ({} of {} pages)".format(
+                TRAP_DUPLICATE_CONTENT, statistics.duplicate_pages, statistics.crawled_pages), TRAP_DUPLICATE_CONTENT)
+
+    def template_statistics(self, host, template):
+        templates = self.sites.setdefault(host, {})
+
+        statistics = templates.get(template)
+
+        if statistics is None:
+            if len(templates) >= MAX_SITE_TEMPLATES:
+                return None
+
+            statistics = templates[template] = TemplateStatistics()
+
+        return statistics
+
+    def block(self, host, template, statistics, description, reason):
+        statistics.blocked = reason
+
+        # The urls are only needed while the template is open
+        statistics.url_hashes = set()
+
+        statistics.parameter_values = {}
+
+        print("[TRAP DETECTOR] Blocked urls {}{}: {}".format(host, template, description))
+
+        metrics.increment("crawler_trap_templates_total", reason=reason)
+
+        return self.reject(reason)
+
+    def reject(self, reason):
+        metrics.increment("crawler_trap_urls_total", reason=reason)
+
+        return reason
@@ -1,24 +1,86 @@
 // http://blog.thomsonreuters.com/index.php/mobile-patent-suits-graphic-of-the-day/
+
+let width = 1920,
+    height = 1080;
+
+// tooltip
+let tooltip = d3.select("body")
+    .append("div")
+    .attr("class", "tooltip")
+    .style("position", "absolute")
+    .style("z-index", "10")
+    .style("visibility", "hidden");
+
+let force = null;
+
+// data.json only holds the sites and the links between them, the links of a site are loaded when the site is clicked
+let summary = null;
+
 d3.json("data.json", function(error, root) {
+    if (error) throw error;
+
+    summary = root;
 
-    let links = root.links;
+    showSites();
+});
+
+d3.select("button#back").on("click", showSites);
+
+function showSites() {
+    if (!summary) return;
 
     let nodes = {};
 
-    // Compute the distinct nodes from the links.
-    links.forEach(function(link) {
-      link.source = nodes[link.source] || (nodes[link.source] = {name: link.source});
-      link.target = nodes[link.target] || (nodes[link.target] = {name: link.target});
+    summary.nodes.forEach(function(site) {
+        nodes[site.id] = {
+            name: site.name,
+            file: site.file,
+            radius: 5 + Math.sqrt(site.pages),
+            description: site.pages + " strani, vhodne povezave: " + site.in_degree + ", izhodne povezave: " +
+                site.out_degree
+        };
+    });
+
+    let links = summary.links.map(function(link) {
+        return {source: nodes[link.source], target: nodes[link.target], weight: link.weight, type: ""};
     });
 
-    let width = 1920,
-        height = 1080;
+    draw(d3.values(nodes), links, true);
+}
+
+function showSite(site) {
+    d3.json(site.file, function(error, root) {
+        if (error) throw error;
+
+        let nodes = {};
 
-    let force = d3.layout.force()
-        .nodes(d3.values(nodes))
+        // Compute the distinct nodes from the links.
+        root.links.forEach(function(link) {
+          link.source = nodes[link.source] || (nodes[link.source] = {name: link.source, inDegree: link.source_in_degree});
+          link.target = nodes[link.target] || (nodes[link.target] = {name: link.target, inDegree: link.target_in_degree});
+        });
+
+        d3.values(nodes).forEach(function(node) {
+            node.radius = 4 + Math.sqrt(node.inDegree);
+            node.description = "Vhodne povezave: " + node.inDegree;
+        });
+
+        draw(d3.values(nodes), root.links, false);
+    });
+}
+
+function draw(nodes, links, sites) {
+    if (force) force.stop();
+
+    d3.select("div#network").selectAll("svg").remove();
+
+    d3.select("button#back").style("visibility", sites ? "hidden" : "visible");
+
+    force = d3.layout.force()
+        .nodes(nodes)
         .links(links)
         .size([width, height])
-        .linkDistance(300)
+        .linkDistance(sites ? 200 : 300)
         .charge(-100)
         .on("tick", tick)
         .start();
@@ -41,33 +103,31 @@ d3.json("data.json", function(error, root) {
       .append("path")
         .attr("d", "M0,-5L10,0L0,5");
 
-	// tooltip
-	let tooltip = d3.select("body")
-		.append("div")
-		.attr("class", "tooltip")
-		.style("position", "absolute")
-		.style("z-index", "10")
-		.style("visibility", "hidden");
-
     let path = svg.append("g").selectAll("path")
         .data(force.links())
       .enter().append("path")
         .attr("class", function(d) { return "link " + d.type; })
+        .style("stroke-width", function(d) { return sites ? Math.min(1 + Math.log(d.weight), 8) : null; })
         .attr("marker-end", function(d) { return "url(#" + d.type + ")"; });
 
     let circle = svg.append("g").selectAll("circle")
         .data(force.nodes())
       .enter().append("circle")
-        .attr("r", 10)
-        .style("fill", 'hsl(174, 100%, 27%)')
+        .attr("r", function(d) { return d.radius; })
+        .style("fill", sites ? 'hsl(228, 30%, 40%)' : 'hsl(174, 100%, 27%)')
 		.on("mouseover", function (d) {
 			tooltip.html(
-				"<p>" + d.name + "</p>"
+				"<p>" + d.name + "</p>" +
+				"<p>" + d.description + "</p>"
 			)
 			tooltip.style("visibility", "visible");
 		})
 		.on("mousemove", function(){return tooltip.style("top", (event.pageY-10)+"px").style("left",(event.pageX+10)+"px");})
 		.on("mouseout", function(){return tooltip.style("visibility", "hidden");})
+		.on("click", function (d) {
+			// Sites are opened on click, a drag does not open the site
+			if (d.file && !d3.event.defaultPrevented) showSite(d);
+		})
 		.on("contextmenu", function (d, i) {
 			d3.event.preventDefault();
 			d3.event.stopPropagation();
@@ -76,18 +136,10 @@ d3.json("data.json", function(error, root) {
 		})
         .call(force.drag);
 
-/*    let text = svg.append("g").selectAll("text")
-        .data(force.nodes())
-      .enter().append("text")
-        .attr("x", 8)
-        .attr("y", ".31em")
-        .text(function(d) { return d.name; });*/
-
     // Use elliptical arc path segments to doubly-encode directionality.
     function tick() {
       path.attr("d", linkArc);
       circle.attr("transform", transform);
-      //text.attr("transform", transform);
     }
 
     function linkArc(d) {
@@ -100,7 +152,7 @@ d3.json("data.json", function(error, root) {
     function transform(d) {
       return "translate(" + d.x + "," + d.y + ")";
     }
-});
+}
 
 function getRandomColor() {
     return "#"+((1<<24)*Math.random()|0).toString(16);
@@ -12,10 +12,49 @@ let pack = d3.pack()
 	.size([diameter - margin, diameter - margin])
 	.padding(2);
 
+// tooltip
+let tooltip = d3.select("body")
+	.append("div")
+	.attr("class", "tooltip")
+	.style("position", "absolute")
+	.style("z-index", "10")
+	.style("visibility", "hidden");
+
+// data.json only holds the sites, the pages of a site are loaded from its file when the site is clicked
+let summary = null;
+
 d3.json("data.json", function(error, root) {
 	if (error) throw error;
 
-	root = d3.hierarchy(root)
+	summary = root;
+
+	render(summary);
+});
+
+d3.select("button#back").on("click", function() {
+	if (summary) render(summary);
+});
+
+function openSite(site) {
+	d3.json(site.file, function(error, root) {
+		if (error) throw error;
+
+		render(root);
+	});
+}
+
+function pageTypesDescription(types) {
+	if (!types) return "";
+
+	return Object.keys(types).map(function(type) { return type + ": " + types[type]; }).join(", ");
+}
+
+function render(data) {
+	g.selectAll("*").remove();
+
+	d3.select("button#back").style("visibility", data === summary ? "hidden" : "visible");
+
+	let root = d3.hierarchy(data)
 		.sum(function(d) { return d.size; })
 		.sort(function(a, b) { return b.value - a.value; });
 
@@ -23,15 +62,6 @@ d3.json("data.json", function(error, root) {
 		nodes = pack(root).descendants(),
 		view;
 
-	// tooltip
-	let tooltip = d3.select("body")
-		.append("div")
-		.attr("class", "tooltip")
-		.style("position", "absolute")
-		.style("z-index", "10")
-		.style("visibility", "hidden");
-
-
 	// define circle to present site/page
 	let circle = g.selectAll("circle")
 		.data(nodes)
@@ -43,28 +73,44 @@ d3.json("data.json", function(error, root) {
 				if (d.data.type === 'DISALLOWED') return 'hsl(0, 0%, 74%)';
 				else if (d.data.type === 'ERROR') return 'hsl(0, 73%, 77%)';
 				else if (d.data.type === 'DUPLICATE') return 'hsl(54, 100%, 88%)';
+				else if (d.data.type === 'MORE') return 'hsl(0, 0%, 92%)';
 
 			}
 
+			// Sites of the summary are drawn like groups, their pages are loaded on click
+			if (d.data.file) return color(1);
+
 			return d.children ? color(d.depth) : null; })
 
 		.on("mouseover", function (d) {
 			let pageType = d.data.type ? d.data.type : "";
 
+			let details = d.data.file ? d.data.pages + " strani (" + pageTypesDescription(d.data.types) + ")" : "";
+
+			if (d.data.in_degree !== undefined) details = "Vhodne povezave: " + d.data.in_degree;
+
+			if (d.data.page_rank) details += ", PageRank: " + d.data.page_rank.toExponential(2);
+
 			tooltip.html(
 				"<p>" + d.data.name + "</p>" +
-				"<p class='bold'>" + pageType + "</p>"
+				"<p class='bold'>" + pageType + "</p>" +
+				"<p>" + details + "</p>"
 			)
 			tooltip.style("visibility", "visible");
 		})
 		.on("mousemove", function(){return tooltip.style("top", (event.pageY-10)+"px").style("left",(event.pageX+10)+"px");})
 		.on("mouseout", function(){return tooltip.style("visibility", "hidden");})
-		.on("click", function(d) { if (focus !== d) zoom(d), d3.event.stopPropagation(); })
+		.on("click", function(d) {
+			d3.event.stopPropagation();
+
+			if (d.data.file) openSite(d.data);
+			else if (focus !== d) zoom(d);
+		})
 		.on("contextmenu", function (d, i) {
 			d3.event.preventDefault();
 			d3.event.stopPropagation();
 			// react on right-clicking
-			window.open(d.data.name, '_blank')
+			if (d.data.type !== 'MORE') window.open(d.data.name, '_blank')
 		});
 
 	// text on circle
@@ -106,4 +152,4 @@ d3.json("data.json", function(error, root) {
 		node.attr("transform", function(d) { return "translate(" + (d.x - v[0]) * k + "," + (d.y - v[1]) * k + ")"; });
 		circle.attr("r", function(d) { return d.r * k; });
 	}
-});
\ No newline at end of file
+}